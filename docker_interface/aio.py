@@ -0,0 +1,166 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from .session import read_container_id
+
+
+class AsyncRun:
+    """
+    Execution of a prepared invocation on an asyncio event loop.
+
+    Use :meth:`Session.start_async` to create an execution. The output of the container can be
+    consumed line by line using `async for stream, line in execution` if the execution was started
+    with `capture=True`; otherwise it is inherited from the current process. At most
+    :code:`MAX_QUEUED_LINES` lines are buffered so captured output must be consumed while the
+    commands execute.
+
+    Parameters
+    ----------
+    session : Session
+        session that prepared the invocation
+    preparation : Preparation
+        prepared invocation
+    capture : bool
+        whether to capture the output of the commands
+    semaphore : asyncio.Semaphore or None
+        semaphore limiting the number of concurrent executions (acquired by :meth:`start`)
+    """
+    MAX_QUEUED_LINES = 1000
+
+    def __init__(self, session, preparation, capture=False, semaphore=None):
+        self.logger = logging.getLogger('di')
+        self.session = session
+        self.preparation = preparation
+        self.capture = capture
+        self.semaphore = semaphore
+        self.process = None
+        self.result = None
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._cidfile = os.path.join(self._tempdir.name, 'cid')
+        self._queue = asyncio.Queue(self.MAX_QUEUED_LINES) if capture else None
+        self._task = None
+
+    async def start(self):
+        """
+        Wait for a free slot and start executing the commands.
+        """
+        if self.semaphore is not None:
+            await self.semaphore.acquire()
+        self._task = asyncio.ensure_future(self._execute())
+
+    async def _pump(self, name, reader):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            await self._queue.put((name, line.decode(errors='replace')))
+
+    async def _execute(self):
+        dry_run = self.preparation.configuration['dry-run']
+        status = 0
+        setup_time = container_time = None
+        cidfile = None if dry_run else self._cidfile
+        finishing = False
+        try:
+            await asyncio.get_event_loop().run_in_executor(
+                None, self.preparation.resolve_image_id)
+            for plugin, parts in self.preparation.iter_commands(cidfile):
+                if dry_run:
+                    status = plugin.execute_command(parts, dry_run)
+                    continue
+                self.logger.debug("executing command '%s'", " ".join(map(str, parts)))
+                pipe = asyncio.subprocess.PIPE if self.capture else None
+                started = time.time()
+                self.process = await asyncio.create_subprocess_exec(*parts, stdout=pipe,
+                                                                    stderr=pipe)
+                if self.capture:
+                    await asyncio.gather(self._pump('stdout', self.process.stdout),
+                                         self._pump('stderr', self.process.stderr))
+                status = await self.process.wait()
+                setup_time = started - self.preparation.started
+                container_time = time.time() - started
+                if status:
+                    self.logger.warning("command '%s' returned status code %d",
+                                        " ".join(map(str, parts)), status)
+                    break
+            container_id = read_container_id(self._cidfile)
+            # Plugins may block while releasing their resources and the history is written to disk
+            finishing = True
+            self.result = await asyncio.get_event_loop().run_in_executor(
+                None, self.session.finish, self.preparation, status, setup_time, container_time,
+                container_id)
+            return self.result
+        finally:
+            # The preparation is cleaned up by `finish` once it has started
+            if self.result is None and not finishing:
+                self.preparation.cleanup()
+            if self._queue is not None:
+                await self._queue.put(None)
+            if self.semaphore is not None:
+                self.semaphore.release()
+            self._tempdir.cleanup()
+
+    def __aiter__(self):
+        return self._iter_output()
+
+    async def _iter_output(self):
+        if self._queue is None:
+            raise RuntimeError("output is only available if the execution captures it")
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                break
+            yield item
+
+    async def wait(self):
+        """
+        Wait for the commands to complete.
+
+        Cancelling the wait stops the container.
+
+        Returns
+        -------
+        result : Result
+            result of the command
+        """
+        try:
+            return await asyncio.shield(self._task)
+        except asyncio.CancelledError:
+            await self.cancel()
+            raise
+
+    async def cancel(self):
+        """
+        Stop the container and wait for the commands to terminate.
+        """
+        container_id = read_container_id(self._cidfile)
+        if container_id:
+            docker = self.preparation.configuration['docker'].split()
+            process = await asyncio.create_subprocess_exec(
+                *docker, 'kill', container_id, stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL)
+            await process.wait()
+        elif self.process is not None and self.process.returncode is None:
+            # The docker CLI forwards signals to the container if it has not reported its id yet
+            self.process.terminate()
+        try:
+            await self._task
+        except Exception as ex:  # pylint: disable=broad-except
+            self.logger.warning("failed to stop the container: %s", ex)
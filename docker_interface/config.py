@@ -0,0 +1,245 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import hashlib
+import json
+import logging
+import os
+
+
+LOGGER = logging.getLogger(__name__)
+# Resolved configuration files keyed by absolute path
+CACHE = {}
+
+
+def merge_configurations(base, overlay):
+    """
+    Merge an overlay into a base configuration.
+
+    Dictionaries are merged recursively and other values of the overlay replace those of the base.
+    The lists of keys with a `+` suffix in the overlay are appended to the lists of the base (e.g.
+    `mount+: [...]` adds mounts), and keys whose value is `null` in the overlay are removed if the
+    base defines them. Other `null` values are kept because they are meaningful, e.g. `null` in
+    `run/env` forwards an environment variable of the host.
+
+    Parameters
+    ----------
+    base : dict
+        base configuration
+    overlay : dict
+        configuration that takes precedence
+
+    Returns
+    -------
+    merged : dict
+        merged configuration (neither `base` nor `overlay` are modified)
+
+    Raises
+    ------
+    ValueError
+        if a value with a `+` suffix or the value it is appended to is not a list
+    """
+    merged = dict(base)
+    for key, value in overlay.items():
+        if key.endswith('+'):
+            key = key[:-1]
+            existing = merged.get(key, [])
+            if not isinstance(value, list) or not isinstance(existing, list):
+                raise ValueError("cannot append to '%s' because it is not a list" % key)
+            merged[key] = existing + copy.deepcopy(value)
+        elif value is None and merged.get(key) is not None:
+            merged.pop(key)
+        elif isinstance(value, dict):
+            # Merge into an empty dictionary if there is nothing to merge into so nested `+` and
+            # `null` keys are applied
+            existing = merged.get(key)
+            merged[key] = merge_configurations(
+                existing if isinstance(existing, dict) else {}, value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def get_stamp(path):
+    """
+    Get a stamp that changes whenever a file changes.
+
+    Parameters
+    ----------
+    path : str
+        path of the file
+
+    Returns
+    -------
+    stamp : list
+        path, size, and modification time of the file
+    """
+    stat = os.stat(path)
+    return [path, stat.st_size, stat.st_mtime_ns]
+
+
+def is_valid(entry):
+    """
+    Check whether none of the files a cached configuration was resolved from have changed.
+
+    Parameters
+    ----------
+    entry : dict
+        cache entry with keys `inputs` (stamps of the files) and `configuration`
+
+    Returns
+    -------
+    valid : bool
+        whether the cached configuration is valid
+    """
+    try:
+        return all(get_stamp(stamp[0]) == stamp for stamp in entry['inputs'])
+    except OSError:
+        return False
+
+
+def read_file(path):
+    """
+    Parse a configuration file.
+
+    Parameters
+    ----------
+    path : str
+        path of a YAML or JSON file
+
+    Returns
+    -------
+    configuration : dict
+        configuration with `workspace` made absolute if it is given
+    """
+    import yaml
+    with open(path) as fp:  # pylint: disable=invalid-name
+        configuration = yaml.safe_load(fp) or {}
+    if not isinstance(configuration, dict):
+        raise ValueError("configuration file '%s' does not contain a mapping" % path)
+    LOGGER.debug("parsed configuration file '%s'", path)
+    # The workspace is relative to the file that defines it
+    if 'workspace' in configuration:
+        configuration['workspace'] = os.path.join(os.path.dirname(path),
+                                                  configuration['workspace'])
+    return configuration
+
+
+def resolve_file(path, cache_dir=None, stack=None):
+    """
+    Resolve a configuration file and the files it extends.
+
+    The files listed in the `extends` key (relative to the directory of the file) are resolved and
+    merged in order using :func:`merge_configurations` before the file itself is merged on top.
+    Resolved files are cached in memory and in `cache_dir` so that files shared by many
+    configurations are only parsed once.
+
+    Parameters
+    ----------
+    path : str
+        path of the file
+    cache_dir : str or None
+        directory to cache resolved files in or `None` to only cache them in memory
+    stack : list[str] or None
+        files that are being resolved and extend the file (used to detect cycles)
+
+    Returns
+    -------
+    entry : dict
+        entry with keys `inputs` (stamps of the files the configuration was resolved from in order)
+        and `configuration` (resolved configuration which must not be modified)
+    """
+    path = os.path.abspath(path)
+    stack = stack or []
+    if path in stack:
+        raise ValueError("configuration files extend each other: %s" %
+                         " -> ".join(stack + [path]))
+
+    entry = CACHE.get(path)
+    if entry and is_valid(entry):
+        return entry
+    filename = None
+    if cache_dir:
+        filename = os.path.join(cache_dir, '%s.json' % hashlib.sha1(path.encode()).hexdigest())
+        try:
+            with open(filename) as fp:  # pylint: disable=invalid-name
+                entry = json.load(fp)
+            if is_valid(entry):
+                CACHE[path] = entry
+                return entry
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    stamp = get_stamp(path)
+    layer = read_file(path)
+    extends = layer.pop('extends', [])
+    if isinstance(extends, str):
+        extends = [extends]
+    configuration = {}
+    inputs = []
+    for base in extends:
+        base = resolve_file(os.path.join(os.path.dirname(path), base), cache_dir, stack + [path])
+        configuration = merge_configurations(configuration, base['configuration'])
+        inputs.extend(stamp for stamp in base['inputs'] if stamp not in inputs)
+    entry = {
+        'inputs': inputs + [stamp],
+        'configuration': merge_configurations(configuration, layer),
+    }
+    CACHE[path] = entry
+
+    # Write the cache atomically because other invocations may read it concurrently
+    if filename:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            temp = '%s.%d' % (filename, os.getpid())
+            with open(temp, 'w') as fp:  # pylint: disable=invalid-name
+                json.dump(entry, fp)
+            os.replace(temp, filename)
+        except (OSError, TypeError, ValueError) as ex:
+            LOGGER.debug("could not cache configuration file '%s': %s", path, ex)
+    return entry
+
+
+def load_configuration(filenames, cache_dir=None):
+    """
+    Load a configuration from one or more files.
+
+    Each file is resolved using :func:`resolve_file`, and later files are merged on top of earlier
+    ones using :func:`merge_configurations`. The workspace defaults to the directory of the first
+    file.
+
+    Parameters
+    ----------
+    filenames : str or list[str]
+        paths of the files
+    cache_dir : str or None
+        directory to cache resolved files in or `None` to only cache them in memory
+
+    Returns
+    -------
+    configuration : dict
+        configuration with `config-files` set to all files the configuration was loaded from
+    """
+    if isinstance(filenames, str):
+        filenames = [filenames]
+    configuration = {}
+    inputs = []
+    for filename in filenames:
+        entry = resolve_file(filename, cache_dir)
+        configuration = merge_configurations(configuration, entry['configuration'])
+        inputs.extend(stamp[0] for stamp in entry['inputs'] if stamp[0] not in inputs)
+    configuration.setdefault('workspace', os.path.dirname(os.path.abspath(filenames[0])))
+    configuration['config-files'] = inputs
+    return configuration
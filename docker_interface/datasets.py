@@ -0,0 +1,400 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import concurrent.futures
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+from . import usage
+
+
+LOGGER = logging.getLogger(__name__)
+TEMPORARY_SUFFIX = '.di-partial'
+
+
+def get_key(source):
+    """
+    Get the key of a dataset in the cache.
+
+    Parameters
+    ----------
+    source : str
+        path of the dataset
+
+    Returns
+    -------
+    key : str
+        key derived from the resolved path of the dataset
+    """
+    return hashlib.sha256(os.path.realpath(source).encode()).hexdigest()[:16]
+
+
+def get_manifest(source):
+    """
+    Get the size and modification time of the files of a dataset.
+
+    Parameters
+    ----------
+    source : str
+        path of a file or directory
+
+    Returns
+    -------
+    manifest : dict
+        mapping from paths relative to the parent of `source` if it is a file or `source` itself if
+        it is a directory to `[size, mtime_ns]` with directories mapped to `None`
+    """
+    if os.path.isfile(source):
+        stat = os.stat(source)
+        return {os.path.basename(source): [stat.st_size, stat.st_mtime_ns]}
+    if not os.path.isdir(source):
+        raise ValueError("dataset '%s' does not exist" % source)
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(source):
+        relpath = os.path.relpath(dirpath, source)
+        for dirname in dirnames:
+            manifest[os.path.normpath(os.path.join(relpath, dirname))] = None
+        for filename in filenames:
+            stat = os.stat(os.path.join(dirpath, filename))
+            manifest[os.path.normpath(os.path.join(relpath, filename))] = \
+                [stat.st_size, stat.st_mtime_ns]
+    return manifest
+
+
+def copy_file(source, destination, link=False):
+    """
+    Copy or hardlink a file, replacing the destination atomically.
+
+    Parameters
+    ----------
+    source : str
+        path of the file to copy
+    destination : str
+        path of the copy
+    link : bool
+        whether to hardlink the file (falling back to copying if the source is on a different
+        file system)
+
+    Returns
+    -------
+    linked : bool
+        whether the file was hardlinked
+    """
+    temporary = destination + TEMPORARY_SUFFIX
+    if os.path.lexists(temporary):
+        os.unlink(temporary)
+    linked = False
+    if link:
+        try:
+            os.link(source, temporary)
+            linked = True
+        except OSError:
+            pass
+    if not linked:
+        shutil.copy2(source, temporary)
+    os.replace(temporary, destination)
+    return linked
+
+
+class Dataset:
+    """
+    Copy of a dataset in a host-local cache.
+
+    Each dataset occupies the directory `<root>/<key>` which holds the copied files in `data` and
+    a manifest recording the size and modification time of each file when it was copied. Files are
+    replaced atomically so containers that use the dataset while it is updated see either the old
+    or the new version of each file. Lock files in `<root>/locks` ensure that concurrent runs share
+    a single fill and that datasets are not evicted while containers use them.
+
+    Parameters
+    ----------
+    root : str
+        directory of the cache
+    source : str or None
+        path of the dataset (may be omitted if `key` is given)
+    key : str or None
+        key of the dataset (defaults to :func:`get_key` of `source`)
+    """
+    def __init__(self, root, source, key=None):
+        self.root = root
+        self.source = os.path.abspath(source) if source else None
+        self.key = key or get_key(source)
+        self.directory = os.path.join(root, self.key)
+        self.locks = {}
+
+    @property
+    def path(self):
+        """
+        str : path of the copy of the dataset
+        """
+        data = os.path.join(self.directory, 'data')
+        if os.path.isfile(self.source):
+            return os.path.join(data, os.path.basename(self.source))
+        return data
+
+    def acquire(self, name, exclusive=False, blocking=True):
+        """
+        Acquire a lock of the dataset.
+
+        Parameters
+        ----------
+        name : str
+            name of the lock (`fill` is held exclusively while the cache is filled and `use` is
+            held shared while containers use the dataset)
+        exclusive : bool
+            whether to acquire an exclusive rather than a shared lock
+        blocking : bool
+            whether to wait for the lock
+
+        Returns
+        -------
+        acquired : bool
+            whether the lock was acquired
+        """
+        if name not in self.locks:
+            path = os.path.join(self.root, 'locks', '%s.%s' % (self.key, name))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.locks[name] = open(path, 'a')
+        operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        try:
+            fcntl.flock(self.locks[name], operation | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+
+    def release(self, name=None):
+        """
+        Release a lock of the dataset.
+
+        Parameters
+        ----------
+        name : str or None
+            name of the lock to release or `None` to release all locks
+        """
+        for key in [name] if name else list(self.locks):
+            lock = self.locks.pop(key, None)
+            if lock is not None:
+                lock.close()
+
+    def load_manifest(self):
+        """
+        Load the manifest of the copy of the dataset.
+
+        Returns
+        -------
+        manifest : dict
+            manifest with keys `source`, `files` (see :func:`get_manifest` with an additional
+            element indicating whether each file was hardlinked), and `last_used`
+        """
+        try:
+            with open(os.path.join(self.directory, 'manifest.json')) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {'source': self.source, 'files': {}, 'last_used': None}
+
+    def save_manifest(self, manifest):
+        """
+        Save the manifest of the copy of the dataset.
+
+        Parameters
+        ----------
+        manifest : dict
+            manifest to save
+        """
+        path = os.path.join(self.directory, 'manifest.json')
+        with open(path + TEMPORARY_SUFFIX, 'w') as fp:
+            json.dump(manifest, fp)
+        os.replace(path + TEMPORARY_SUFFIX, path)
+
+    def fill(self, manifest=None, link=False, workers=8):
+        """
+        Copy files of the dataset that are missing or have changed since they were last copied
+        and remove files that no longer exist.
+
+        Runs that fill the same dataset concurrently wait for each other so the second run only
+        copies files that changed after the first run started.
+
+        Parameters
+        ----------
+        manifest : dict or None
+            manifest of the source (see :func:`get_manifest`)
+        link : bool
+            whether to hardlink rather than copy files
+        workers : int
+            number of files to copy in parallel
+
+        Returns
+        -------
+        stats : dict
+            number of `copied`, `linked`, and `removed` files and `bytes` copied
+        """
+        if manifest is None:
+            manifest = get_manifest(self.source)
+        if not self.acquire('fill', exclusive=True, blocking=False):
+            LOGGER.info("waiting for another run to fill the cache for dataset '%s'", self.source)
+            self.acquire('fill', exclusive=True)
+        try:
+            return self._fill(manifest, link, workers)
+        finally:
+            self.release('fill')
+
+    def _fill(self, manifest, link, workers):
+        cached = self.load_manifest()
+        cached['last_used'] = time.time()
+        files = cached['files']
+        if os.path.isfile(self.source):
+            base, source = os.path.dirname(self.path), os.path.dirname(self.source)
+        else:
+            base, source = self.path, self.source
+        stats = {'copied': 0, 'linked': 0, 'removed': 0, 'bytes': 0}
+
+        # Remove files that no longer exist or whose type changed in reverse order so the contents
+        # of directories are removed before the directories themselves
+        for relpath in sorted(files, reverse=True):
+            value = manifest.get(relpath, False)
+            if value is not False and (value is None) == (files[relpath] is None):
+                continue
+            path = os.path.join(base, relpath)
+            if files[relpath] is None:
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.lexists(path):
+                os.unlink(path)
+            del files[relpath]
+            stats['removed'] += 1
+
+        os.makedirs(base, exist_ok=True)
+        pending = []
+        for relpath, value in sorted(manifest.items()):
+            if value is None:
+                os.makedirs(os.path.join(base, relpath), exist_ok=True)
+                files[relpath] = None
+            elif files.get(relpath) is None or files[relpath][:2] != value:
+                pending.append(relpath)
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max(workers, 1)) as executor:
+                futures = {
+                    executor.submit(copy_file, os.path.join(source, relpath),
+                                    os.path.join(base, relpath), link): relpath
+                    for relpath in pending
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    relpath = futures[future]
+                    linked = future.result()
+                    files[relpath] = manifest[relpath] + [linked]
+                    stats['linked' if linked else 'copied'] += 1
+                    stats['bytes'] += 0 if linked else manifest[relpath][0]
+        finally:
+            # Record the files that were copied so an interrupted fill resumes where it stopped
+            self.save_manifest(cached)
+        return stats
+
+
+def get_size(manifest):
+    """
+    Get the number of bytes a dataset occupies in the cache.
+
+    Parameters
+    ----------
+    manifest : dict
+        manifest of the copy of the dataset
+
+    Returns
+    -------
+    size : int
+        total size of the files that were copied rather than hardlinked
+    """
+    return sum(value[0] for value in manifest['files'].values()
+               if value is not None and not value[2])
+
+
+def list_datasets(root):
+    """
+    List the datasets in a cache.
+
+    Parameters
+    ----------
+    root : str
+        directory of the cache
+
+    Returns
+    -------
+    datasets : list[dict]
+        datasets with keys `name` (the key of the dataset), `source`, `size`, and `last_used`
+    """
+    datasets = []
+    if not os.path.isdir(root):
+        return datasets
+    for key in os.listdir(root):
+        if key == 'locks' or not os.path.isdir(os.path.join(root, key)):
+            continue
+        manifest = Dataset(root, None, key).load_manifest()
+        datasets.append({
+            'name': key,
+            'source': manifest['source'],
+            'size': get_size(manifest),
+            'last_used': manifest['last_used'],
+        })
+    return datasets
+
+
+def evict(root, budget, exclude=None):
+    """
+    Remove the least recently used datasets that are not in use until the total size of the cache
+    is within a budget.
+
+    Parameters
+    ----------
+    root : str
+        directory of the cache
+    budget : int
+        maximum total size in bytes of the datasets that are not excluded
+    exclude : iterable[str] or None
+        keys of datasets that must not be evicted and do not count towards the budget
+
+    Returns
+    -------
+    evicted : list[dict]
+        datasets that were evicted (see :func:`list_datasets`)
+    """
+    exclude = set(exclude or [])
+    candidates = []
+    locked = {}
+    evicted = []
+    try:
+        for item in list_datasets(root):
+            if item['name'] in exclude:
+                continue
+            # Datasets that are used by containers or being filled cannot be evicted and count
+            # towards the budget
+            dataset = Dataset(root, item['source'], item['name'])
+            locked[item['name']] = dataset
+            if all(dataset.acquire(name, exclusive=True, blocking=False)
+                   for name in ['use', 'fill']):
+                candidates.append(item)
+            else:
+                budget -= item['size']
+        evicted = usage.select_evictions(candidates, budget)
+        for item in evicted:
+            shutil.rmtree(locked[item['name']].directory, ignore_errors=True)
+            LOGGER.info("evicted dataset '%s' from the cache", item['source'])
+    finally:
+        for dataset in locked.values():
+            dataset.release()
+    return evicted
@@ -12,13 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import os
+from .spec import BuildSpec, RunSpec, build_assignment_parts, build_option_parts
 
 
 def build_parameter_parts(configuration, *parameters):
     """
     Construct command parts for one or more parameters.
 
+    The configuration is not modified.
+
     Parameters
     ----------
     configuration : dict
@@ -32,12 +34,7 @@ def build_parameter_parts(configuration, *parameters):
         command line argument
     """
     for parameter in parameters:
-        values = configuration.pop(parameter, [])
-        if values:
-            if not isinstance(values, list):
-                values = [values]
-            for value in values:
-                yield '--%s=%s' % (parameter, value)
+        yield from build_option_parts(parameter, configuration.get(parameter))
 
 
 def build_dict_parameter_parts(configuration, *parameters, **defaults):
@@ -45,6 +42,8 @@ def build_dict_parameter_parts(configuration, *parameters, **defaults):
     Construct command parts for one or more parameters, each of which constitutes an assignment of
     the form `key=value`.
 
+    The configuration is not modified.
+
     Parameters
     ----------
     configuration : dict
@@ -60,14 +59,17 @@ def build_dict_parameter_parts(configuration, *parameters, **defaults):
         command line argument
     """
     for parameter in parameters:
-        for key, value in configuration.pop(parameter, {}).items():
-            yield '--%s=%s=%s' % (parameter, key, value)
+        values = configuration.get(parameter, defaults.get(parameter, {}))
+        yield from build_assignment_parts(parameter, values.items())
 
 
 def build_docker_run_command(configuration):
     """
     Translate a declarative docker `configuration` to a `docker run` command.
 
+    The configuration is not modified. Use :class:`RunSpec` directly to render the command in other
+    formats or to derive variants of the command.
+
     Parameters
     ----------
     configuration : dict
@@ -78,77 +80,15 @@ def build_docker_run_command(configuration):
     args : list
         sequence of command line arguments to run a command in a container
     """
-    parts = configuration.pop('docker').split()
-    parts.append('run')
-
-    run = configuration.pop('run')
-
-    # Ensure all env-files have proper paths
-    if 'env-file' in run:
-        run['env-file'] = [os.path.join(configuration['workspace'], env_file)
-                           for env_file in run['env-file']]
-
-    parts.extend(build_parameter_parts(
-        run, 'user', 'workdir', 'rm', 'interactive', 'tty', 'env-file', 'cpu-shares', 'name',
-        'network', 'label', 'memory', 'entrypoint', 'runtime', 'privileged', 'group-add', 'gpus'
-    ))
-
-    # Add the mounts
-    # The following code requires docker >= 17.06
-    '''for mount in run.pop('mount', []):
-        if mount['type'] == 'bind':
-            mount['source'] = os.path.join(
-                configuration['workspace'], mount['source'])
-        parts.extend(['--mount', ",".join(["%s=%s" % item for item in mount.items()])])'''
-
-    # Add the mounts
-    for mount in run.pop('mount', []):
-        if mount['type'] == 'tmpfs':
-            raise RuntimeError('tmpfs-mounts are currently not supported via the mount ' +
-                               'directive in docker_interface. Consider using the tmpfs ' +
-                               'directive instead.')
-        if mount['type'] == 'bind':
-           mount['source'] = os.path.abspath(
-               os.path.join(configuration['workspace'], mount['source']))
-        vol_config = '--volume=%s:%s' % (mount['source'], mount['destination'])
-        if 'readonly' in mount and mount['readonly']:
-            vol_config += ':ro'
-        parts.append(vol_config)
-
-    # Set or forward environment variables
-    for key, value in run.pop('env', {}).items():
-        if value is None:
-            parts.append('--env=%s' % key)
-        else:
-            parts.append('--env=%s=%s' % (key, value))
-    parts.append('--env=DOCKER_INTERFACE=true')
-
-    # Forward ports
-    for publish in run.pop('publish', []):
-        parts.append('--publish=%s:%s:%s' % tuple([
-            publish.get(key, '') for key in "ip host container".split()]))
-
-    # Add temporary file systems
-    for tmpfs in run.pop('tmpfs', []):
-        destination = tmpfs['destination']
-        options = tmpfs.pop('options', [])
-        for key in ['mode', 'size']:
-            if key in tmpfs:
-                options.append('%s=%s' % (key, tmpfs[key]))
-        if options:
-            destination = "%s:%s" % (destination, ",".join(options))
-        parts.extend(['--tmpfs', destination])
-
-    parts.append(run.pop('image'))
-    parts.extend(run.pop('cmd', []))
-
-    return parts
+    return RunSpec.from_configuration(configuration).to_argv()
 
 
 def build_docker_build_command(configuration):
     """
     Translate a declarative docker `configuration` to a `docker build` command.
 
+    The configuration is not modified.
+
     Parameters
     ----------
     configuration : dict
@@ -158,19 +98,10 @@ def build_docker_build_command(configuration):
     -------
     args : list
         sequence of command line arguments to build an image
-    """
-    parts = configuration.pop('docker', 'docker').split()
-    parts.append('build')
-
-    build = configuration.pop('build')
 
-    build['path'] = os.path.join(configuration['workspace'], build['path'])
-    build['file'] = os.path.join(build['path'], build['file'])
-
-    parts.extend(build_parameter_parts(
-        build, 'tag', 'file', 'no-cache', 'quiet', 'cpu-shares', 'memory'))
-
-    parts.extend(build_dict_parameter_parts(build, 'build-arg'))
-    parts.append(build.pop('path'))
-
-    return parts
+    Raises
+    ------
+    ValueError
+        if the configuration requests features that the builder does not support
+    """
+    return BuildSpec.from_configuration(configuration).to_argv()
@@ -0,0 +1,424 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import http.client
+import json
+import logging
+import socket
+import subprocess
+import threading
+import time
+import urllib.parse
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection over a unix domain socket.
+
+    Parameters
+    ----------
+    path : str
+        path of the socket
+    timeout : float
+        timeout for connecting and reading in seconds
+    """
+    def __init__(self, path, timeout):
+        super(UnixHTTPConnection, self).__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class Endpoint:
+    """
+    Docker endpoint given by a `DOCKER_HOST` value or the name of a docker context.
+
+    Endpoints whose host uses the `unix` or `tcp` scheme are queried using the Engine API directly;
+    all other endpoints are queried using the docker CLI.
+
+    Parameters
+    ----------
+    host : str or None
+        address of the daemon, e.g. `unix:///var/run/docker.sock` or `tcp://10.0.0.1:2375`
+    context : str or None
+        name of a docker context
+    name : str or None
+        name of the endpoint for display (defaults to the host or context)
+    """
+    def __init__(self, host=None, context=None, name=None):
+        if (host is None) == (context is None):
+            raise ValueError("an endpoint must define exactly one of `host` and `context`")
+        self.host = host
+        self.context = context
+        self.name = name or host or context
+        self.context_host = None
+
+    @classmethod
+    def from_configuration(cls, value):
+        """
+        Create an endpoint from an entry of `endpoints`.
+
+        Parameters
+        ----------
+        value : str or dict
+            `DOCKER_HOST` value, name of a docker context, or object with `host` or `context` and
+            optionally `name`
+
+        Returns
+        -------
+        endpoint : Endpoint
+            endpoint
+        """
+        if isinstance(value, dict):
+            return cls(value.get('host'), value.get('context'), value.get('name'))
+        if '://' in value:
+            return cls(host=value)
+        return cls(context=value)
+
+    def get_docker(self, docker):
+        """
+        Get the docker CLI for this endpoint.
+
+        Parameters
+        ----------
+        docker : str
+            docker CLI, e.g. `docker`
+
+        Returns
+        -------
+        docker : str
+            docker CLI with global options selecting this endpoint
+        """
+        if self.host:
+            return '%s --host=%s' % (docker, self.host)
+        return '%s --context=%s' % (docker, self.context)
+
+    def resolve_host(self, docker, timeout=5):
+        """
+        Get the address of the daemon, looking up the host of a docker context if necessary.
+
+        Parameters
+        ----------
+        docker : str
+            docker CLI used to inspect the context
+        timeout : float
+            timeout in seconds
+
+        Returns
+        -------
+        host : str or None
+            address of the daemon or `None` if the context cannot be inspected
+        """
+        if self.host:
+            return self.host
+        if self.context_host is None:
+            try:
+                output = subprocess.check_output(
+                    docker.split() + ['context', 'inspect', '--format',
+                                      '{{.Endpoints.docker.Host}}', self.context],
+                    stderr=subprocess.DEVNULL, universal_newlines=True, timeout=timeout)
+            except (OSError, subprocess.SubprocessError) as ex:
+                LOGGER.warning("could not inspect docker context '%s': %s", self.context, ex)
+                return None
+            self.context_host = output.strip() or None
+        return self.context_host
+
+    def to_configuration(self):
+        """
+        Get the description of the endpoint stored in the configuration.
+
+        Returns
+        -------
+        endpoint : dict
+            name and host or context of the endpoint as well as the host of the context if it has
+            been resolved using :meth:`resolve_host`
+        """
+        value = {'name': self.name}
+        value.update({'host': self.host} if self.host else {'context': self.context})
+        if self.context_host:
+            value['host'] = self.context_host
+        return value
+
+    def request(self, path, timeout=5):
+        """
+        Send a `GET` request to the Engine API.
+
+        Parameters
+        ----------
+        path : str
+            path of the resource, e.g. `/info`
+        timeout : float
+            timeout in seconds
+
+        Returns
+        -------
+        status : int
+            status code of the response
+        body : object
+            decoded JSON body of the response or `None` if the request failed
+        """
+        url = urllib.parse.urlparse(self.host)
+        if url.scheme == 'unix':
+            connection = UnixHTTPConnection(url.path, timeout)
+        else:
+            connection = http.client.HTTPConnection(url.hostname, url.port or 2375,
+                                                    timeout=timeout)
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            body = response.read()
+        finally:
+            connection.close()
+        try:
+            return response.status, json.loads(body.decode())
+        except ValueError:
+            return response.status, None
+
+    @property
+    def uses_api(self):
+        """
+        bool : whether the endpoint is queried using the Engine API rather than the docker CLI
+        """
+        return bool(self.host) and self.host.split('://')[0] in ('unix', 'tcp')
+
+    def get_info(self, docker, timeout=5):
+        """
+        Get system-wide information about the daemon.
+
+        Parameters
+        ----------
+        docker : str
+            docker CLI used for endpoints that are not queried using the Engine API
+        timeout : float
+            timeout in seconds
+
+        Returns
+        -------
+        info : dict
+            daemon information including `ContainersRunning` and `MemTotal`
+
+        Raises
+        ------
+        OSError
+            if the daemon is not reachable
+        """
+        if self.uses_api:
+            status, info = self.request('/info', timeout)
+            if status != 200 or not isinstance(info, dict):
+                raise OSError("could not get information from '%s' (status %d)" % (self.name,
+                                                                                   status))
+            return info
+        try:
+            output = subprocess.check_output(
+                self.get_docker(docker).split() + ['system', 'info', '--format', '{{json .}}'],
+                stderr=subprocess.DEVNULL, universal_newlines=True, timeout=timeout)
+            return json.loads(output)
+        except (subprocess.SubprocessError, ValueError) as ex:
+            raise OSError("could not get information from '%s': %s" % (self.name, ex))
+
+    def has_image(self, docker, image, timeout=5):
+        """
+        Check whether an image is present on the daemon.
+
+        Parameters
+        ----------
+        docker : str
+            docker CLI used for endpoints that are not queried using the Engine API
+        image : str
+            name of the image
+        timeout : float
+            timeout in seconds
+
+        Returns
+        -------
+        present : bool
+            whether the image is present
+        """
+        if self.uses_api:
+            status, _ = self.request('/images/%s/json' % urllib.parse.quote(image, safe='/:@'),
+                                     timeout)
+            return status == 200
+        return subprocess.call(
+            self.get_docker(docker).split() + ['image', 'inspect', '--format={{.Id}}', image],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout) == 0
+
+
+class Scheduler:
+    """
+    Dispatch containers to the least-loaded of several docker endpoints.
+
+    The load of an endpoint is the number of running containers reported by the daemon plus the
+    number of containers dispatched to it since the daemon was last queried. Endpoints without
+    enough free memory for the container are only used if no other endpoint has enough memory.
+    Free memory is estimated as the total memory reported by the daemon less the memory limits of
+    containers that were dispatched by the scheduler and have not been released. Ties are broken
+    in favour of endpoints that already have the image, then by free memory. Daemon information is
+    cached for `refresh` seconds and the presence of images is cached until an image is found.
+
+    Parameters
+    ----------
+    endpoints : list[Endpoint]
+        endpoints to dispatch containers to
+    docker : str
+        docker CLI
+    refresh : float
+        time after which daemon information is queried again in seconds
+    timeout : float
+        timeout for queries in seconds
+    """
+    def __init__(self, endpoints, docker='docker', refresh=1.0, timeout=5):
+        self.endpoints = endpoints
+        self.docker = docker
+        self.refresh = refresh
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.info = {}
+        self.images = {}
+        self.dispatched = {endpoint.name: [] for endpoint in endpoints}
+
+    def get_info(self, endpoint):
+        """
+        Get cached daemon information of an endpoint.
+
+        Parameters
+        ----------
+        endpoint : Endpoint
+            endpoint
+
+        Returns
+        -------
+        updated : float or None
+            time at which the information was obtained or `None` if the endpoint is not reachable
+        info : dict or None
+            daemon information or `None` if the endpoint is not reachable
+        """
+        updated, info = self.info.get(endpoint.name, (None, None))
+        if updated is None or time.time() - updated > self.refresh:
+            try:
+                info = endpoint.get_info(self.docker, self.timeout)
+            except OSError as ex:
+                LOGGER.warning("skipping docker endpoint '%s': %s", endpoint.name, ex)
+                info = None
+            updated = time.time()
+            self.info[endpoint.name] = (updated, info)
+        return (updated, info) if info is not None else (None, None)
+
+    def has_image(self, endpoint, image):
+        """
+        Check whether an endpoint has an image, caching positive results.
+
+        Parameters
+        ----------
+        endpoint : Endpoint
+            endpoint
+        image : str
+            name of the image
+
+        Returns
+        -------
+        present : bool
+            whether the image is present
+        """
+        key = (endpoint.name, image)
+        if not self.images.get(key):
+            try:
+                self.images[key] = endpoint.has_image(self.docker, image, self.timeout)
+            except (OSError, subprocess.SubprocessError):
+                self.images[key] = False
+        return self.images[key]
+
+    def get_load(self, endpoint):
+        """
+        Get the load of an endpoint.
+
+        Parameters
+        ----------
+        endpoint : Endpoint
+            endpoint
+
+        Returns
+        -------
+        load : dict or None
+            number of `running` containers and `free` memory in bytes or `None` if the endpoint
+            is not reachable
+        """
+        updated, info = self.get_info(endpoint)
+        if info is None:
+            return None
+        dispatched = self.dispatched[endpoint.name]
+        pending = sum(1 for started, _ in dispatched if started >= updated)
+        reserved = sum(memory for _, memory in dispatched)
+        return {
+            'running': info.get('ContainersRunning', 0) + pending,
+            'free': info.get('MemTotal', 0) - reserved,
+        }
+
+    def acquire(self, memory=0, image=None):
+        """
+        Select the least-loaded endpoint and reserve resources for a container.
+
+        Parameters
+        ----------
+        memory : int
+            memory limit of the container in bytes
+        image : str or None
+            image of the container
+
+        Returns
+        -------
+        endpoint : Endpoint
+            selected endpoint
+        token : tuple
+            reservation to pass to :meth:`release` once the container has exited
+
+        Raises
+        ------
+        ValueError
+            if none of the endpoints are reachable
+        """
+        with self.lock:
+            candidates = []
+            for index, endpoint in enumerate(self.endpoints):
+                load = self.get_load(endpoint)
+                if load is None:
+                    continue
+                missing = not self.has_image(endpoint, image) if image else False
+                candidates.append(((load['free'] < memory, load['running'], missing,
+                                    -load['free'], index), endpoint))
+            if not candidates:
+                raise ValueError("none of the docker endpoints %s are reachable" %
+                                 ", ".join(endpoint.name for endpoint in self.endpoints))
+            _, endpoint = min(candidates, key=lambda candidate: candidate[0])
+            token = (endpoint.name, (time.time(), memory))
+            self.dispatched[endpoint.name].append(token[1])
+            return endpoint, token
+
+    def release(self, token):
+        """
+        Release the resources reserved for a container.
+
+        Parameters
+        ----------
+        token : tuple
+            reservation obtained from :meth:`acquire`
+        """
+        name, reservation = token
+        with self.lock:
+            self.dispatched[name].remove(reservation)
@@ -0,0 +1,260 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import contextlib
+import hashlib
+import json
+import os
+import subprocess
+
+
+DATABASE = os.path.join('.di', 'history.sqlite')
+COMMANDS = ['run', 'build']
+COLUMNS = ['started', 'command', 'config_hash', 'image', 'image_id', 'status', 'setup_time',
+           'container_time', 'plugin_times']
+
+
+def get_database_path(workspace):
+    """
+    Get the path of the run-history database of a workspace.
+
+    Parameters
+    ----------
+    workspace : str
+        path of the workspace
+
+    Returns
+    -------
+    path : str
+        path of the database
+    """
+    return os.path.join(workspace, DATABASE)
+
+
+@contextlib.contextmanager
+def connect(workspace):
+    """
+    Open the run-history database of a workspace and create the table if necessary.
+
+    Parameters
+    ----------
+    workspace : str
+        path of the workspace
+
+    Yields
+    ------
+    conn : sqlite3.Connection
+        connection to the database
+    """
+    import sqlite3
+    path = get_database_path(workspace)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with contextlib.closing(sqlite3.connect(path)) as conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY AUTOINCREMENT, started REAL, "
+            "command TEXT, config_hash TEXT, image TEXT, image_id TEXT, status INTEGER, "
+            "setup_time REAL, container_time REAL, plugin_times TEXT)"
+        )
+        yield conn
+
+
+def hash_configuration(configuration):
+    """
+    Compute a stable hash of a configuration.
+
+    Parameters
+    ----------
+    configuration : dict
+        configuration
+
+    Returns
+    -------
+    digest : str
+        hexadecimal SHA-1 digest of the canonical JSON representation of the configuration
+    """
+    text = json.dumps(configuration, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def get_image_name(configuration, command):
+    """
+    Get the name of the image used by a command.
+
+    Parameters
+    ----------
+    configuration : dict
+        configuration
+    command : str
+        docker interface command
+
+    Returns
+    -------
+    image : str or None
+        name of the image or `None` if the command does not use an image
+    """
+    if command == 'run':
+        return configuration.get('run', {}).get('image')
+    elif command == 'build':
+        return configuration.get('build', {}).get('tag')
+    return None
+
+
+def get_image_id(docker, image):
+    """
+    Get the identifier of an image.
+
+    Parameters
+    ----------
+    docker : str
+        name of the docker CLI
+    image : str
+        name of the image
+
+    Returns
+    -------
+    image_id : str or None
+        identifier of the image or `None` if the image cannot be inspected
+    """
+    try:
+        process = subprocess.run(
+            docker.split() + ['image', 'inspect', '--format={{.Id}}', image],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True
+        )
+    except OSError:  # pragma: no cover
+        return None
+    if process.returncode:
+        return None
+    return process.stdout.strip() or None
+
+
+def record(workspace, **values):
+    """
+    Append a row to the run-history database of a workspace.
+
+    Parameters
+    ----------
+    workspace : str
+        path of the workspace
+    values : dict
+        values for the columns listed in :code:`COLUMNS`
+    """
+    values['plugin_times'] = json.dumps(values.get('plugin_times') or {})
+    with connect(workspace) as conn:
+        conn.execute(
+            "INSERT INTO runs (%s) VALUES (%s)" % (
+                ", ".join(COLUMNS), ", ".join("?" * len(COLUMNS))),
+            [values.get(column) for column in COLUMNS]
+        )
+        conn.commit()
+
+
+def query(workspace, limit=None):
+    """
+    Load rows from the run-history database of a workspace.
+
+    Parameters
+    ----------
+    workspace : str
+        path of the workspace
+    limit : int or None
+        maximum number of most recent rows to load
+
+    Returns
+    -------
+    rows : list[dict]
+        rows in chronological order (empty if the database does not exist)
+    """
+    if not os.path.isfile(get_database_path(workspace)):
+        return []
+    with connect(workspace) as conn:
+        cursor = conn.execute(
+            "SELECT %s FROM runs ORDER BY id DESC LIMIT ?" % ", ".join(COLUMNS),
+            (-1 if limit is None else limit,)
+        )
+        rows = [dict(zip(COLUMNS, row)) for row in cursor]
+    for row in rows:
+        row['plugin_times'] = json.loads(row['plugin_times'] or '{}')
+    return rows[::-1]
+
+
+def percentile(values, q):
+    """
+    Compute a percentile using linear interpolation between the closest ranks.
+
+    Parameters
+    ----------
+    values : list[float]
+        values to compute the percentile of
+    q : float
+        percentile between 0 and 100
+
+    Returns
+    -------
+    value : float or None
+        percentile of the values or `None` if `values` is empty
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(rows, percentiles=(50, 90, 99)):
+    """
+    Summarize run-history rows by command and image.
+
+    Parameters
+    ----------
+    rows : list[dict]
+        rows obtained from :func:`query`
+    percentiles : list[float]
+        percentiles to compute
+
+    Returns
+    -------
+    summary : list[dict]
+        summary for each combination of command, image name, and image id with the number of runs,
+        the number of failed runs, and percentiles of the setup time, container time, and the
+        overhead of each plugin
+    """
+    groups = collections.OrderedDict()
+    for row in rows:
+        groups.setdefault((row['command'], row['image'], row['image_id']), []).append(row)
+
+    summary = []
+    for (command, image, image_id), group in groups.items():
+        plugin_times = collections.defaultdict(list)
+        for row in group:
+            for name, value in row['plugin_times'].items():
+                plugin_times[name].append(value)
+        item = {
+            'command': command,
+            'image': image,
+            'image_id': image_id,
+            'runs': len(group),
+            'failures': sum(1 for row in group if row['status']),
+            'plugin_times': {
+                name: [percentile(values, q) for q in percentiles]
+                for name, values in plugin_times.items()
+            },
+        }
+        for key in ['setup_time', 'container_time']:
+            values = [row[key] for row in group if row[key] is not None]
+            item[key] = [percentile(values, q) for q in percentiles]
+        summary.append(item)
+    return summary
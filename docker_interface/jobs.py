@@ -0,0 +1,481 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import collections
+import itertools
+import json
+import logging
+import os
+import socket
+import struct
+import time
+
+from .history import percentile
+from . import util
+
+
+LOGGER = logging.getLogger(__name__)
+# Number of recent wait times kept to report percentiles
+WAIT_HISTORY = 1000
+
+
+class Job:
+    """
+    Job waiting for or holding resources of the host.
+
+    Parameters
+    ----------
+    user : str
+        user who submitted the job
+    memory : int
+        memory in bytes
+    cpus : float
+        number of CPUs
+    priority : int
+        jobs with higher priority are admitted first
+    name : str or None
+        name of the job for display
+    """
+    _ids = itertools.count()
+
+    def __init__(self, user, memory=0, cpus=0.0, priority=0, name=None):
+        self.id = next(self._ids)  # pylint: disable=invalid-name
+        self.user = user
+        self.memory = memory
+        self.cpus = cpus
+        self.priority = priority
+        self.name = name
+        self.submitted = None
+        self.admitted = None
+
+    @classmethod
+    def from_request(cls, request, user=None):
+        """
+        Create a job from a request sent by a client.
+
+        Parameters
+        ----------
+        request : dict
+            request with `memory` in bytes, `cpus`, `cpu-shares`, `priority`, `user`, and `name`
+        user : str or None
+            user who submitted the job as determined from the connection (takes precedence over
+            the user in the request)
+
+        Returns
+        -------
+        job : Job
+            job
+        """
+        cpus = float(request.get('cpus') or 0)
+        # Relative CPU shares are interpreted as a fraction of 1024 shares per CPU
+        if not cpus and request.get('cpu-shares'):
+            cpus = request['cpu-shares'] / 1024
+        return cls(user or request.get('user') or 'unknown', int(request.get('memory') or 0), cpus,
+                   int(request.get('priority') or 0), request.get('name'))
+
+    def __repr__(self):
+        return "Job(id=%d, user=%r, memory=%d, cpus=%g, priority=%d)" % (
+            self.id, self.user, self.memory, self.cpus, self.priority)
+
+
+class JobQueue:
+    """
+    Admit jobs such that their declared resources do not exceed the capacity of the host.
+
+    Pending jobs are considered in order of decreasing priority, increasing dominant share of their
+    user (the larger of the fractions of memory and CPUs held by the running jobs of the user), and
+    submission time. Each job that fits into the remaining capacity is admitted so that small jobs
+    fill the gaps left by large ones. Once the first job in that order has waited for more than
+    `backfill` seconds, no jobs are admitted ahead of it so that large jobs are not starved.
+
+    Parameters
+    ----------
+    memory : int
+        memory of the host available to jobs in bytes
+    cpus : float
+        number of CPUs of the host available to jobs
+    backfill : float
+        time in seconds after which jobs may no longer be admitted ahead of a waiting job
+    clock : callable
+        function returning the current time in seconds
+    """
+    def __init__(self, memory, cpus, backfill=60.0, clock=time.time):
+        self.memory = memory
+        self.cpus = cpus
+        self.backfill = backfill
+        self.clock = clock
+        self.pending = []
+        self.running = {}
+        self.waits = collections.deque(maxlen=WAIT_HISTORY)
+        self.admitted = 0
+        self.started = self.updated = clock()
+        # Integrals of the allocated memory and CPUs over time for average utilisation
+        self.memory_time = self.cpu_time = 0.0
+
+    @property
+    def allocated(self):
+        """
+        tuple[int, float] : memory and CPUs held by running jobs
+        """
+        return (sum(job.memory for job in self.running.values()),
+                sum(job.cpus for job in self.running.values()))
+
+    def _update(self):
+        now = self.clock()
+        memory, cpus = self.allocated
+        self.memory_time += memory * (now - self.updated)
+        self.cpu_time += cpus * (now - self.updated)
+        self.updated = now
+
+    def get_shares(self):
+        """
+        Get the dominant share of each user with running jobs.
+
+        Returns
+        -------
+        shares : dict[str, float]
+            mapping from users to the larger of their fractions of memory and CPUs
+        """
+        memory = collections.Counter()
+        cpus = collections.Counter()
+        for job in self.running.values():
+            memory[job.user] += job.memory
+            cpus[job.user] += job.cpus
+        return {user: max(memory[user] / (self.memory or 1), cpus[user] / (self.cpus or 1))
+                for user in set(memory) | set(cpus)}
+
+    def submit(self, job):
+        """
+        Add a job to the queue.
+
+        Parameters
+        ----------
+        job : Job
+            job to add
+
+        Raises
+        ------
+        ValueError
+            if the job can never be admitted because it exceeds the capacity of the host
+        """
+        if job.memory > self.memory or job.cpus > self.cpus:
+            raise ValueError("job requires %d bytes of memory and %g cpus but the host only "
+                             "provides %d bytes and %g cpus" % (job.memory, job.cpus, self.memory,
+                                                                self.cpus))
+        job.submitted = self.clock()
+        self.pending.append(job)
+
+    def cancel(self, job):
+        """
+        Remove a job from the queue or release its resources if it was admitted.
+
+        Parameters
+        ----------
+        job : Job
+            job to remove
+        """
+        if job.id in self.running:
+            self._update()
+            del self.running[job.id]
+        elif job in self.pending:
+            self.pending.remove(job)
+
+    def schedule(self):
+        """
+        Admit pending jobs that fit into the remaining capacity.
+
+        Returns
+        -------
+        admitted : list[Job]
+            jobs that were admitted
+        """
+        self._update()
+        now = self.clock()
+        memory, cpus = self.allocated
+        shares = self.get_shares()
+        order = sorted(self.pending, key=lambda job: (-job.priority, shares.get(job.user, 0),
+                                                      job.submitted, job.id))
+        admitted = []
+        for job in order:
+            if memory + job.memory <= self.memory and cpus + job.cpus <= self.cpus:
+                memory += job.memory
+                cpus += job.cpus
+                job.admitted = now
+                self.pending.remove(job)
+                self.running[job.id] = job
+                self.waits.append(job.admitted - job.submitted)
+                self.admitted += 1
+                admitted.append(job)
+            elif now - job.submitted > self.backfill:
+                # Reserve the remaining capacity for the job that has waited too long
+                break
+        return admitted
+
+    def get_status(self):
+        """
+        Get the state of the queue and metrics to tune the density of jobs.
+
+        Returns
+        -------
+        status : dict
+            capacity, allocated resources, average utilisation since the queue was created,
+            percentiles of recent wait times, and running and pending jobs
+        """
+        self._update()
+        memory, cpus = self.allocated
+        elapsed = max(self.updated - self.started, 1e-9)
+        now = self.clock()
+        return {
+            'capacity': {'memory': self.memory, 'cpus': self.cpus},
+            'allocated': {'memory': memory, 'cpus': cpus},
+            'utilisation': {
+                'memory': memory / (self.memory or 1),
+                'cpus': cpus / (self.cpus or 1),
+                'memory_mean': self.memory_time / elapsed / (self.memory or 1),
+                'cpus_mean': self.cpu_time / elapsed / (self.cpus or 1),
+            },
+            'admitted': self.admitted,
+            'wait': {'p%d' % q: percentile(self.waits, q) for q in (50, 90, 99)},
+            'running': [self._describe(job, now - job.admitted) for job in self.running.values()],
+            'pending': [self._describe(job, now - job.submitted) for job in self.pending],
+        }
+
+    @staticmethod
+    def _describe(job, elapsed):
+        return {'id': job.id, 'user': job.user, 'name': job.name, 'memory': job.memory,
+                'cpus': job.cpus, 'priority': job.priority, 'elapsed': elapsed}
+
+
+def get_peer_user(sock):
+    """
+    Get the name of the user of the process at the other end of a unix domain socket.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        connected socket
+
+    Returns
+    -------
+    user : str or None
+        name of the user or `None` if the user cannot be determined
+    """
+    try:
+        import pwd
+        credentials = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                      struct.calcsize('3i'))
+        _, uid, _ = struct.unpack('3i', credentials)
+        return pwd.getpwuid(uid).pw_name
+    except (AttributeError, OSError, KeyError):  # pragma: no cover
+        return None
+
+
+class QueueServer:
+    """
+    Serve a job queue on a unix domain socket.
+
+    Clients send a single JSON line. A request with `command` set to `status` is answered with the
+    status of the queue. Any other request submits a job; the server answers once the job has been
+    admitted (or with an `error` if it cannot be admitted) and releases the resources of the job
+    when the client closes the connection. Jobs of clients that disconnect while waiting are
+    removed from the queue.
+
+    Parameters
+    ----------
+    queue : JobQueue
+        queue to serve
+    path : str or None
+        path of the socket (defaults to :func:`get_socket_path`)
+    """
+    def __init__(self, queue, path=None):
+        self.queue = queue
+        self.path = path or get_socket_path()
+        self.events = {}
+
+    def schedule(self):
+        """
+        Admit pending jobs and notify their clients.
+        """
+        for job in self.queue.schedule():
+            LOGGER.info("admitted %r after %.3fs", job, job.admitted - job.submitted)
+            self.events.pop(job.id).set()
+
+    async def handle(self, reader, writer):
+        """
+        Handle a connection from a client.
+
+        Parameters
+        ----------
+        reader : asyncio.StreamReader
+            stream to read the request from
+        writer : asyncio.StreamWriter
+            stream to write the response to
+        """
+        job = None
+        try:
+            line = await reader.readline()
+            if not line:
+                # The client only checked whether the queue is served
+                return
+            request = json.loads(line.decode())
+            if request.get('command') == 'status':
+                writer.write(json.dumps(self.queue.get_status()).encode() + b'\n')
+                return
+            job = Job.from_request(request, get_peer_user(writer.get_extra_info('socket')))
+            try:
+                self.queue.submit(job)
+            except ValueError as ex:
+                writer.write(json.dumps({'error': str(ex)}).encode() + b'\n')
+                job = None
+                return
+            event = self.events[job.id] = asyncio.Event()
+            self.schedule()
+            # Wait for admission unless the client disconnects first
+            admission = asyncio.ensure_future(event.wait())
+            disconnect = asyncio.ensure_future(reader.read())
+            await asyncio.wait([admission, disconnect], return_when=asyncio.FIRST_COMPLETED)
+            if not event.is_set():
+                admission.cancel()
+                return
+            writer.write(json.dumps({'admitted': True, 'id': job.id,
+                                     'wait': job.admitted - job.submitted}).encode() + b'\n')
+            await writer.drain()
+            # The job holds its resources until the client closes the connection
+            await disconnect
+        except (ValueError, ConnectionError) as ex:
+            LOGGER.warning("invalid request: %s", ex)
+        finally:
+            if job is not None:
+                self.events.pop(job.id, None)
+                self.queue.cancel(job)
+                self.schedule()
+            writer.close()
+
+    async def serve(self, ready=None):
+        """
+        Serve the queue until cancelled.
+
+        Parameters
+        ----------
+        ready : callable or None
+            function called once the server accepts connections
+        """
+        if os.path.exists(self.path):
+            if is_serving(self.path):
+                raise ValueError("a queue is already served at '%s'" % self.path)
+            os.unlink(self.path)
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            # Other users must be able to reach the socket
+            os.makedirs(dirname, 0o755, exist_ok=True)
+        server = await asyncio.start_unix_server(self.handle, self.path)
+        # Allow all users to submit jobs; users are identified by the credentials of the socket
+        os.chmod(self.path, 0o666)
+        try:
+            if ready:
+                ready()
+            await asyncio.Event().wait()
+        finally:
+            server.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+def get_socket_path():
+    """
+    Get the default path of the socket of the queue.
+
+    Returns
+    -------
+    path : str
+        `queue.sock` in the directory shared by all users of the host so that a single queue admits
+        the jobs of all users
+    """
+    return os.path.join(util.get_shared_dir(), 'queue.sock')
+
+
+def connect(path):
+    """
+    Connect to a queue served on a unix domain socket.
+
+    Parameters
+    ----------
+    path : str
+        path of the socket
+
+    Returns
+    -------
+    sock : socket.socket
+        connected socket
+
+    Raises
+    ------
+    OSError
+        if no queue is served at the path
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def is_serving(path):
+    """
+    Check whether a queue is served at a path.
+
+    Parameters
+    ----------
+    path : str
+        path of the socket
+
+    Returns
+    -------
+    serving : bool
+        whether a server accepts connections at the path
+    """
+    try:
+        connect(path).close()
+    except OSError:
+        return False
+    return True
+
+
+def request(sock, payload):
+    """
+    Send a request and wait for the response.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        connected socket
+    payload : dict
+        request
+
+    Returns
+    -------
+    response : dict
+        response
+    """
+    sock.sendall(json.dumps(payload).encode() + b'\n')
+    data = b''
+    while not data.endswith(b'\n'):
+        chunk = sock.recv(65536)
+        if not chunk:
+            raise ConnectionError("the queue closed the connection")
+        data += chunk
+    return json.loads(data.decode())
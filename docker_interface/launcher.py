@@ -0,0 +1,184 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import hashlib
+import os
+import shlex
+
+
+class Launcher:
+    """
+    POSIX shell script that runs resolved docker commands without invoking docker interface.
+
+    Plugins contribute to the launcher in their :code:`compile` method. Values that must be
+    computed whenever the launcher runs are represented by placeholders obtained from
+    :meth:`variable`; placeholders may be embedded in any string of the configuration and are
+    expanded by the shell when the launcher runs.
+
+    Parameters
+    ----------
+    command : str
+        docker interface command the launcher was compiled from
+    """
+    SEPARATOR = '\0'
+
+    def __init__(self, command):
+        self.command = command
+        self.variables = collections.OrderedDict()
+        self.lines = []
+        self.inputs = collections.OrderedDict()
+
+    def variable(self, name, fragment):
+        """
+        Declare a variable evaluated by a shell fragment when the launcher runs.
+
+        Parameters
+        ----------
+        name : str
+            name of the shell variable
+        fragment : str
+            shell fragment whose output is the value of the variable
+
+        Returns
+        -------
+        placeholder : str
+            placeholder that is replaced by the value of the variable
+        """
+        if self.variables.setdefault(name, fragment) != fragment:
+            raise ValueError("variable '%s' is already defined by a different fragment" % name)
+        return '%s%s%s' % (self.SEPARATOR, name, self.SEPARATOR)
+
+    def add_line(self, line):
+        """
+        Add a line of shell code that runs before the docker commands.
+
+        Parameters
+        ----------
+        line : str
+            shell code which may reference variables declared using :meth:`variable`
+        """
+        self.lines.append(line)
+
+    def add_input(self, path):
+        """
+        Add a file that the launcher depends on. The launcher refuses to run if the file changes.
+
+        Parameters
+        ----------
+        path : str
+            path of the file
+        """
+        path = os.path.abspath(path)
+        with open(path, 'rb') as fp:  # pylint: disable=invalid-name
+            self.inputs[path] = hashlib.sha256(fp.read()).hexdigest()
+
+    @classmethod
+    def quote(cls, value):
+        """
+        Quote a value for the shell, expanding any placeholders.
+
+        Parameters
+        ----------
+        value :
+            value to quote
+
+        Returns
+        -------
+        word : str
+            shell word that evaluates to the value
+        """
+        parts = str(value).split(cls.SEPARATOR)
+        if len(parts) % 2 == 0:
+            raise ValueError("unbalanced placeholder in '%s'" % value)
+        word = "".join('"${%s}"' % part if i % 2 else shlex.quote(part)
+                       for i, part in enumerate(parts) if i % 2 or part)
+        return word or "''"
+
+    @classmethod
+    def join(cls, parts):
+        """
+        Quote and join command line arguments, expanding any placeholders.
+
+        Parameters
+        ----------
+        parts : list
+            command line arguments
+
+        Returns
+        -------
+        command : str
+            shell command
+        """
+        return " ".join(cls.quote(part) for part in parts)
+
+    def render(self, commands):
+        """
+        Render the launcher.
+
+        Parameters
+        ----------
+        commands : list[list[str]]
+            docker commands to execute in order; the launcher replaces itself with the last command
+            and appends its own arguments to it
+
+        Returns
+        -------
+        script : str
+            POSIX shell script
+        """
+        lines = [
+            '#!/bin/sh',
+            '# Generated by `di compile %s`. Compile the launcher again instead of editing it.' %
+            self.command,
+            'set -e',
+        ]
+        if self.inputs:
+            lines.extend([
+                'di_sha256() {',
+                '    if command -v sha256sum > /dev/null; then sha256sum "$1"; '
+                'else shasum -a 256 "$1"; fi | cut -d " " -f 1',
+                '}',
+            ])
+            for path, digest in self.inputs.items():
+                path = shlex.quote(path)
+                lines.extend([
+                    'if [ "$(di_sha256 %s 2> /dev/null)" != %s ]; then' % (path, digest),
+                    '    echo %s >&2' % shlex.quote(
+                        "%s has changed; run `di compile %s` again" % (path, self.command)),
+                    '    exit 2',
+                    'fi',
+                ])
+        lines.extend('%s=$(%s)' % item for item in self.variables.items())
+        lines.extend(self.lines)
+        for parts in commands[:-1]:
+            lines.append(self.join(parts))
+        if commands:
+            lines.append('exec %s "$@"' % self.join(commands[-1]))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, commands):
+        """
+        Render the launcher and write it to an executable file.
+
+        Parameters
+        ----------
+        path : str
+            path of the launcher
+        commands : list[list[str]]
+            docker commands to execute in order
+        """
+        with open(path, 'w') as fp:  # pylint: disable=invalid-name
+            fp.write(self.render(commands))
+        os.chmod(path, 0o755)
@@ -0,0 +1,408 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import hashlib
+import json
+import posixpath
+import tarfile
+
+
+WHITEOUT_PREFIX = '.wh.'
+OPAQUE_WHITEOUT = '.wh..wh..opq'
+# Metadata documents of saved images are small; larger members that are not layers are skipped
+MAX_DOCUMENT_SIZE = 2 ** 24
+CHUNK_SIZE = 2 ** 20
+
+Entry = collections.namedtuple('Entry', 'kind path size digest')
+Entry.__doc__ = """
+Entry of a layer.
+
+Parameters
+----------
+kind : str
+    `file`, `dir`, `link` (symbolic links, hard links, and devices), `whiteout` (the path is removed
+    from lower layers), or `opaque` (the contents of the directory in lower layers are hidden)
+path : str
+    absolute path of the entry
+size : int
+    size of the file in bytes (zero for all other kinds)
+digest : str or None
+    hexadecimal SHA-256 digest of the contents of a file
+"""
+
+
+def is_tarball(head):
+    """
+    Check whether the first bytes of a file belong to a tar archive, possibly compressed using gzip.
+
+    Parameters
+    ----------
+    head : bytes
+        first bytes of the file
+
+    Returns
+    -------
+    tarball : bool
+        whether the file is a tar archive
+    """
+    return head[:2] == b'\x1f\x8b' or head[257:262] == b'ustar'
+
+
+def read_layer(fileobj):
+    """
+    Read the entries of a layer from a stream without extracting it.
+
+    Parameters
+    ----------
+    fileobj : file
+        stream of the layer tarball (optionally compressed using gzip)
+
+    Returns
+    -------
+    entries : list[Entry]
+        entries of the layer in the order they appear in the tarball
+    """
+    entries = []
+    with tarfile.open(fileobj=fileobj, mode='r|*') as layer:
+        for member in layer:
+            path = posixpath.normpath(posixpath.join('/', member.name))
+            dirname, basename = posixpath.split(path)
+            if basename == OPAQUE_WHITEOUT:
+                entries.append(Entry('opaque', dirname, 0, None))
+            elif basename.startswith(WHITEOUT_PREFIX):
+                entries.append(Entry('whiteout', posixpath.join(
+                    dirname, basename[len(WHITEOUT_PREFIX):]), 0, None))
+            elif member.isfile():
+                digest = hashlib.sha256()
+                fp = layer.extractfile(member)  # pylint: disable=invalid-name
+                for chunk in iter(lambda: fp.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                entries.append(Entry('file', path, member.size, digest.hexdigest()))
+            else:
+                entries.append(Entry('dir' if member.isdir() else 'link', path, 0, None))
+    return entries
+
+
+def read_archive(fileobj):
+    """
+    Read the layers and metadata of images saved using `docker save` from a stream.
+
+    Both the legacy format and the OCI image layout are supported. The archive is read in a single
+    pass and is never extracted to disk.
+
+    Parameters
+    ----------
+    fileobj : file
+        stream of the archive
+
+    Returns
+    -------
+    layers : dict[str, list[Entry]]
+        mapping from the names of layer tarballs in the archive to their entries
+    sizes : dict[str, int]
+        mapping from the names of layer tarballs in the archive to their sizes in bytes
+    documents : dict[str, object]
+        mapping from the names of JSON documents in the archive to their contents
+    """
+    layers = {}
+    sizes = {}
+    documents = {}
+    links = {}
+    with tarfile.open(fileobj=fileobj, mode='r|') as archive:
+        for member in archive:
+            if member.issym() or member.islnk():
+                # Identical layers may be stored once and linked from other locations
+                target = member.linkname
+                if member.issym():
+                    target = posixpath.join(posixpath.dirname(member.name), target)
+                links[posixpath.normpath(member.name)] = posixpath.normpath(target)
+                continue
+            if not member.isfile():
+                continue
+            name = posixpath.normpath(member.name)
+            fp = archive.extractfile(member)  # pylint: disable=invalid-name
+            if is_tarball(fp.peek(512)[:512]):
+                layers[name] = read_layer(fp)
+                sizes[name] = member.size
+            elif member.size <= MAX_DOCUMENT_SIZE:
+                try:
+                    documents[name] = json.loads(fp.read().decode())
+                except ValueError:
+                    pass
+
+    for name, target in links.items():
+        if target in layers:
+            layers[name] = layers[target]
+            sizes[name] = sizes[target]
+        elif target in documents:
+            documents[name] = documents[target]
+    return layers, sizes, documents
+
+
+def format_instruction(created_by):
+    """
+    Format the command that created a layer as a Dockerfile instruction.
+
+    Parameters
+    ----------
+    created_by : str
+        command recorded in the history of the image configuration
+
+    Returns
+    -------
+    instruction : str
+        Dockerfile instruction
+    """
+    instruction = created_by.strip()
+    if instruction.endswith('# buildkit'):
+        instruction = instruction[:-len('# buildkit')].strip()
+    if instruction.startswith('/bin/sh -c #(nop) '):
+        return instruction[len('/bin/sh -c #(nop) '):].strip()
+    for prefix in ['/bin/sh -c ', 'RUN /bin/sh -c ']:
+        if instruction.startswith(prefix):
+            return 'RUN ' + instruction[len(prefix):].strip()
+    return instruction
+
+
+def get_layer_id(name):
+    """
+    Get the id of a layer from the name of its tarball in an archive created by `docker save`.
+
+    Parameters
+    ----------
+    name : str
+        name of the layer tarball, e.g. `<id>/layer.tar` or `blobs/sha256/<id>`
+
+    Returns
+    -------
+    layer_id : str
+        id of the layer
+    """
+    if posixpath.basename(name) == 'layer.tar':
+        name = posixpath.dirname(name)
+    return posixpath.basename(name)
+
+
+def _is_below(path, prefixes):
+    while True:
+        if path in prefixes:
+            return True
+        if path == '/':
+            return False
+        path = posixpath.dirname(path)
+
+
+def analyze_image(layer_names, layers, sizes, config=None, top=10):
+    """
+    Analyze the layers of an image.
+
+    Files that are overwritten or removed by a later layer and identical files at different paths
+    are counted as wasted because they are transferred when the image is pulled but do not
+    contribute to the file system of the container.
+
+    Parameters
+    ----------
+    layer_names : list[str]
+        names of the layer tarballs of the image from the bottom to the top layer
+    layers : dict[str, list[Entry]]
+        mapping from the names of layer tarballs to their entries
+    sizes : dict[str, int]
+        mapping from the names of layer tarballs to their sizes in bytes
+    config : dict or None
+        image configuration used to determine the instruction that created each layer
+    top : int
+        number of files to report in each category
+
+    Returns
+    -------
+    report : dict
+        analysis of the image
+    """
+    history = [item for item in (config or {}).get('history', []) if not item.get('empty_layer')]
+    if len(history) != len(layer_names):
+        history = [{}] * len(layer_names)
+
+    files = {}
+    overwritten = []
+    summaries = []
+    for index, name in enumerate(layer_names):
+        entries = layers[name]
+        summary = {
+            'id': get_layer_id(name),
+            'size': sizes[name],
+            'files': sum(entry.kind == 'file' for entry in entries),
+            'content_size': sum(entry.size for entry in entries),
+            'wasted': 0,
+            'instruction': format_instruction(history[index].get('created_by', '')),
+        }
+        summaries.append(summary)
+
+        # Whiteouts only apply to lower layers so they are processed before additions
+        removed = {entry.path for entry in entries if entry.kind == 'whiteout'}
+        hidden = {entry.path for entry in entries if entry.kind == 'opaque'}
+        if removed or hidden:
+            for path in list(files):
+                if _is_below(path, removed) or _is_below(posixpath.dirname(path), hidden):
+                    overwritten.append(files.pop(path) + (index, True))
+
+        for entry in entries:
+            if entry.kind in ('whiteout', 'opaque'):
+                continue
+            previous = files.pop(entry.path, None)
+            if previous:
+                overwritten.append(previous + (index, False))
+            if entry.kind == 'file':
+                files[entry.path] = (entry.path, entry.size, entry.digest, index)
+
+    overwritten = [{
+        'path': path,
+        'size': size,
+        'layer': layer,
+        'by': by,
+        'removed': removed,
+    } for path, size, _, layer, by, removed in overwritten if size]
+    for item in overwritten:
+        summaries[item['layer']]['wasted'] += item['size']
+
+    # Group identical files in the final file system
+    groups = collections.defaultdict(list)
+    for path, size, digest, layer in files.values():
+        if size:
+            groups[digest].append((path, size, layer))
+    duplicates = []
+    for items in groups.values():
+        if len(items) > 1:
+            items.sort()
+            size = items[0][1]
+            duplicates.append({
+                'size': size,
+                'wasted': size * (len(items) - 1),
+                'paths': [path for path, _, _ in items],
+                'layers': [layer for _, _, layer in items],
+            })
+
+    largest = sorted(files.values(), key=lambda item: (-item[1], item[0]))[:top]
+    overwritten_size = sum(item['size'] for item in overwritten)
+    duplicate_size = sum(item['wasted'] for item in duplicates)
+    return {
+        'size': sum(summary['size'] for summary in summaries),
+        'content_size': sum(summary['content_size'] for summary in summaries),
+        'wasted': overwritten_size + duplicate_size,
+        'overwritten_size': overwritten_size,
+        'duplicate_size': duplicate_size,
+        'layers': summaries,
+        'largest': [{'path': path, 'size': size, 'layer': layer}
+                    for path, size, _, layer in largest],
+        'overwritten': sorted(overwritten, key=lambda item: (-item['size'], item['path']))[:top],
+        'duplicates': sorted(duplicates, key=lambda item: (-item['wasted'], item['paths']))[:top],
+    }
+
+
+def analyze_archive(fileobj, top=10):
+    """
+    Analyze all images in an archive created by `docker save`.
+
+    Parameters
+    ----------
+    fileobj : file
+        stream of the archive
+    top : int
+        number of files to report in each category
+
+    Returns
+    -------
+    reports : list[dict]
+        analysis of each image in the archive
+    """
+    layers, sizes, documents = read_archive(fileobj)
+    manifest = documents.get('manifest.json')
+    if not isinstance(manifest, list):
+        raise ValueError("the archive does not contain a `manifest.json` created by `docker save`")
+    reports = []
+    for item in manifest:
+        missing = [name for name in item['Layers'] if name not in layers]
+        if missing:
+            raise ValueError("the archive does not contain the layers %s" % ", ".join(missing))
+        report = analyze_image(item['Layers'], layers, sizes, documents.get(item['Config']), top)
+        report['image'] = ", ".join(item.get('RepoTags') or []) or \
+            posixpath.basename(item['Config']).split('.')[0]
+        reports.append(report)
+    return reports
+
+
+def format_bytes(size):
+    """
+    Format a number of bytes for display.
+
+    Parameters
+    ----------
+    size : int
+        number of bytes
+
+    Returns
+    -------
+    text : str
+        size using a binary unit
+    """
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if abs(size) < 1024 or unit == 'GiB':
+            break
+        size /= 1024
+    return '%d %s' % (size, unit) if unit == 'B' else '%.1f %s' % (size, unit)
+
+
+def format_report(report):
+    """
+    Format the analysis of an image for display.
+
+    Parameters
+    ----------
+    report : dict
+        analysis of an image obtained from :func:`analyze_image`
+
+    Returns
+    -------
+    text : str
+        human-readable report
+    """
+    lines = [
+        "image: %s" % report.get('image', '-'),
+        "size: %s in %d layers, %s wasted (%s overwritten or removed, %s duplicated)" % (
+            format_bytes(report['size']), len(report['layers']), format_bytes(report['wasted']),
+            format_bytes(report['overwritten_size']), format_bytes(report['duplicate_size'])),
+        "",
+        "%5s %10s %10s %8s  %s" % ('layer', 'size', 'wasted', 'files', 'instruction'),
+    ]
+    for index, layer in enumerate(report['layers']):
+        lines.append("%5d %10s %10s %8d  %s" % (
+            index, format_bytes(layer['size']), format_bytes(layer['wasted']), layer['files'],
+            layer['instruction'] or layer['id'][:12]))
+
+    lines.extend(["", "largest files:", "%10s %5s  %s" % ('size', 'layer', 'path')])
+    lines.extend("%10s %5d  %s" % (format_bytes(item['size']), item['layer'], item['path'])
+                 for item in report['largest'])
+
+    if report['overwritten']:
+        lines.extend(["", "overwritten or removed files:",
+                      "%10s %5s %5s  %s" % ('size', 'layer', 'by', 'path')])
+        lines.extend("%10s %5d %5d  %s%s" % (
+            format_bytes(item['size']), item['layer'], item['by'], item['path'],
+            ' (removed)' if item['removed'] else '') for item in report['overwritten'])
+
+    if report['duplicates']:
+        lines.extend(["", "duplicated files:", "%10s %10s  %s" % ('size', 'wasted', 'paths')])
+        lines.extend("%10s %10s  %s" % (format_bytes(item['size']), format_bytes(item['wasted']),
+                                        ", ".join(item['paths'])) for item in report['duplicates'])
+    return "\n".join(lines)
@@ -17,5 +17,18 @@ from .base import Plugin, BasePlugin, HomeDirPlugin, SubstitutionPlugin, Workspa
 from .user import UserPlugin
 from .run import RunPlugin, RunConfigurationPlugin
 from .build import BuildPlugin, BuildConfigurationPlugin
-from .python import JupyterPlugin
+from .python import JupyterPlugin, PythonBuildPlugin
 from .google import GoogleCloudCredentialsPlugin, GoogleContainerRegistryPlugin
+from .history import HistoryPlugin
+from .cpuset import CpusetPlugin
+from .shm import SharedMemoryPlugin
+from .cache import CachePlugin, CachePrunePlugin
+from .git import GitCachePlugin
+from .images import ImagesPlugin
+from .compile import CompilePlugin
+from .measure import MeasurePlugin
+from .layers import ImageAnalyzePlugin
+from .endpoints import EndpointPlugin
+from .jobs import QueuePlugin, QueueServePlugin
+from .datasets import DatasetPlugin
+from .gc import LabelPlugin, GarbageCollectionPlugin
@@ -18,14 +18,74 @@ import itertools as it
 import logging
 import os
 import re
-
-import jsonschema
-import pkg_resources
-import yaml
+import time
 
 from .. import util
 
 
+def iter_entry_points(group):
+    """
+    Iterate over the entry points of a group.
+
+    Parameters
+    ----------
+    group : str
+        name of the group
+
+    Returns
+    -------
+    entry_points : iterable
+        entry points with attributes `name` and `load`
+    """
+    # `pkg_resources` scans all installed distributions on import so we prefer `importlib.metadata`
+    try:
+        from importlib import metadata
+    except ImportError:  # pragma: no cover
+        import pkg_resources
+        return pkg_resources.iter_entry_points(group)
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        return entry_points.select(group=group)
+    return entry_points.get(group, [])  # pragma: no cover
+
+
+def load_frozen():
+    """
+    Load the frozen plugin registry and schema embedded in a zipapp distribution.
+
+    Returns
+    -------
+    frozen : module or None
+        module with attributes `PLUGINS` (mapping from plugin names to `module:attribute`
+        references) and `SCHEMA` (merged schema of the plugins), or `None` if docker interface was
+        not loaded from a zipapp
+    """
+    try:
+        from .. import _frozen
+    except ImportError:
+        return None
+    return _frozen
+
+
+def load_object(reference):
+    """
+    Load an object given a reference of the form `module:attribute`.
+
+    Parameters
+    ----------
+    reference : str
+        reference to the object
+
+    Returns
+    -------
+    obj :
+        referenced object
+    """
+    import importlib
+    module, _, attribute = reference.partition(':')
+    return getattr(importlib.import_module(module), attribute)
+
+
 class Plugin:
     """
     Abstract base class for plugins.
@@ -127,13 +187,17 @@ class Plugin:
             mapping from plugin names to plugin classes
         """
         plugin_cls = {}
-        for entry_point in pkg_resources.iter_entry_points('docker_interface.plugins'):
-            cls = entry_point.load()
-            assert cls.COMMANDS is not None, \
-                "plugin '%s' does not define its commands" % entry_point.name
-            assert cls.ORDER is not None, \
-                "plugin '%s' does not define its priority" % entry_point.name
-            plugin_cls[entry_point.name] = cls
+        frozen = load_frozen()
+        if frozen is not None:
+            for name, reference in frozen.PLUGINS.items():
+                plugin_cls[name] = load_object(reference)
+        for entry_point in iter_entry_points('docker_interface.plugins'):
+            # Built-in plugins of a zipapp take precedence over an installed copy of the package
+            if entry_point.name not in plugin_cls:
+                plugin_cls[entry_point.name] = entry_point.load()
+        for name, cls in plugin_cls.items():
+            assert cls.COMMANDS is not None, "plugin '%s' does not define its commands" % name
+            assert cls.ORDER is not None, "plugin '%s' does not define its priority" % name
         return plugin_cls
 
     def cleanup(self):
@@ -144,6 +208,38 @@ class Plugin:
         """
         pass
 
+    def handoff(self):
+        """
+        Get commands that release the resources of the plugin once the container has exited.
+
+        Inheriting plugins that release resources in :code:`cleanup` should implement this method
+        to support replacing the docker interface process with the docker CLI. The commands are
+        executed by a supervisor process instead of calling :code:`cleanup`.
+
+        Returns
+        -------
+        commands : list[list[str]]
+            sequence of commands
+        """
+        return []
+
+    def compile(self, configuration, launcher):
+        """
+        Contribute to a launcher script compiled from the configuration.
+
+        Inheriting plugins should implement this method if they compute values that depend on the
+        invocation, e.g. by replacing such values in the configuration with placeholders and adding
+        the shell code to compute them to the launcher.
+
+        Parameters
+        ----------
+        configuration : dict
+            configuration after all plugins have been applied
+        launcher : docker_interface.launcher.Launcher
+            launcher to contribute to
+        """
+        pass
+
 class ValidationPlugin(Plugin):
     """
     Validate the configuration document.
@@ -153,6 +249,7 @@ class ValidationPlugin(Plugin):
 
     def apply(self, configuration, schema, args):
         super(ValidationPlugin, self).apply(configuration, schema, args)
+        import jsonschema
         validator = jsonschema.validators.validator_for(schema)(schema)
         errors = list(validator.iter_errors(configuration))
         if errors: # pragma: no cover
@@ -169,6 +266,13 @@ class ExecutePlugin(Plugin):
     Inheriting classes should define the method :code:`build_command` which takes a configuration
     document as its only argument.
     """
+    def __init__(self):
+        super(ExecutePlugin, self).__init__()
+        self.started = None
+        self.elapsed = None
+        self.parts = None
+        self.handoff_parts = None
+
     def build_command(self, configuration):
         """
         Construct a command and return its parts.
@@ -187,7 +291,7 @@ class ExecutePlugin(Plugin):
 
     def apply(self, configuration, schema, args):
         super(ExecutePlugin, self).apply(configuration, schema, args)
-        parts = self.build_command(configuration)
+        parts = self.parts = self.build_command(configuration)
         if parts:
             configuration['status-code'] = self.execute_command(parts, configuration['dry-run'])
         else:
@@ -215,7 +319,9 @@ class ExecutePlugin(Plugin):
             return 0
         else:  # pragma: no cover
             self.logger.debug("executing command '%s'", " ".join(map(str, parts)))
+            self.started = time.time()
             status_code = os.spawnvpe(os.P_WAIT, parts[0], parts, os.environ)
+            self.elapsed = time.time() - self.started
             if status_code:
                 self.logger.warning("command '%s' returned status code %d",
                                     " ".join(map(str, parts)), status_code)
@@ -251,6 +357,13 @@ class BasePlugin(Plugin):
                 "description": "Whether to just construct the docker command.",
                 "default": False
             },
+            "config-files": {
+                "type": "array",
+                "description": "Paths of the files the configuration was loaded from (set automatically).",
+                "items": {
+                    "type": "string"
+                }
+            },
             "status-code": {
                 "type": "integer",
                 "description": "status code returned by docker"
@@ -290,26 +403,29 @@ class BasePlugin(Plugin):
     }
 
     def add_arguments(self, parser):
-        parser.add_argument('--file', '-f', help='Configuration file.', default='di.yml')
+        parser.add_argument('--file', '-f', action='append', help='Configuration file; files '
+                            'given later are merged on top of earlier ones (defaults to `di.yml`).')
         self.add_argument(parser, '/workspace')
         self.add_argument(parser, '/docker')
         self.add_argument(parser, '/log-level')
         self.add_argument(parser, '/dry-run')
         parser.add_argument('command', help='Docker interface command to execute.',
-                            choices=['run', 'build'])
+                            choices=['run', 'build', 'history', 'cache', 'compile', 'image',
+                                     'queue', 'gc'])
 
     def apply(self, configuration, schema, args):
         # Load the configuration
-        if configuration is None and os.path.isfile(args.file):
-            filename = os.path.abspath(args.file)
-            with open(filename) as fp:  # pylint: disable=invalid-name
-                configuration = yaml.safe_load(fp)
-            self.logger.debug("loaded configuration from '%s'", filename)
-            dirname = os.path.dirname(filename)
-            configuration['workspace'] = os.path.join(dirname, configuration.get('workspace', '.'))
-        elif configuration is None:
-            raise FileNotFoundError(
-                "missing configuration; could not find configuration file '%s'" % args.file)
+        if configuration is None:
+            filenames = args.file or ['di.yml']
+            for filename in filenames:
+                if not os.path.isfile(filename):
+                    raise FileNotFoundError(
+                        "missing configuration; could not find configuration file '%s'" % filename)
+            from ..config import load_configuration
+            configuration = load_configuration(filenames,
+                                               os.path.join(util.get_cache_dir(), 'configs'))
+            self.logger.debug("loaded configuration from %s", ", ".join(
+                "'%s'" % filename for filename in configuration['config-files']))
 
         configuration = super(BasePlugin, self).apply(configuration, schema, args)
 
@@ -432,9 +548,16 @@ class WorkspaceMountPlugin(Plugin):
 class HomeDirPlugin(Plugin):
     """
     Mount a home directory placed in the current directory.
+
+    The home directory is :code:`/<user name>` unless the :code:`HOME` environment variable is set.
     """
     ORDER = 520
     COMMANDS = ['run']
+    DEFAULT_HOME = '/${user/name}'
+
+    def __init__(self):
+        super(HomeDirPlugin, self).__init__()
+        self.default_home = False
 
     def apply(self, configuration, schema, args):
         super(HomeDirPlugin, self).apply(configuration, schema, args)
@@ -443,5 +566,20 @@ class HomeDirPlugin(Plugin):
             'source': '#{/workspace}/.di/home',
             'type': 'bind',
         })
-        configuration['run'].setdefault('env', {}).setdefault('HOME', '/${user/name}')
+        env = configuration['run'].setdefault('env', {})
+        self.default_home = 'HOME' not in env
+        env.setdefault('HOME', self.DEFAULT_HOME)
         return configuration
+
+    def compile(self, configuration, launcher):
+        if not self.default_home:
+            return
+        # Resolve the home directory again because the user plugin replaces the user name by the
+        # name of the user running the launcher
+        run = configuration['run']
+        home = SubstitutionPlugin.substitute_variables(configuration, self.DEFAULT_HOME,
+                                                       '/run/env/HOME')
+        for mount in run.get('mount', []):
+            if mount['destination'] == run['env']['HOME']:
+                mount['destination'] = home
+        run['env']['HOME'] = home
@@ -22,12 +22,21 @@ class BuildPlugin(ExecutePlugin):
     """
     COMMANDS = ['build']
     ORDER = 1000
-    build_command = staticmethod(build_docker_build_command)
+
+    def build_command(self, configuration):
+        # Images are built by the `ImagesPlugin` if the configuration defines an image graph
+        if configuration.get('images'):
+            return None
+        return build_docker_build_command(configuration)
 
 
 class BuildConfigurationPlugin(Plugin):
     """
     Configure how to build a docker image.
+
+    BuildKit options such as :code:`secret`, :code:`ssh`, and :code:`cache-to` are available unless
+    the :code:`classic` builder is selected. Exporting the cache other than inline (e.g. to a local
+    directory shared between CI workers) requires the :code:`buildx` builder.
     """
     COMMANDS = ['build']
     ORDER = 950
@@ -45,6 +54,13 @@ class BuildConfigurationPlugin(Plugin):
                         "description": "Name and optionally a tag in the 'name:tag' format.",
                         "default": "docker-interface-image"
                     },
+                    "additional-tags": {
+                        "type": "array",
+                        "description": "Additional names and tags in the 'name:tag' format.",
+                        "items": {
+                            "type": "string"
+                        }
+                    },
                     "file": {
                         "type": "string",
                         "description": "Name of the Dockerfile.",
@@ -74,6 +90,65 @@ class BuildConfigurationPlugin(Plugin):
                     "memory": {
                         "type": "string",
                         "description": "Memory limit"
+                    },
+                    "builder": {
+                        "type": "string",
+                        "description": "Builder to use: the default of the docker CLI, the classic builder, BuildKit, or buildx.",
+                        "enum": [
+                            "default",
+                            "classic",
+                            "buildkit",
+                            "buildx"
+                        ],
+                        "default": "default"
+                    },
+                    "target": {
+                        "type": "string",
+                        "description": "Set the target build stage to build."
+                    },
+                    "cache-from": {
+                        "type": "array",
+                        "description": "External cache sources, e.g. an image reference or `type=local,src=path` (paths are relative to the workspace).",
+                        "items": {
+                            "type": "string"
+                        }
+                    },
+                    "cache-to": {
+                        "type": "array",
+                        "description": "Cache export destinations, e.g. `type=inline` or `type=local,dest=path` (exports other than `type=inline` require buildx).",
+                        "items": {
+                            "type": "string"
+                        }
+                    },
+                    "secret": {
+                        "type": "array",
+                        "description": "Secrets to expose to the build, e.g. `id=mysecret,src=path` (requires BuildKit).",
+                        "items": {
+                            "type": "string"
+                        }
+                    },
+                    "ssh": {
+                        "type": "array",
+                        "description": "SSH agent sockets or keys to expose to the build, e.g. `default` (requires BuildKit).",
+                        "items": {
+                            "type": "string"
+                        }
+                    },
+                    "progress": {
+                        "type": "string",
+                        "description": "Type of progress output.",
+                        "enum": [
+                            "auto",
+                            "plain",
+                            "tty"
+                        ]
+                    },
+                    "label": {
+                        "type": "array",
+                        "description": "Set metadata for an image.",
+                        "items": {
+                            "type": "string"
+                        }
                     }
                 },
                 "required": [
@@ -0,0 +1,289 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import json
+import subprocess
+import time
+
+from .base import Plugin
+from .. import usage, util
+
+
+CACHE_KINDS = {
+    'pip': ['PIP_CACHE_DIR'],
+    'conda': ['CONDA_PKGS_DIRS'],
+    'ccache': ['CCACHE_DIR'],
+    'npm': ['npm_config_cache'],
+    'custom': [],
+}
+
+
+def get_cache_volumes(docker):
+    """
+    Get the cache volumes together with their size.
+
+    Parameters
+    ----------
+    docker : str
+        name of the docker CLI
+
+    Returns
+    -------
+    volumes : list[dict]
+        cache volumes with keys `name`, `kind`, `size`, `links`, `created`, and `last_used`
+    """
+    output = subprocess.check_output(
+        docker.split() + ['system', 'df', '--verbose', '--format', '{{json .Volumes}}'],
+        universal_newlines=True
+    )
+    last_used = usage.get_last_used('volume')
+    volumes = []
+    for volume in json.loads(output) or []:
+        labels = usage.parse_labels(volume.get('Labels'))
+        if usage.label('cache') not in labels:
+            continue
+        created = float(labels.get(usage.label('created'), 0))
+        # Docker reports `N/A` if it cannot determine the size or number of links
+        try:
+            size = util.parse_size(volume.get('Size') or 0, 1000)
+        except ValueError:
+            size = 0
+        links = str(volume.get('Links'))
+        volumes.append({
+            'name': volume['Name'],
+            'kind': labels[usage.label('cache')],
+            'size': size,
+            'links': int(links) if links.isdigit() else 0,
+            'created': created,
+            'last_used': last_used.get(volume['Name'], created),
+        })
+    return volumes
+
+
+class CachePlugin(Plugin):
+    """
+    Mount named volumes that persist package and compiler caches across containers and workspaces.
+
+    Each entry of :code:`run/caches` maps a kind of cache (:code:`pip`, :code:`conda`,
+    :code:`ccache`, :code:`npm`, or :code:`custom`) to a named volume which is shared by all
+    workspaces on the host. The plugin sets the environment variables the corresponding tool uses
+    to locate its cache, creates missing volumes, and records when each volume was last used so
+    :code:`di cache prune` can evict the least recently used volumes. New volumes are made writable
+    by all users using the small :code:`HELPER_IMAGE` because the image of the run may not provide
+    :code:`chmod`.
+    """
+    COMMANDS = ['run']
+    ORDER = 530
+    SCHEMA = {
+        "properties": {
+            "run": {
+                "properties": {
+                    "caches": {
+                        "type": "array",
+                        "description": "Persistent caches shared across containers and workspaces.",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "kind": {
+                                    "type": "string",
+                                    "description": "Kind of the cache.",
+                                    "enum": list(CACHE_KINDS)
+                                },
+                                "volume": {
+                                    "type": "string",
+                                    "description": "Name of the volume (defaults to `di-cache-<kind>`)."
+                                },
+                                "path": {
+                                    "type": "string",
+                                    "description": "Path of the cache in the container (required for custom caches)."
+                                },
+                                "env": {
+                                    "type": "array",
+                                    "description": "Additional environment variables set to the path of the cache.",
+                                    "items": {
+                                        "type": "string"
+                                    }
+                                }
+                            },
+                            "required": [
+                                "kind"
+                            ],
+                            "additionalProperties": False
+                        }
+                    }
+                },
+                "additionalProperties": False
+            }
+        },
+        "additionalProperties": False
+    }
+    CACHE_ROOT = '/var/cache/docker-interface'
+    HELPER_IMAGE = 'busybox'
+
+    def __init__(self):
+        super(CachePlugin, self).__init__()
+        self.volumes = []
+
+    def apply(self, configuration, schema, args):
+        super(CachePlugin, self).apply(configuration, schema, args)
+        caches = configuration['run'].get('caches', [])
+        self.volumes = []
+        for cache in caches:
+            kind = cache['kind']
+            if kind == 'custom' and 'path' not in cache:
+                raise ValueError("custom caches require a `path`")
+            path = cache.get('path', '%s/%s' % (self.CACHE_ROOT, kind))
+            volume = cache.get('volume', 'di-cache-%s' % kind)
+            configuration['run'].setdefault('mount', []).append({
+                'type': 'volume',
+                'source': volume,
+                'destination': path,
+            })
+            env = configuration['run'].setdefault('env', {})
+            for name in CACHE_KINDS[kind] + cache.get('env', []):
+                env.setdefault(name, path)
+            self.volumes.append((volume, kind))
+
+        if self.volumes and not configuration['dry-run']:
+            for volume, kind in self.volumes:
+                self.create_volume(configuration, volume, kind)
+            usage.touch('volume', *[volume for volume, _ in self.volumes])
+        return configuration
+
+    def build_volume_commands(self, configuration, volume, kind, created):
+        """
+        Construct the commands to create a cache volume and make it writable by all users.
+
+        Parameters
+        ----------
+        configuration : dict
+            configuration
+        volume : str
+            name of the volume
+        kind : str
+            kind of the cache
+        created : float or str
+            creation time of the volume
+
+        Returns
+        -------
+        commands : list[list[str]]
+            sequence of commands
+        """
+        docker = configuration['docker'].split()
+        labels = dict(configuration.get('labels', {}))
+        labels.update({usage.label('cache'): kind, usage.label('created'): created})
+        options = []
+        for item in labels.items():
+            options.extend(['--label', '%s=%s' % item])
+        # New volumes are owned by root but the container may run as the host user
+        return [
+            docker + ['volume', 'create'] + options + [volume],
+            docker + [
+                'run', '--rm', '--user=0', '--mount=type=volume,source=%s,destination=/cache' %
+                volume, self.HELPER_IMAGE, 'chmod', '1777', '/cache'
+            ],
+        ]
+
+    def create_volume(self, configuration, volume, kind):
+        """
+        Create a cache volume if it does not exist and make it writable by all users.
+
+        Parameters
+        ----------
+        configuration : dict
+            configuration
+        volume : str
+            name of the volume
+        kind : str
+            kind of the cache
+        """
+        docker = configuration['docker'].split()
+        if not subprocess.call(docker + ['volume', 'inspect', volume], stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL):
+            return
+        self.logger.info("creating cache volume '%s'", volume)
+        create, chmod = self.build_volume_commands(configuration, volume, kind,
+                                                   '%f' % time.time())
+        subprocess.check_call(create, stdout=subprocess.DEVNULL)
+        if subprocess.call(chmod):
+            self.logger.warning("could not make cache volume '%s' writable by all users; the cache "
+                                "may not be usable if the container does not run as root", volume)
+
+    def compile(self, configuration, launcher):
+        docker = configuration['docker'].split()
+        created = launcher.variable('DI_NOW', 'date +%s')
+        for volume, kind in self.volumes:
+            create, chmod = self.build_volume_commands(configuration, volume, kind, created)
+            warning = "could not make cache volume '%s' writable by all users" % volume
+            launcher.add_line('%s > /dev/null 2>&1 || { %s > /dev/null && { %s || echo %s >&2; }; }'
+                              % (launcher.join(docker + ['volume', 'inspect', volume]),
+                                 launcher.join(create), launcher.join(chmod),
+                                 launcher.quote(warning)))
+
+
+class CachePrunePlugin(Plugin):
+    """
+    List cache volumes or remove the least recently used cache volumes until their total size is
+    within the budget :code:`cache-budget`.
+    """
+    COMMANDS = ['cache']
+    ORDER = 1000
+    SCHEMA = {
+        "properties": {
+            "cache-budget": {
+                "type": "string",
+                "description": "Maximum total size of cache volumes kept by `di cache prune`.",
+                "default": "20g"
+            }
+        },
+        "additionalProperties": False
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['list', 'prune'], help='Cache command to execute.')
+        self.add_argument(parser, '/cache-budget', name='--budget')
+
+    def apply(self, configuration, schema, args):
+        super(CachePrunePlugin, self).apply(configuration, schema, args)
+        volumes = get_cache_volumes(configuration['docker'])
+        if args.action == 'list':
+            print("%-32s %-8s %10s %6s  %s" % ('volume', 'kind', 'size', 'links', 'last used'))
+            for volume in sorted(volumes, key=lambda volume: -volume['last_used']):
+                print("%-32s %-8s %10s %6d  %s" % (
+                    volume['name'], volume['kind'], util.format_size(volume['size']),
+                    volume['links'],
+                    datetime.datetime.fromtimestamp(volume['last_used']).isoformat(' ', 'seconds')))
+            return configuration
+
+        # Volumes that are in use cannot be removed
+        budget = util.parse_size(configuration['cache-budget'])
+        budget -= sum(volume['size'] for volume in volumes if volume['links'])
+        volumes = [volume for volume in volumes if not volume['links']]
+        evictions = usage.select_evictions(volumes, budget)
+        for volume in evictions:
+            if configuration['dry-run']:
+                self.logger.info("dry-run removal of cache volume '%s' (%s)", volume['name'],
+                                 util.format_size(volume['size']))
+                continue
+            status = subprocess.call(configuration['docker'].split() + ['volume', 'rm',
+                                                                        volume['name']])
+            if status:
+                self.logger.warning("could not remove cache volume '%s'", volume['name'])
+            else:
+                self.logger.info("removed cache volume '%s' (%s)", volume['name'],
+                                 util.format_size(volume['size']))
+                usage.forget('volume', volume['name'])
+        return configuration
@@ -0,0 +1,73 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import os
+
+from .base import Plugin
+
+
+class CompilePlugin(Plugin):
+    """
+    Compile a command into a launcher script that runs the resolved docker command without starting
+    docker interface.
+
+    The plugins of the compiled command are applied once in dry-run mode. Values that depend on the
+    invocation, such as the host user, the detection of a terminal, or the port and token of a
+    notebook server, are computed by shell code when the launcher runs. The launcher refuses to run
+    if the configuration file has changed since it was compiled and appends its arguments to the
+    command run in the container. Invocations of the launcher are not recorded in the history.
+    """
+    COMMANDS = ['compile']
+    ORDER = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help='Path of the launcher (defaults to '
+                            '`di-<command>.sh` in the workspace).')
+        parser.add_argument('target', help='Docker interface command to compile.', choices=['run'])
+        parser.add_argument('args', nargs=argparse.REMAINDER,
+                            help='Arguments of the command to compile.')
+
+    def apply(self, configuration, schema, args):
+        super(CompilePlugin, self).apply(configuration, schema, args)
+        from ..launcher import Launcher
+        from ..session import Session
+
+        launcher = Launcher(args.target)
+        session = Session()
+        with session.prepare(configuration, {'/dry-run': True}, args.args,
+                             args.target) as preparation:
+            resolved = preparation.configuration
+            for plugin in preparation.plugins:
+                plugin.compile(resolved, launcher)
+            # Construct the main command again to pick up the placeholders
+            commands = [parts for _, parts in preparation.commands[:-1]]
+            plugin, _ = preparation.commands[-1]
+            commands.append(plugin.build_command(resolved))
+
+        filenames = configuration.get('config-files', [])
+        if not filenames:
+            self.logger.warning("the configuration was not loaded from a file; the launcher cannot "
+                                "detect changes of the configuration")
+        for filename in filenames:
+            launcher.add_input(filename)
+
+        output = args.output or os.path.abspath(
+            os.path.join(configuration['workspace'], 'di-%s.sh' % args.target))
+        if configuration['dry-run']:
+            self.logger.info("dry-run launcher '%s':\n%s", output, launcher.render(commands))
+        else:
+            launcher.write(output, commands)
+            self.logger.info("compiled launcher '%s'", output)
+        return configuration
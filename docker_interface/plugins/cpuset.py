@@ -0,0 +1,266 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import glob
+import os
+import re
+import time
+
+from .base import Plugin
+from .. import util
+
+
+def parse_cpu_list(text):
+    """
+    Parse a list of CPUs in the kernel's list format.
+
+    Parameters
+    ----------
+    text : str
+        comma-separated list of CPUs or ranges of CPUs (e.g. `0-3,8-11`)
+
+    Returns
+    -------
+    cpus : list[int]
+        sorted list of CPUs
+    """
+    cpus = set()
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        start, _, stop = part.partition('-')
+        cpus.update(range(int(start), int(stop or start) + 1))
+    return sorted(cpus)
+
+
+def format_cpu_list(cpus):
+    """
+    Format a list of CPUs in the kernel's list format.
+
+    Parameters
+    ----------
+    cpus : list[int]
+        list of CPUs
+
+    Returns
+    -------
+    text : str
+        comma-separated list of CPUs or ranges of CPUs
+    """
+    parts = []
+    for cpu in sorted(cpus):
+        if parts and parts[-1][1] == cpu - 1:
+            parts[-1][1] = cpu
+        else:
+            parts.append([cpu, cpu])
+    return ",".join(str(start) if start == stop else "%d-%d" % (start, stop)
+                    for start, stop in parts)
+
+
+def read_topology(root='/sys/devices/system'):
+    """
+    Read the CPU topology of the host.
+
+    Parameters
+    ----------
+    root : str
+        path of the sysfs system directory
+
+    Returns
+    -------
+    topology : dict[int, list[int]]
+        mapping from NUMA nodes to the online CPUs of each node ordered such that hyperthreads
+        sharing a physical core are adjacent
+    """
+    with open(os.path.join(root, 'cpu', 'online')) as fp:
+        online = set(parse_cpu_list(fp.read()))
+
+    topology = {}
+    for path in glob.glob(os.path.join(root, 'node', 'node*')):
+        match = re.search(r'node(\d+)$', path)
+        if match and os.path.isfile(os.path.join(path, 'cpulist')):
+            with open(os.path.join(path, 'cpulist')) as fp:
+                cpus = online.intersection(parse_cpu_list(fp.read()))
+            if cpus:
+                topology[int(match.group(1))] = cpus
+    # Fall back to a single node if the kernel does not expose NUMA information
+    if not topology:
+        topology[0] = online
+
+    def _core(cpu):
+        try:
+            with open(os.path.join(root, 'cpu', 'cpu%d' % cpu, 'topology',
+                                   'thread_siblings_list')) as fp:
+                return parse_cpu_list(fp.read())[0], cpu
+        except (OSError, ValueError, IndexError):
+            return cpu, cpu
+
+    return {node: sorted(cpus, key=_core) for node, cpus in topology.items()}
+
+
+def allocate_cpus(topology, leased, cores):
+    """
+    Allocate CPUs that are not leased, preferring a single NUMA node.
+
+    Parameters
+    ----------
+    topology : dict[int, list[int]]
+        mapping from NUMA nodes to CPUs as returned by :func:`read_topology`
+    leased : set[int]
+        CPUs that are already leased
+    cores : int
+        number of CPUs to allocate
+
+    Returns
+    -------
+    cpus : list[int]
+        allocated CPUs
+    mems : list[int]
+        NUMA nodes of the allocated CPUs
+
+    Raises
+    ------
+    RuntimeError
+        if there are not enough free CPUs
+    """
+    free = {node: [cpu for cpu in cpus if cpu not in leased] for node, cpus in topology.items()}
+    # Use the node with the fewest free CPUs that can satisfy the request to limit fragmentation
+    candidates = [node for node, cpus in free.items() if len(cpus) >= cores]
+    if candidates:
+        node = min(candidates, key=lambda node: (len(free[node]), node))
+        return free[node][:cores], [node]
+
+    # Span as few nodes as possible otherwise
+    cpus, mems = [], []
+    for node in sorted(free, key=lambda node: (-len(free[node]), node)):
+        if not free[node]:
+            break
+        cpus.extend(free[node][:cores - len(cpus)])
+        mems.append(node)
+        if len(cpus) == cores:
+            return cpus, sorted(mems)
+
+    raise RuntimeError("cannot allocate %d CPUs; only %d of %d CPUs are not leased" % (
+        cores, len(cpus), sum(map(len, topology.values()))))
+
+
+class CpusetPlugin(Plugin):
+    """
+    Pin containers to disjoint sets of CPUs and NUMA nodes.
+
+    If :code:`run/cpuset/cores` is set, the plugin reads the host topology from sysfs and assigns
+    :code:`cpuset-cpus` and :code:`cpuset-mems` such that the container runs on CPUs that are not
+    used by any other container started by docker interface on the same host. CPUs are leased in a
+    lock file shared by the invocations of all users and leases are released when the invocation
+    ends (or discarded if the process that acquired them no longer exists). Launchers compiled using
+    :code:`di compile` cannot lease CPUs so runs that set :code:`run/cpuset/cores` cannot be
+    compiled.
+    """
+    COMMANDS = ['run']
+    ORDER = 940
+    SCHEMA = {
+        "properties": {
+            "run": {
+                "properties": {
+                    "cpuset": {
+                        "type": "object",
+                        "description": "Topology-aware assignment of CPUs to the container.",
+                        "properties": {
+                            "cores": {
+                                "type": "integer",
+                                "description": "Number of CPUs to pin the container to.",
+                                "minimum": 1
+                            },
+                            "lease-file": {
+                                "type": "string",
+                                "description": "Lock file shared by all invocations on the host to keep track of leased CPUs (defaults to `cpuset.json` in the shared state directory, `/tmp/docker-interface`)."
+                            }
+                        },
+                        "additionalProperties": False
+                    }
+                },
+                "additionalProperties": False
+            }
+        },
+        "additionalProperties": False
+    }
+    SYSFS_ROOT = '/sys/devices/system'
+
+    def __init__(self):
+        super(CpusetPlugin, self).__init__()
+        self.lease_file = None
+        self.lease = None
+        self.allocated = False
+
+    def add_arguments(self, parser):
+        self.add_argument(parser, '/run/cpuset/cores')
+
+    def apply(self, configuration, schema, args):
+        super(CpusetPlugin, self).apply(configuration, schema, args)
+        cpuset = configuration['run'].get('cpuset', {})
+        cores = cpuset.get('cores')
+        if not cores:
+            return configuration
+        if 'cpuset-cpus' in configuration['run']:
+            self.logger.warning("ignoring `run/cpuset/cores` because `run/cpuset-cpus` is set")
+            return configuration
+        if not util.is_local_endpoint(configuration):
+            self.logger.warning("ignoring `run/cpuset/cores` because docker endpoint '%s' does not "
+                                "run on this host", configuration['endpoint']['name'])
+            return configuration
+
+        topology = read_topology(self.SYSFS_ROOT)
+        lease_file = cpuset.get('lease-file') or \
+            os.path.join(util.get_shared_dir(), 'cpuset.json')
+        # Other users must be able to lease CPUs
+        with util.locked_json(lease_file, {'leases': []}, 0o666) as state:
+            # Discard leases of processes that no longer exist
+            state['leases'] = [lease for lease in state['leases']
+                               if util.is_process_alive(lease['pid'])]
+            leased = {cpu for lease in state['leases'] for cpu in lease['cpus']}
+            cpus, mems = allocate_cpus(topology, leased, cores)
+            if not configuration['dry-run']:
+                self.lease = {
+                    'pid': os.getpid(),
+                    'cpus': cpus,
+                    'mems': mems,
+                    'time': time.time(),
+                }
+                state['leases'].append(self.lease)
+                self.lease_file = lease_file
+
+        self.allocated = True
+        configuration['run']['cpuset-cpus'] = format_cpu_list(cpus)
+        configuration['run']['cpuset-mems'] = format_cpu_list(mems)
+        self.logger.debug("pinned container to cpus %s on nodes %s",
+                          configuration['run']['cpuset-cpus'], configuration['run']['cpuset-mems'])
+        return configuration
+
+    def compile(self, configuration, launcher):
+        # Pinning containers without a lease would overlap with concurrent runs
+        if self.allocated:
+            raise ValueError("cannot compile a launcher for runs that set `run/cpuset/cores` "
+                             "because the launcher cannot lease CPUs; set `run/cpuset-cpus` "
+                             "instead")
+
+    def handoff(self):
+        # The lease expires when the process holding it exits, and the docker CLI inherits its pid
+        return []
+
+    def cleanup(self):
+        if self.lease_file:
+            with util.locked_json(self.lease_file, {'leases': []}) as state:
+                # A process may hold several leases if it runs containers concurrently
+                state['leases'] = [lease for lease in state['leases'] if lease != self.lease]
+            self.lease_file = None
@@ -0,0 +1,188 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from .base import Plugin, SubstitutionPlugin
+from .. import util
+
+
+class DatasetPlugin(Plugin):
+    """
+    Mount read-only copies of datasets kept in a host-local cache.
+
+    Each entry of :code:`run/datasets` is copied (or hardlinked if :code:`mode` is :code:`link`)
+    into the directory :code:`dataset-cache/root` before the container starts. Only files whose
+    size or modification time changed since they were last copied are copied again, using
+    :code:`dataset-cache/workers` parallel copies. Runs that need the same dataset at the same time
+    share a single fill. The least recently used datasets that are not in use are evicted to keep
+    the cache within :code:`dataset-cache/budget`. See :class:`docker_interface.datasets.Dataset`
+    for details.
+    """
+    COMMANDS = ['run']
+    ORDER = 540
+    SCHEMA = {
+        "properties": {
+            "run": {
+                "properties": {
+                    "datasets": {
+                        "type": "array",
+                        "description": "Datasets to copy to a host-local cache and mount read-only.",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "source": {
+                                    "type": "string",
+                                    "description": "Path of the dataset on the host (relative to the workspace)."
+                                },
+                                "destination": {
+                                    "type": "string",
+                                    "description": "Path of the dataset in the container."
+                                },
+                                "mode": {
+                                    "type": "string",
+                                    "description": "Whether to copy files or hardlink them (falling back to copying across file systems).",
+                                    "enum": ["copy", "link"],
+                                    "default": "copy"
+                                }
+                            },
+                            "required": [
+                                "source",
+                                "destination"
+                            ],
+                            "additionalProperties": False
+                        }
+                    }
+                },
+                "additionalProperties": False
+            },
+            "dataset-cache": {
+                "type": "object",
+                "description": "Host-local cache of datasets.",
+                "properties": {
+                    "root": {
+                        "type": "string",
+                        "description": "Directory of the cache which should be on a local disk (defaults to `datasets` in the docker interface cache directory)."
+                    },
+                    "budget": {
+                        "type": "string",
+                        "description": "Maximum total size of the cached datasets.",
+                        "default": "100g"
+                    },
+                    "workers": {
+                        "type": "integer",
+                        "description": "Number of files to copy in parallel.",
+                        "minimum": 1,
+                        "default": 8
+                    }
+                },
+                "additionalProperties": False
+            }
+        },
+        "additionalProperties": False
+    }
+
+    def __init__(self):
+        super(DatasetPlugin, self).__init__()
+        self.datasets = []
+
+    def apply(self, configuration, schema, args):
+        super(DatasetPlugin, self).apply(configuration, schema, args)
+        items = configuration['run'].get('datasets', [])
+        if not items:
+            return configuration
+        from ..datasets import Dataset
+
+        options = configuration['dataset-cache']
+        root = options.get('root')
+        if not root:
+            root = os.path.join(util.get_cache_dir(), 'datasets')
+        local = util.is_local_endpoint(configuration)
+        if not local:
+            self.logger.warning("mounting datasets without caching them because docker endpoint "
+                                "'%s' does not run on this host", configuration['endpoint']['name'])
+
+        self.datasets = []
+        for index, item in enumerate(items):
+            source = SubstitutionPlugin.substitute_variables(configuration, item['source'], '/run')
+            source = os.path.abspath(os.path.join(configuration['workspace'], source))
+            # Check the source in every mode so that dry runs and remote runs fail early as well
+            if not os.path.exists(source):
+                raise ValueError("source '%s' of `run/datasets/%d` (destination '%s') does not "
+                                 "exist" % (source, index, item['destination']))
+            dataset = Dataset(root, source)
+            configuration['run'].setdefault('mount', []).append({
+                'type': 'bind',
+                'source': dataset.path if local else source,
+                'destination': item['destination'],
+                'readonly': True,
+            })
+            self.datasets.append((dataset, item.get('mode', 'copy')))
+
+        if local and not configuration['dry-run']:
+            self.fill(configuration, root)
+        return configuration
+
+    def fill(self, configuration, root):
+        """
+        Evict datasets to make space for the datasets of the run and fill the cache.
+
+        Parameters
+        ----------
+        configuration : dict
+            configuration
+        root : str
+            directory of the cache
+        """
+        from ..datasets import evict, get_manifest
+        from ..layers import format_bytes
+
+        options = configuration['dataset-cache']
+        manifests = []
+        required = 0
+        for dataset, mode in self.datasets:
+            # Prevent eviction of the dataset while the container uses it
+            dataset.acquire('use')
+            manifest = get_manifest(dataset.source)
+            manifests.append(manifest)
+            if mode == 'copy':
+                required += sum(value[0] for value in manifest.values() if value)
+
+        budget = util.parse_size(options['budget'])
+        if required > budget:
+            self.logger.warning("datasets require %s which exceeds the budget of %s",
+                                format_bytes(required), format_bytes(budget))
+        evict(root, budget - required, [dataset.key for dataset, _ in self.datasets])
+
+        for (dataset, mode), manifest in zip(self.datasets, manifests):
+            stats = dataset.fill(manifest, mode == 'link', options['workers'])
+            self.logger.info("cached dataset '%s': copied %d files (%s), linked %d files, removed "
+                             "%d files", dataset.source, stats['copied'],
+                             format_bytes(stats['bytes']), stats['linked'], stats['removed'])
+
+    def handoff(self):
+        # The docker CLI inherits the locks so the datasets are not evicted until it exits
+        for dataset, _ in self.datasets:
+            for lock in dataset.locks.values():
+                os.set_inheritable(lock.fileno(), True)
+        return []
+
+    def cleanup(self):
+        for dataset, _ in self.datasets:
+            dataset.release()
+
+    def compile(self, configuration, launcher):
+        if self.datasets:
+            self.logger.warning("the launcher does not update or protect cached datasets from "
+                                "eviction; run `di run` to update them")
@@ -0,0 +1,146 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+from .base import Plugin, SubstitutionPlugin
+from .. import util
+
+
+class EndpointPlugin(Plugin):
+    """
+    Dispatch containers to the least-loaded of several docker daemons listed in :code:`endpoints`.
+
+    Each endpoint is a :code:`DOCKER_HOST` value such as :code:`tcp://10.0.0.1:2375`, the name of
+    a docker context, or an object with :code:`host` or :code:`context` and optionally
+    :code:`name`. The plugin selects an endpoint based on the number of running containers and the
+    free memory reported by each daemon (see :class:`docker_interface.endpoints.Scheduler`) and
+    adds the corresponding global option to :code:`docker` so that every subsequent docker
+    invocation, including those of other plugins, uses the selected endpoint. Runs in the same
+    process share a scheduler so that concurrent runs of a :class:`docker_interface.Session` are
+    spread across the endpoints. The selected endpoint is stored in :code:`endpoint` together with
+    the host of its docker context, if any, so that other plugins can tell whether the container
+    runs on this host. In a dry run, the endpoints are not queried and the container is not
+    dispatched.
+    """
+    COMMANDS = ['run']
+    ORDER = 3
+    SCHEMA = {
+        "properties": {
+            "endpoints": {
+                "type": "array",
+                "description": "Docker endpoints to dispatch containers to given as `DOCKER_HOST` values, names of docker contexts, or objects.",
+                "items": {
+                    "type": ["string", "object"],
+                    "properties": {
+                        "name": {
+                            "type": "string",
+                            "description": "Name of the endpoint."
+                        },
+                        "host": {
+                            "type": "string",
+                            "description": "Address of the daemon, e.g. `tcp://10.0.0.1:2375`."
+                        },
+                        "context": {
+                            "type": "string",
+                            "description": "Name of a docker context."
+                        }
+                    },
+                    "additionalProperties": False
+                }
+            },
+            "endpoint": {
+                "type": "object",
+                "description": "Endpoint the container was dispatched to (set automatically).",
+                "properties": {
+                    "name": {
+                        "type": "string"
+                    },
+                    "host": {
+                        "type": "string",
+                        "description": "Address of the daemon, resolved from the docker context if necessary."
+                    },
+                    "context": {
+                        "type": "string"
+                    }
+                },
+                "additionalProperties": False
+            }
+        },
+        "additionalProperties": False
+    }
+    SCHEDULERS = {}
+
+    def __init__(self):
+        super(EndpointPlugin, self).__init__()
+        self.scheduler = None
+        self.token = None
+
+    def get_scheduler(self, configuration):
+        """
+        Get the scheduler shared by all runs with the same endpoints.
+
+        Parameters
+        ----------
+        configuration : dict
+            configuration
+
+        Returns
+        -------
+        scheduler : docker_interface.endpoints.Scheduler
+            scheduler
+        """
+        from ..endpoints import Endpoint, Scheduler
+        key = json.dumps([configuration['docker'], configuration['endpoints']], sort_keys=True)
+        scheduler = self.SCHEDULERS.get(key)
+        if scheduler is None:
+            endpoints = [Endpoint.from_configuration(value) for value in configuration['endpoints']]
+            scheduler = self.SCHEDULERS.setdefault(
+                key, Scheduler(endpoints, configuration['docker']))
+        return scheduler
+
+    def apply(self, configuration, schema, args):
+        super(EndpointPlugin, self).apply(configuration, schema, args)
+        if not configuration.get('endpoints'):
+            return configuration
+        if configuration.get('dry-run'):
+            # Do not query the daemons because no container is started
+            from ..endpoints import Endpoint
+            names = [Endpoint.from_configuration(value).name
+                     for value in configuration['endpoints']]
+            self.logger.info("dry-run dispatch of container to the least-loaded of the docker "
+                             "endpoints %s", ", ".join("'%s'" % name for name in names))
+            return configuration
+        run = configuration.get('run', {})
+        try:
+            memory = util.parse_size(run.get('memory') or 0)
+        except ValueError:
+            memory = 0
+        try:
+            image = SubstitutionPlugin.substitute_variables(configuration, run.get('image'), '/run')
+        except KeyError:
+            image = None
+
+        self.scheduler = self.get_scheduler(configuration)
+        endpoint, self.token = self.scheduler.acquire(memory, image)
+        self.logger.info("dispatching container to docker endpoint '%s'", endpoint.name)
+        endpoint.resolve_host(configuration['docker'])
+        configuration['docker'] = endpoint.get_docker(configuration['docker'])
+        configuration['endpoint'] = endpoint.to_configuration()
+        return configuration
+
+    def cleanup(self):
+        if self.token:
+            self.scheduler.release(self.token)
+            self.token = None
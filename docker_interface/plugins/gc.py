@@ -0,0 +1,424 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import json
+import subprocess
+import time
+
+from .base import Plugin
+from .cache import get_cache_volumes
+from .. import history, usage, util
+
+
+def get_containers(docker):
+    """
+    Get the containers created by docker interface.
+
+    Parameters
+    ----------
+    docker : list[str]
+        docker CLI
+
+    Returns
+    -------
+    containers : list[dict]
+        containers with keys `name`, `id`, `state`, `project`, `helper`, and `created`
+    """
+    output = subprocess.check_output(
+        docker + ['container', 'ls', '--all', '--no-trunc', '--filter',
+                  'label=%s' % usage.label('project'), '--format', '{{json .}}'],
+        universal_newlines=True
+    )
+    containers = []
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        container = json.loads(line)
+        labels = usage.parse_labels(container.get('Labels'))
+        containers.append({
+            'name': container['Names'],
+            'id': container['ID'],
+            'state': container.get('State', ''),
+            'project': labels.get(usage.label('project')),
+            'helper': labels.get(usage.label('helper')),
+            'created': float(labels.get(usage.label('created')) or 0),
+        })
+    return containers
+
+
+def get_images(docker):
+    """
+    Get the images built by docker interface together with their size.
+
+    Parameters
+    ----------
+    docker : list[str]
+        docker CLI
+
+    Returns
+    -------
+    images : list[dict]
+        images with keys `name` (the image id), `tags`, `project`, `size`, `created`, and
+        `last_used`
+    """
+    # Intermediate images of the classic builder are omitted because they are removed together with
+    # the images that depend on them
+    ids = subprocess.check_output(
+        docker + ['image', 'ls', '--quiet', '--no-trunc', '--filter',
+                  'label=%s' % usage.label('project')],
+        universal_newlines=True
+    ).split()
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return []
+    output = subprocess.check_output(docker + ['image', 'inspect'] + ids, universal_newlines=True)
+    last_used = usage.get_last_used('image')
+    images = []
+    for image in json.loads(output):
+        labels = (image.get('Config') or {}).get('Labels') or {}
+        tags = image.get('RepoTags') or []
+        created = float(labels.get(usage.label('created')) or 0) or \
+            parse_timestamp(image.get('Created'))
+        images.append({
+            'name': image['Id'],
+            'tags': tags,
+            'project': labels.get(usage.label('project')),
+            'size': image.get('Size', 0),
+            'created': created,
+            'last_used': max([created] + [last_used.get(tag, 0) for tag in tags]),
+        })
+    return images
+
+
+def parse_timestamp(text):
+    """
+    Parse a timestamp reported by docker.
+
+    Parameters
+    ----------
+    text : str or None
+        timestamp in RFC 3339 format, e.g. `2018-01-01T12:00:00.123456789Z`
+
+    Returns
+    -------
+    timestamp : float
+        seconds since the epoch (zero if the timestamp is missing or invalid)
+    """
+    try:
+        value = datetime.datetime.strptime(text[:19], '%Y-%m-%dT%H:%M:%S')
+    except (TypeError, ValueError):
+        return 0
+    # Fractions of a second and offsets other than UTC are ignored
+    return value.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def get_used_images(docker, exclude=None):
+    """
+    Get the images used by containers.
+
+    Parameters
+    ----------
+    docker : list[str]
+        docker CLI
+    exclude : set[str] or None
+        ids of containers to ignore, e.g. because they are about to be removed
+
+    Returns
+    -------
+    images : set[str]
+        ids of the images used by any container on the host
+    """
+    ids = subprocess.check_output(
+        docker + ['container', 'ls', '--all', '--quiet', '--no-trunc'], universal_newlines=True
+    ).split()
+    ids = [id_ for id_ in ids if id_ not in (exclude or ())]
+    if not ids:
+        return set()
+    output = subprocess.check_output(
+        docker + ['container', 'inspect', '--format', '{{.Image}}'] + ids,
+        universal_newlines=True
+    )
+    return set(output.split())
+
+
+def normalize_tag(tag):
+    """
+    Add the implicit `latest` tag to an image name.
+
+    Parameters
+    ----------
+    tag : str
+        name of an image
+
+    Returns
+    -------
+    tag : str
+        name of the image with tag
+    """
+    if '@' in tag or ':' in tag.rsplit('/', 1)[-1]:
+        return tag
+    return '%s:latest' % tag
+
+
+class LabelPlugin(Plugin):
+    """
+    Label containers, images, and volumes created by docker interface so :code:`di gc` can find
+    them.
+
+    Objects are labelled with the workspace (:code:`project`) and a hash of the configuration before
+    other plugins are applied (:code:`config`). Containers and volumes are also labelled with the
+    time they were created (:code:`created`) but images are not because the label would change the
+    image id on every build. Docker does not allow labels to be changed after an object has been
+    created so the time each image was last built or used by :code:`di run` or :code:`di build` is
+    recorded in an index shared by the invocations of all users on the host (see
+    :func:`docker_interface.usage.get_index`) because images and volumes are shared by all users.
+    """
+    COMMANDS = ['run', 'build']
+    ORDER = 4
+    SCHEMA = {
+        "properties": {
+            "labels": {
+                "type": "object",
+                "description": "Labels applied to all containers, images, and volumes docker interface creates (`project`, `config`, and `created` labels are added automatically).",
+                "additionalProperties": {
+                    "type": "string"
+                }
+            }
+        },
+        "additionalProperties": False
+    }
+
+    def apply(self, configuration, schema, args):
+        super(LabelPlugin, self).apply(configuration, schema, args)
+        config_hash = history.hash_configuration({
+            key: value for key, value in configuration.items()
+            if key not in ('docker', 'endpoint', 'labels')
+        })
+        labels = configuration.setdefault('labels', {})
+        labels.setdefault(usage.label('project'), configuration['workspace'])
+        labels.setdefault(usage.label('config'), config_hash[:12])
+        labels.setdefault(usage.label('created'), '%d' % time.time())
+
+        if not configuration['dry-run']:
+            # Values that depend on plugins applied later, e.g. the host user, cannot be resolved
+            tags = [configuration.get('run', {}).get('image'),
+                    configuration.get('build', {}).get('tag')]
+            tags.extend(image.get('tag', name) for name, image in
+                        (configuration.get('images') or {}).items())
+            tags = [normalize_tag(tag) for tag in tags
+                    if tag and '${' not in tag and '#{' not in tag]
+            if tags:
+                usage.touch('image', *tags)
+        return configuration
+
+    def compile(self, configuration, launcher):
+        configuration['labels'][usage.label('created')] = launcher.variable('DI_NOW', 'date +%s')
+
+
+class GarbageCollectionPlugin(Plugin):
+    """
+    Remove leaked containers and evict the least recently used images and cache volumes created by
+    docker interface.
+
+    Stopped containers labelled by docker interface are removed once they are older than
+    :code:`gc/grace` seconds, including helper containers left behind by runs that crashed. Images
+    without tags are removed once they are older than :code:`gc/grace` seconds, and the least
+    recently used images and cache volumes are removed until they fit within :code:`gc/image-budget`
+    and :code:`gc/image-count` or :code:`gc/volume-budget` and :code:`gc/volume-count`,
+    respectively. Images and volumes that are in use are kept. Objects of all workspaces on the host
+    are considered, and at most :code:`gc/concurrency` objects are removed at the same time.
+    """
+    COMMANDS = ['gc']
+    ORDER = 1000
+    SCHEMA = {
+        "properties": {
+            "gc": {
+                "type": "object",
+                "description": "Garbage collection of objects created by docker interface.",
+                "properties": {
+                    "grace": {
+                        "type": "number",
+                        "description": "Minimum age in seconds of stopped containers and untagged images to remove.",
+                        "minimum": 0,
+                        "default": 3600
+                    },
+                    "image-budget": {
+                        "type": "string",
+                        "description": "Maximum total size of images to keep.",
+                        "default": "50g"
+                    },
+                    "image-count": {
+                        "type": "integer",
+                        "description": "Maximum number of images to keep.",
+                        "minimum": 0
+                    },
+                    "volume-budget": {
+                        "type": "string",
+                        "description": "Maximum total size of cache volumes to keep.",
+                        "default": "20g"
+                    },
+                    "volume-count": {
+                        "type": "integer",
+                        "description": "Maximum number of cache volumes to keep.",
+                        "minimum": 0
+                    },
+                    "concurrency": {
+                        "type": "integer",
+                        "description": "Maximum number of objects to remove concurrently.",
+                        "minimum": 1,
+                        "default": 4
+                    }
+                },
+                "additionalProperties": False
+            }
+        },
+        "additionalProperties": False
+    }
+
+    def add_arguments(self, parser):
+        self.add_argument(parser, '/gc/grace')
+        self.add_argument(parser, '/gc/image-budget')
+        self.add_argument(parser, '/gc/image-count')
+        self.add_argument(parser, '/gc/volume-budget')
+        self.add_argument(parser, '/gc/volume-count')
+        self.add_argument(parser, '/gc/concurrency')
+
+    def select(self, configuration, now=None):
+        """
+        Select the objects to remove.
+
+        Parameters
+        ----------
+        configuration : dict
+            configuration
+        now : float or None
+            current time
+
+        Returns
+        -------
+        removals : list[tuple[str, dict]]
+            kinds (`container`, `image`, or `volume`) and objects to remove in order
+        """
+        options = configuration['gc']
+        docker = configuration['docker'].split()
+        now = time.time() if now is None else now
+        removals = []
+
+        containers = get_containers(docker)
+        for container in containers:
+            if container['state'] not in ('running', 'paused', 'restarting') and \
+                    now - container['created'] > options['grace']:
+                removals.append(('container', container))
+        removed = {container['id'] for _, container in removals}
+
+        # Images cannot be removed while containers that are kept use them
+        images = get_images(docker)
+        used = get_used_images(docker, removed) if images else set()
+        budget = util.parse_size(options['image-budget'])
+        count = options.get('image-count')
+        candidates = []
+        for image in images:
+            if image['name'] in used:
+                budget -= image['size']
+                count = None if count is None else count - 1
+            elif not image['tags']:
+                if now - image['created'] > options['grace']:
+                    removals.append(('image', image))
+            else:
+                candidates.append(image)
+        removals.extend(('image', image) for image in usage.select_evictions(
+            candidates, budget, None if count is None else max(count, 0)))
+
+        # Volumes that are in use cannot be removed
+        volumes = get_cache_volumes(configuration['docker'])
+        budget = util.parse_size(options['volume-budget'])
+        count = options.get('volume-count')
+        candidates = []
+        for volume in volumes:
+            if volume['links']:
+                budget -= volume['size']
+                count = None if count is None else count - 1
+            else:
+                candidates.append(volume)
+        removals.extend(('volume', volume) for volume in usage.select_evictions(
+            candidates, budget, None if count is None else max(count, 0)))
+        return removals
+
+    def remove(self, docker, kind, obj):
+        """
+        Remove an object.
+
+        Parameters
+        ----------
+        docker : list[str]
+            docker CLI
+        kind : str
+            kind of the object (`container`, `image`, or `volume`)
+        obj : dict
+            object to remove
+
+        Returns
+        -------
+        removed : bool
+            whether the object was removed
+        """
+        if kind == 'image':
+            # Removing all tags removes the image even if it is referenced by several tags
+            references = obj['tags'] or [obj['name']]
+        else:
+            references = [obj['name']]
+        process = subprocess.run(docker + [kind, 'rm'] + references, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.PIPE, universal_newlines=True)
+        if process.returncode:
+            self.logger.warning("could not remove %s '%s': %s", kind, obj['name'],
+                                process.stderr.strip())
+            return False
+        if kind == 'image':
+            usage.forget('image', *obj['tags'])
+        elif kind == 'volume':
+            usage.forget('volume', obj['name'])
+        return True
+
+    def apply(self, configuration, schema, args):
+        super(GarbageCollectionPlugin, self).apply(configuration, schema, args)
+        import concurrent.futures
+        from ..layers import format_bytes
+
+        docker = configuration['docker'].split()
+        removals = self.select(configuration)
+        for kind, obj in removals:
+            self.logger.info("%s %s '%s'%s", 'dry-run removal of' if configuration['dry-run'] else
+                             'removing', kind, (obj.get('tags') or [obj['name']])[0],
+                             ' (%s)' % format_bytes(obj['size']) if 'size' in obj else '')
+        if configuration['dry-run']:
+            removed = removals
+        else:
+            # Containers are removed first because images cannot be removed while they are in use
+            removed = []
+            phases = [[item for item in removals if item[0] == 'container'],
+                      [item for item in removals if item[0] != 'container']]
+            with concurrent.futures.ThreadPoolExecutor(configuration['gc']['concurrency']) as \
+                    executor:
+                for phase in phases:
+                    statuses = executor.map(lambda item: self.remove(docker, *item), phase)
+                    removed.extend(item for item, status in zip(phase, list(statuses)) if status)
+
+        counts = {kind: sum(1 for item, _ in removed if item == kind)
+                  for kind in ['container', 'image', 'volume']}
+        self.logger.info("%s %d containers, %d images, and %d volumes reclaiming %s",
+                         'would remove' if configuration['dry-run'] else 'removed',
+                         counts['container'], counts['image'], counts['volume'],
+                         format_bytes(sum(obj.get('size', 0) for _, obj in removed)))
+        return configuration
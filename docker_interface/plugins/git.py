@@ -0,0 +1,316 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import re
+import subprocess
+
+from .base import Plugin
+
+
+def git(workspace, *args):
+    """
+    Execute a git command in the workspace.
+
+    Parameters
+    ----------
+    workspace : str
+        path of the workspace
+    args : list[str]
+        arguments of the git command
+
+    Returns
+    -------
+    output : str or None
+        output of the command or `None` if the command failed
+    """
+    try:
+        return subprocess.check_output(['git', '-C', workspace] + list(args),
+                                       stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_repository(tag):
+    """
+    Strip the tag from an image name.
+
+    Parameters
+    ----------
+    tag : str
+        image name in the 'name:tag' format
+
+    Returns
+    -------
+    repository : str
+        image name without tag
+    """
+    name, sep, suffix = tag.rpartition(':')
+    return name if sep and '/' not in suffix else tag
+
+
+def sanitize_tag(value):
+    """
+    Convert a value to a valid docker tag.
+
+    Parameters
+    ----------
+    value : str
+        value to convert, e.g. a branch name
+
+    Returns
+    -------
+    tag : str
+        valid docker tag
+    """
+    return re.sub(r'[^\w.-]', '-', value)[:128]
+
+
+def get_git_tags(workspace, repository, main_branch=None, ancestors=5):
+    """
+    Derive image tags for the current commit and candidate cache sources from the git history.
+
+    Parameters
+    ----------
+    workspace : str
+        path of the git working tree
+    repository : str
+        image repository to derive tags for
+    main_branch : str or None
+        name of the main branch (defaults to the branch `origin/HEAD` refers to, `main`, or
+        `master`)
+    ancestors : int
+        number of first-parent ancestors of the current commit to consider
+
+    Returns
+    -------
+    tags : list[str]
+        tags for the current commit and branch
+    candidates : list[str]
+        candidate cache sources in order of preference: the previous build of the current branch,
+        the builds of ancestors, the build of the merge-base with the main branch, and the latest
+        build of the main branch
+    """
+    commit = git(workspace, 'rev-parse', 'HEAD')
+    if commit is None:
+        return [], []
+    branch = git(workspace, 'rev-parse', '--abbrev-ref', 'HEAD')
+    branch = None if branch == 'HEAD' else branch
+
+    tags = ['%s:git-%s' % (repository, commit)]
+    candidates = []
+    if branch:
+        tags.append('%s:branch-%s' % (repository, sanitize_tag(branch)))
+        candidates.append(tags[-1])
+
+    if ancestors:
+        output = git(workspace, 'rev-list', '--first-parent', '--skip=1',
+                     '--max-count=%d' % ancestors, 'HEAD')
+        candidates.extend('%s:git-%s' % (repository, sha) for sha in (output or '').split())
+
+    if main_branch is None:
+        main_branch = (git(workspace, 'symbolic-ref', '--short', 'refs/remotes/origin/HEAD') or
+                       '').partition('/')[2]
+    names = [main_branch] if main_branch else ['main', 'master']
+    for name, ref in [(name, ref) for name in names for ref in ['origin/%s' % name, name]]:
+        merge_base = git(workspace, 'merge-base', 'HEAD', ref)
+        if merge_base:
+            candidates.extend([
+                '%s:git-%s' % (repository, merge_base),
+                '%s:branch-%s' % (repository, sanitize_tag(name)),
+            ])
+            break
+
+    candidates = [tag for i, tag in enumerate(candidates)
+                  if tag not in tags[:1] and tag not in candidates[:i]]
+    return tags, candidates
+
+
+class GitCachePlugin(Plugin):
+    """
+    Use images built for earlier commits as cache sources.
+
+    The plugin tags each image with the current commit and branch, derives candidate cache sources
+    from the git history of the workspace (see :func:`get_git_tags`), and adds the candidates that
+    exist locally or in the registry to :code:`build/cache-from`. The cache is embedded in the
+    image (:code:`type=inline`) unless :code:`build/cache-to` is set. After a successful build, the
+    plugin reports how many layers of the image were shared with each cache source and optionally
+    pushes the commit and branch tags.
+
+    The cache sources are selected automatically once the plugin is enabled, but the plugin is
+    disabled by default because it adds tags to every image, embeds the cache in the image, and
+    queries the registry for each candidate. Enable it by adding :code:`gitcache` to
+    :code:`plugins`.
+    """
+    COMMANDS = ['build']
+    ENABLED = False
+    ORDER = 985
+    SCHEMA = {
+        "properties": {
+            "build": {
+                "properties": {
+                    "git-cache": {
+                        "type": "object",
+                        "description": "Derive cache sources from the git history.",
+                        "properties": {
+                            "repository": {
+                                "type": "string",
+                                "description": "Image repository for commit and branch tags (defaults to the name of `build/tag`)."
+                            },
+                            "main-branch": {
+                                "type": "string",
+                                "description": "Name of the main branch (detected from `origin/HEAD` by default)."
+                            },
+                            "ancestors": {
+                                "type": "integer",
+                                "description": "Number of ancestors of the current commit to consider.",
+                                "minimum": 0,
+                                "default": 5
+                            },
+                            "limit": {
+                                "type": "integer",
+                                "description": "Maximum number of cache sources.",
+                                "minimum": 0,
+                                "default": 3
+                            },
+                            "pull": {
+                                "type": "boolean",
+                                "description": "Pull cache sources that are only available in the registry (required by the classic builder).",
+                                "default": False
+                            },
+                            "push": {
+                                "type": "boolean",
+                                "description": "Push the commit and branch tags after a successful build.",
+                                "default": False
+                            }
+                        },
+                        "additionalProperties": False
+                    }
+                },
+                "additionalProperties": False
+            }
+        },
+        "additionalProperties": False
+    }
+
+    def __init__(self):
+        super(GitCachePlugin, self).__init__()
+        self.configuration = None
+        self.docker = None
+        self.tags = []
+        self.sources = []
+        self.push = False
+
+    def image_exists(self, ref, remote=False):
+        """
+        Check whether an image exists.
+
+        Parameters
+        ----------
+        ref : str
+            image reference
+        remote : bool
+            whether to check the registry rather than the local image store
+
+        Returns
+        -------
+        exists : bool
+            whether the image exists
+        """
+        args = ['manifest', 'inspect', ref] if remote else ['image', 'inspect', ref]
+        return subprocess.call(self.docker + args, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL) == 0
+
+    def get_layers(self, ref):
+        """
+        Get the layers of a local image.
+
+        Parameters
+        ----------
+        ref : str
+            image reference
+
+        Returns
+        -------
+        layers : list[str] or None
+            digests of the layers or `None` if the image does not exist locally
+        """
+        try:
+            output = subprocess.check_output(
+                self.docker + ['image', 'inspect', '--format={{json .RootFS.Layers}}', ref],
+                stderr=subprocess.DEVNULL, universal_newlines=True)
+        except subprocess.CalledProcessError:
+            return None
+        return json.loads(output) or []
+
+    def apply(self, configuration, schema, args):
+        super(GitCachePlugin, self).apply(configuration, schema, args)
+        build = configuration['build']
+        options = build.get('git-cache', {})
+        repository = options.get('repository') or get_repository(build['tag'])
+        self.tags, candidates = get_git_tags(
+            configuration['workspace'], repository, options.get('main-branch'),
+            options.get('ancestors', 5))
+        if not self.tags:
+            self.logger.warning("workspace '%s' is not a git repository; skipping git cache",
+                                configuration['workspace'])
+            return configuration
+        build.setdefault('additional-tags', []).extend(self.tags)
+
+        # Embed the cache in the image so later builds can use it as a cache source
+        if build.get('builder') != 'classic' and not build.get('cache-to'):
+            build['cache-to'] = ['type=inline']
+
+        self.docker = configuration['docker'].split()
+        if configuration['dry-run']:
+            self.logger.info("candidate cache sources: %s", ", ".join(candidates))
+            return configuration
+
+        for ref in candidates:
+            if len(self.sources) >= options.get('limit', 3):
+                break
+            if self.image_exists(ref):
+                self.sources.append(ref)
+            elif self.image_exists(ref, remote=True):
+                if options.get('pull') and subprocess.call(self.docker + ['pull', '-q', ref]):
+                    continue
+                self.sources.append(ref)
+        self.logger.info("using cache sources: %s", ", ".join(self.sources) or "none")
+        build.setdefault('cache-from', []).extend(self.sources)
+        self.configuration = configuration
+        self.push = options.get('push', False)
+        return configuration
+
+    def cleanup(self):
+        # Only report and push once the image has been built successfully
+        if self.configuration is None or self.configuration.get('status-code'):
+            return
+        layers = self.get_layers(self.tags[0]) or []
+        for ref in self.sources:
+            source = self.get_layers(ref)
+            if source is None:
+                self.logger.info("cache source '%s' is not available locally", ref)
+                continue
+            hits = 0
+            for a, b in zip(layers, source):
+                if a != b:
+                    break
+                hits += 1
+            self.logger.info("cache source '%s' provided %d of %d layers", ref, hits, len(layers))
+
+        # Failing to push does not change the outcome of the build
+        if self.push:
+            for tag in self.tags:
+                if subprocess.call(self.docker + ['push', tag]):
+                    self.logger.warning("could not push '%s'", tag)
@@ -15,7 +15,6 @@
 import contextlib
 import datetime
 import os
-import sqlite3
 from .base import Plugin, ExecutePlugin
 
 
@@ -47,6 +46,7 @@ class GoogleContainerRegistryPlugin(ExecutePlugin):
     def build_command(self, configuration):
         filename = os.path.expanduser('~/.config/gcloud/access_tokens.db')
         if os.path.isfile(filename):
+            import sqlite3
             with contextlib.closing(sqlite3.connect(filename, detect_types=sqlite3.PARSE_DECLTYPES)) as conn, \
                 contextlib.closing(conn.cursor()) as cursor:
                 cursor.execute("SELECT token_expiry FROM access_tokens")
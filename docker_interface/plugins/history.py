@@ -0,0 +1,79 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .base import Plugin
+from ..history import query, summarize
+
+
+class HistoryPlugin(Plugin):
+    """
+    Show percentiles of the time spent in docker interface before executing a command and of the
+    container wall time for each command and image.
+
+    Every :code:`run` and :code:`build` invocation that is not a dry-run appends a row to the SQLite
+    database :code:`.di/history.sqlite` in the workspace. Each row records the id of the image
+    (inspected before the container starts or after the image has been built) so that invocations
+    are summarized separately for each image even if its tag is moved.
+    """
+    COMMANDS = ['history']
+    ORDER = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int,
+                            help='Number of most recent invocations to summarize.')
+        parser.add_argument('--percentiles', type=int, nargs='+', default=[50, 90, 99],
+                            help='Percentiles to report.')
+        parser.add_argument('--plugins', action='store_true',
+                            help='Report the overhead of each plugin.')
+
+    def apply(self, configuration, schema, args):
+        super(HistoryPlugin, self).apply(configuration, schema, args)
+        rows = query(configuration['workspace'], args.limit)
+        if not rows:
+            self.logger.info("no history available for workspace '%s'", configuration['workspace'])
+            return configuration
+
+        header = "/".join("p%d" % q for q in args.percentiles)
+        print("%-8s %-40s %6s %6s  %-24s %-24s" % (
+            'command', 'image', 'runs', 'failed', 'setup %s (s)' % header,
+            'container %s (s)' % header))
+        for item in summarize(rows, args.percentiles):
+            image = item['image'] or '-'
+            if item['image_id']:
+                image = '%s (%s)' % (image, item['image_id'].split(':')[-1][:12])
+            print("%-8s %-40s %6d %6d  %-24s %-24s" % (
+                item['command'], image, item['runs'], item['failures'],
+                self.format_percentiles(item['setup_time']),
+                self.format_percentiles(item['container_time'])))
+            if args.plugins:
+                for name, values in sorted(item['plugin_times'].items()):
+                    print("    %-53s %-24s" % (name, self.format_percentiles(values)))
+        return configuration
+
+    @staticmethod
+    def format_percentiles(values):
+        """
+        Format percentiles for display.
+
+        Parameters
+        ----------
+        values : list[float or None]
+            percentiles in seconds
+
+        Returns
+        -------
+        text : str
+            percentiles separated by slashes
+        """
+        return "/".join('-' if value is None else '%.3f' % value for value in values)
@@ -0,0 +1,381 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import concurrent.futures
+import copy
+import hashlib
+import json
+import os
+import re
+import subprocess
+import time
+
+from .base import ExecutePlugin
+from .build import BuildConfigurationPlugin
+from ..docker_interface import build_docker_build_command
+from .. import util
+
+
+REF_PATTERN = re.compile(r'@\{(?P<name>[^}/]+)(?P<id>/id)?\}')
+FROM_PATTERN = re.compile(r'^\s*FROM\s+(--\S+\s+)*(?P<ref>\S+)', re.IGNORECASE | re.MULTILINE)
+
+
+def get_image_properties():
+    """
+    Get the schema of an image definition derived from the `build` schema.
+
+    Returns
+    -------
+    properties : dict
+        schema properties of an image definition without default values
+    """
+    properties = {}
+    build = util.get_value(BuildConfigurationPlugin.SCHEMA, '/properties/build/properties')
+    for name, property_ in build.items():
+        property_ = dict(property_)
+        property_.pop('default', None)
+        properties[name] = property_
+    properties['depends-on'] = {
+        "type": "array",
+        "description": "Names of images that must be built before this image.",
+        "items": {
+            "type": "string"
+        }
+    }
+    return properties
+
+
+def hash_context(path, memo=None):
+    """
+    Compute a digest of the files in a build context.
+
+    Parameters
+    ----------
+    path : str
+        path of the build context
+    memo : dict or None
+        mapping from paths to `[size, mtime, digest]` used to avoid rehashing unchanged files
+        (updated in place)
+
+    Returns
+    -------
+    digest : str
+        hexadecimal SHA-256 digest of the names and contents of the files in the context (excluding
+        files ignored by `.dockerignore` and `.di` directories)
+    """
+    memo = {} if memo is None else memo
+    patterns = util.read_dockerignore(path)
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(path):
+        # Exclude the state of docker interface because it changes with every build
+        dirnames[:] = sorted(dirname for dirname in dirnames if dirname != '.di')
+        for filename in sorted(filenames):
+            filename = os.path.join(dirpath, filename)
+            relpath = os.path.relpath(filename, path)
+            if util.is_ignored(relpath, patterns) or not os.path.isfile(filename):
+                continue
+            stat = os.stat(filename)
+            key = [stat.st_size, stat.st_mtime_ns]
+            item = memo.get(filename)
+            if item is None or item[:2] != key:
+                file_digest = hashlib.sha256()
+                with open(filename, 'rb') as fp:
+                    for chunk in iter(lambda: fp.read(2 ** 20), b''):
+                        file_digest.update(chunk)
+                item = memo[filename] = key + [file_digest.hexdigest()]
+            digest.update(('%s\0%s\0' % (relpath, item[2])).encode())
+    return digest.hexdigest()
+
+
+def get_dependencies(images, workspace):
+    """
+    Determine the dependencies between images.
+
+    An image depends on another image if it lists it in `depends-on`, references it as `@{name}` or
+    `@{name/id}` in a build argument, or uses its tag in a `FROM` instruction of its Dockerfile.
+
+    Parameters
+    ----------
+    images : dict
+        mapping from image names to image definitions
+    workspace : str
+        path of the workspace
+
+    Returns
+    -------
+    dependencies : dict[str, set[str]]
+        mapping from image names to the names of the images they depend on
+
+    Raises
+    ------
+    KeyError
+        if an image depends on an image that is not defined
+    """
+    tags = {}
+    for name, image in images.items():
+        tag = image.get('tag', name)
+        tags[tag] = name
+        if ':' not in tag.rpartition('/')[2]:
+            tags[tag + ':latest'] = name
+
+    dependencies = {}
+    for name, image in images.items():
+        deps = set(image.get('depends-on', []))
+        for value in image.get('build-arg', {}).values():
+            deps.update(match.group('name') for match in REF_PATTERN.finditer(value))
+        path = os.path.join(workspace, image.get('path', '.'))
+        try:
+            with open(os.path.join(path, image.get('file', 'Dockerfile'))) as fp:
+                deps.update(tags[match.group('ref')] for match in FROM_PATTERN.finditer(fp.read())
+                            if match.group('ref') in tags)
+        except OSError:
+            pass
+        deps.discard(name)
+        for dep in deps:
+            if dep not in images:
+                raise KeyError("image '%s' depends on undefined image '%s'" % (name, dep))
+        dependencies[name] = deps
+    return dependencies
+
+
+def sort_topologically(dependencies):
+    """
+    Sort images such that each image comes after the images it depends on.
+
+    Parameters
+    ----------
+    dependencies : dict[str, set[str]]
+        mapping from image names to the names of the images they depend on
+
+    Returns
+    -------
+    order : list[str]
+        image names in topological order
+
+    Raises
+    ------
+    ValueError
+        if the dependencies are cyclic
+    """
+    order = []
+    remaining = {name: set(deps) for name, deps in dependencies.items()}
+    while remaining:
+        ready = sorted(name for name, deps in remaining.items() if not deps)
+        if not ready:
+            raise ValueError("images have cyclic dependencies: %s" % ", ".join(sorted(remaining)))
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+        order.extend(ready)
+    return order
+
+
+class ImagesPlugin(ExecutePlugin):
+    """
+    Build a graph of images defined in :code:`images`.
+
+    Each entry of :code:`images` accepts the same options as :code:`build` (the tag defaults to the
+    name of the entry and paths are relative to the workspace). Images may depend on one another by
+    listing them in :code:`depends-on`, by using :code:`@{name}` (the tag of an image) or
+    :code:`@{name/id}` (the image id) in a build argument, or by referencing the tag of another image
+    in a :code:`FROM` instruction. Images are built in topological order and independent images are
+    built concurrently. An image is skipped if neither its definition, its build context, nor the
+    ids of the images it depends on have changed since it was last built; fingerprints are kept in
+    :code:`.di/images.json` in the workspace. If :code:`images` is defined, the :code:`build`
+    section is ignored.
+    """
+    COMMANDS = ['build']
+    ORDER = 1001
+    SCHEMA = {
+        "properties": {
+            "images": {
+                "type": "object",
+                "description": "Images to build keyed by name.",
+                "additionalProperties": {
+                    "type": "object",
+                    "properties": get_image_properties(),
+                    "additionalProperties": False
+                }
+            }
+        },
+        "additionalProperties": False
+    }
+    STATE = os.path.join('.di', 'images.json')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', '-j', type=int, default=4,
+                            help='Number of images to build concurrently.')
+        parser.add_argument('--force', action='store_true',
+                            help='Rebuild images even if they have not changed.')
+
+    def build_command(self, configuration):
+        # Image graphs consist of many commands which are executed when the plugin is applied
+        if configuration.get('images'):
+            raise ValueError("image graphs cannot be prepared as a single command; use "
+                             "`Session.apply` instead")
+        return None
+
+    def get_image_id(self, docker, tag):
+        """
+        Get the id of a local image.
+
+        Parameters
+        ----------
+        docker : list[str]
+            docker CLI
+        tag : str
+            name of the image
+
+        Returns
+        -------
+        image_id : str or None
+            id of the image or `None` if the image does not exist
+        """
+        try:
+            return subprocess.check_output(
+                docker + ['image', 'inspect', '--format={{.Id}}', tag],
+                stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+        except subprocess.CalledProcessError:
+            return None
+
+    def execute_build(self, parts, dry_run):
+        """
+        Execute a build command without modifying the state of the plugin so that images can be
+        built on several threads at once.
+
+        Parameters
+        ----------
+        parts : list
+            Sequence of strings constituting a command.
+        dry_run : bool
+            Whether to just log the command instead of executing it.
+
+        Returns
+        -------
+        status : int
+            Status code of the executed command or 0 if `dry_run` is `True`.
+        """
+        if dry_run:
+            self.logger.info("dry-run command '%s'", " ".join(map(str, parts)))
+            return 0
+        self.logger.debug("executing command '%s'", " ".join(map(str, parts)))
+        try:
+            status_code = subprocess.call(parts)
+        except OSError as ex:
+            self.logger.warning("could not execute command '%s': %s", parts[0], ex)
+            return 127
+        if status_code:
+            self.logger.warning("command '%s' returned status code %d",
+                                " ".join(map(str, parts)), status_code)
+        return status_code
+
+    def apply(self, configuration, schema, args):
+        super(ExecutePlugin, self).apply(configuration, schema, args)
+        images = configuration.get('images')
+        if not images:
+            return configuration
+
+        workspace = configuration['workspace']
+        docker = configuration['docker']
+        labels = configuration.get('labels', {})
+        dry_run = configuration['dry-run']
+        dependencies = get_dependencies(images, workspace)
+        order = sort_topologically(dependencies)
+
+        state_path = os.path.join(workspace, self.STATE)
+        try:
+            with open(state_path) as fp:
+                state = json.load(fp)
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault('images', {})
+        memo = state.setdefault('files', {})
+        ids = {}
+
+        def _build(name):
+            image = copy.deepcopy(images[name])
+            image.pop('depends-on', None)
+            image.setdefault('tag', name)
+            image.setdefault('path', '.')
+            image.setdefault('file', 'Dockerfile')
+
+            # Substitute references to the images this image depends on
+            def _substitute(match):
+                dep = match.group('name')
+                return ids[dep] if match.group('id') else images[dep].get('tag', dep)
+            image['build-arg'] = {key: REF_PATTERN.sub(_substitute, value)
+                                  for key, value in image.get('build-arg', {}).items()}
+
+            fingerprint = hashlib.sha256(json.dumps([
+                image, sorted((dep, ids[dep]) for dep in dependencies[name]),
+                hash_context(os.path.join(workspace, image['path']), memo),
+            ], sort_keys=True).encode()).hexdigest()
+
+            previous = state['images'].get(name, {})
+            if not dry_run and not args.force and previous.get('fingerprint') == fingerprint:
+                image_id = self.get_image_id(docker.split(), image['tag'])
+                if image_id and image_id == previous.get('id'):
+                    self.logger.info("skipping unchanged image '%s'", name)
+                    return 0, image_id
+
+            parts = build_docker_build_command({
+                'docker': docker,
+                'workspace': workspace,
+                'build': image,
+                'labels': labels,
+            })
+            status = self.execute_build(parts, dry_run)
+            if status or dry_run:
+                return status, '<id of %s>' % name
+            image_id = self.get_image_id(docker.split(), images[name].get('tag', name))
+            state['images'][name] = {'fingerprint': fingerprint, 'id': image_id}
+            return status, image_id
+
+        started = time.time()
+        status_code = 0
+        pending = {name: set(dependencies[name]) for name in order}
+        with concurrent.futures.ThreadPoolExecutor(max(args.jobs, 1)) as executor:
+            futures = {}
+            while pending or futures:
+                # Submit all images whose dependencies have been built
+                for name in [name for name in order if name in pending and not pending[name]]:
+                    del pending[name]
+                    futures[executor.submit(_build, name)] = name
+                done, _ = concurrent.futures.wait(
+                    futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    name = futures.pop(future)
+                    status, ids[name] = future.result()
+                    if status:
+                        status_code = status
+                        # Skip all images that depend on the failed image
+                        failed = {name}
+                        for other in order:
+                            if other in pending and pending[other] & failed:
+                                failed.add(other)
+                                del pending[other]
+                                self.logger.warning("skipping image '%s' because '%s' failed",
+                                                    other, name)
+                    for deps in pending.values():
+                        deps.discard(name)
+
+        self.started = started
+        self.elapsed = time.time() - started
+        if not dry_run:
+            os.makedirs(os.path.dirname(state_path), exist_ok=True)
+            with open(state_path, 'w') as fp:
+                json.dump(state, fp)
+        configuration['status-code'] = status_code
+        return configuration
@@ -0,0 +1,244 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .base import Plugin
+from .. import util
+
+
+QUEUE_SCHEMA = {
+    "properties": {
+        "queue": {
+            "type": "object",
+            "description": "Wait for admission by a queue that prevents oversubscribing the host.",
+            "properties": {
+                "enabled": {
+                    "type": "boolean",
+                    "description": "Whether to wait for admission before running the container."
+                },
+                "socket": {
+                    "type": "string",
+                    "description": "Path of the socket of the queue shared by all users of the host (defaults to `queue.sock` in the shared state directory, `/tmp/docker-interface`)."
+                },
+                "priority": {
+                    "type": "integer",
+                    "description": "Priority of the job (jobs with higher priority are admitted first).",
+                    "default": 0
+                },
+                "memory": {
+                    "type": "string",
+                    "description": "Memory available to jobs (defaults to the memory of the host)."
+                },
+                "cpus": {
+                    "type": "number",
+                    "description": "Number of CPUs available to jobs (defaults to the CPUs of the host).",
+                    "minimum": 0
+                },
+                "backfill": {
+                    "type": "number",
+                    "description": "Time in seconds after which smaller jobs may no longer be admitted ahead of a waiting job.",
+                    "minimum": 0,
+                    "default": 60
+                }
+            },
+            "additionalProperties": False
+        }
+    },
+    "additionalProperties": False
+}
+
+
+class QueuePlugin(Plugin):
+    """
+    Wait until a queue served by :code:`di queue serve` admits the container.
+
+    If :code:`queue/enabled` is set (or :code:`--queue` is passed), the job declares the memory,
+    CPUs, and CPU shares of the container given by :code:`run/memory`, :code:`run/cpus`, and
+    :code:`run/cpu-shares` and blocks until the queue admits it. The job holds its resources until
+    the container has exited. The plugin runs after validation so that invalid configurations do
+    not wait for admission.
+    """
+    COMMANDS = ['run']
+    ORDER = 995
+    SCHEMA = QUEUE_SCHEMA
+
+    def __init__(self):
+        super(QueuePlugin, self).__init__()
+        self.sock = None
+
+    def add_arguments(self, parser):
+        self.arguments['queue'] = '/queue/enabled'
+        parser.add_argument('--queue', action='store_true', default=None,
+                            help='Wait for admission by the queue before running the container.')
+        self.add_argument(parser, '/queue/priority')
+
+    def apply(self, configuration, schema, args):
+        super(QueuePlugin, self).apply(configuration, schema, args)
+        queue = configuration.get('queue', {})
+        if not queue.get('enabled') or configuration['dry-run']:
+            return configuration
+        if not util.is_local_endpoint(configuration):
+            self.logger.warning("ignoring the queue because docker endpoint '%s' does not run on "
+                                "this host", configuration['endpoint']['name'])
+            return configuration
+
+        from ..jobs import connect, get_socket_path, request
+        queue.setdefault('socket', get_socket_path())
+        run = configuration['run']
+        payload = {
+            'memory': util.parse_size(run['memory']) if run.get('memory') else 0,
+            'cpus': run.get('cpus'),
+            'cpu-shares': run.get('cpu-shares'),
+            'priority': queue['priority'],
+            'name': run.get('name') or run.get('image'),
+        }
+        if not payload['memory']:
+            self.logger.warning("the job does not declare `run/memory` and is admitted regardless "
+                                "of the available memory")
+        try:
+            self.sock = connect(queue['socket'])
+        except OSError:
+            raise ValueError("no queue is served at '%s'; start one using `di queue serve`" %
+                             queue['socket'])
+        self.logger.info("waiting for admission by the queue")
+        try:
+            response = request(self.sock, payload)
+        except ConnectionError as ex:
+            self.cleanup()
+            raise ValueError(str(ex))
+        if 'error' in response:
+            self.cleanup()
+            raise ValueError(response['error'])
+        self.logger.info("admitted by the queue after %.3fs", response['wait'])
+        return configuration
+
+    def handoff(self):
+        # The docker CLI inherits the connection so the job holds its resources until it exits
+        if self.sock:
+            self.sock.set_inheritable(True)
+        return []
+
+    def cleanup(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+
+class QueueServePlugin(Plugin):
+    """
+    Serve a queue that admits containers such that their declared resources do not exceed the
+    capacity of the host (:code:`di queue serve`) or show the state of the queue
+    (:code:`di queue status`).
+
+    The capacity defaults to the memory and the number of CPUs of the host read from :code:`/proc`.
+    See :class:`docker_interface.jobs.JobQueue` for the admission policy. Users are identified by
+    the credentials of the socket so that resources are shared fairly between users.
+    """
+    COMMANDS = ['queue']
+    ORDER = 1000
+    SCHEMA = QUEUE_SCHEMA
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['serve', 'status'], help='Queue command to execute.')
+        self.add_argument(parser, '/queue/socket')
+        self.add_argument(parser, '/queue/memory')
+        self.add_argument(parser, '/queue/cpus')
+        self.add_argument(parser, '/queue/backfill')
+        parser.add_argument('--format', choices=['text', 'json'], default='text',
+                            help='Format of the status.')
+
+    def apply(self, configuration, schema, args):
+        super(QueueServePlugin, self).apply(configuration, schema, args)
+        import asyncio
+        import json
+        from ..jobs import JobQueue, QueueServer, connect, get_socket_path, request
+        from ..layers import format_bytes
+
+        queue = configuration['queue']
+        queue.setdefault('socket', get_socket_path())
+        if args.action == 'status':
+            try:
+                sock = connect(queue['socket'])
+            except OSError:
+                raise ValueError("no queue is served at '%s'" % queue['socket'])
+            with sock:
+                status = request(sock, {'command': 'status'})
+            print(json.dumps(status, indent=2) if args.format == 'json' else
+                  self.format_status(status))
+            return configuration
+
+        memory = util.parse_size(queue['memory']) if queue.get('memory') else \
+            util.get_host_memory()
+        cpus = queue.get('cpus') or util.get_host_cpus()
+        server = QueueServer(JobQueue(memory, cpus, queue['backfill']), queue['socket'])
+        if configuration['dry-run']:
+            self.logger.info("dry-run queue for %s of memory and %g cpus at '%s'",
+                             format_bytes(memory), cpus, queue['socket'])
+            return configuration
+        self.logger.info("serving queue for %s of memory and %g cpus at '%s'",
+                         format_bytes(memory), cpus, queue['socket'])
+        # Use a dedicated event loop rather than `asyncio.run` which requires python 3.7
+        loop = asyncio.new_event_loop()
+        task = loop.create_task(server.serve())
+        try:
+            loop.run_until_complete(task)
+        except KeyboardInterrupt:
+            # Cancel the server so it closes and removes its socket
+            task.cancel()
+            try:
+                loop.run_until_complete(task)
+            except asyncio.CancelledError:
+                pass
+            self.logger.info("stopped serving queue")
+        finally:
+            loop.close()
+        return configuration
+
+    @staticmethod
+    def format_status(status):
+        """
+        Format the status of a queue for display.
+
+        Parameters
+        ----------
+        status : dict
+            status of the queue
+
+        Returns
+        -------
+        text : str
+            human-readable status
+        """
+        from ..layers import format_bytes
+        utilisation = status['utilisation']
+        wait = "/".join('-' if value is None else '%.3f' % value
+                        for value in status['wait'].values())
+        lines = [
+            "memory: %s of %s allocated (%.0f%%, mean %.0f%%)" % (
+                format_bytes(status['allocated']['memory']),
+                format_bytes(status['capacity']['memory']), 100 * utilisation['memory'],
+                100 * utilisation['memory_mean']),
+            "cpus: %g of %g allocated (%.0f%%, mean %.0f%%)" % (
+                status['allocated']['cpus'], status['capacity']['cpus'], 100 * utilisation['cpus'],
+                100 * utilisation['cpus_mean']),
+            "admitted: %d, wait %s (s): %s" % (status['admitted'], "/".join(status['wait']), wait),
+            "",
+            "%-8s %6s %-16s %-24s %10s %6s %8s %10s" % ('state', 'id', 'user', 'name', 'memory',
+                                                       'cpus', 'priority', 'elapsed'),
+        ]
+        for state in ['running', 'pending']:
+            for job in status[state]:
+                lines.append("%-8s %6d %-16s %-24s %10s %6g %8d %10.1f" % (
+                    state, job['id'], job['user'], job['name'] or '-',
+                    format_bytes(job['memory']), job['cpus'], job['priority'], job['elapsed']))
+        return "\n".join(lines)
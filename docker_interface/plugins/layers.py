@@ -0,0 +1,84 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import subprocess
+import sys
+
+from .base import Plugin
+
+
+class ImageAnalyzePlugin(Plugin):
+    """
+    Analyze the layers of an image to find out why it is large.
+
+    :code:`di image analyze [image]` streams the output of :code:`docker save` (or a tarball saved
+    previously using :code:`--input`) without extracting it and reports the size of each layer
+    together with the Dockerfile instruction that created it, the largest files, files that are
+    overwritten or removed by later layers, and identical files at different paths. The image
+    defaults to :code:`build/tag` or :code:`run/image`.
+    """
+    COMMANDS = ['image']
+    ORDER = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['analyze'], help='Image command to execute.')
+        parser.add_argument('image', nargs='?', help='Image to analyze.')
+        parser.add_argument('--input', '-i', help='Tarball created by `docker save` to analyze '
+                            'instead of an image (`-` to read from stdin).')
+        parser.add_argument('--format', choices=['text', 'json'], default='text',
+                            help='Output format.')
+        parser.add_argument('--top', type=int, default=10,
+                            help='Number of files to report in each category.')
+
+    def apply(self, configuration, schema, args):
+        super(ImageAnalyzePlugin, self).apply(configuration, schema, args)
+        import tarfile
+        from ..layers import analyze_archive, format_report
+
+        if args.input:
+            if args.input == '-':
+                reports = analyze_archive(sys.stdin.buffer, args.top)
+            else:
+                with open(args.input, 'rb') as fp:  # pylint: disable=invalid-name
+                    reports = analyze_archive(fp, args.top)
+        else:
+            image = args.image or configuration.get('build', {}).get('tag') or \
+                configuration.get('run', {}).get('image')
+            if not image:
+                raise ValueError("no image to analyze; specify an image or `build/tag`")
+            parts = configuration['docker'].split() + ['save', image]
+            if configuration['dry-run']:
+                self.logger.info("dry-run analysis of '%s' using `%s`", image, " ".join(parts))
+                return configuration
+            process = subprocess.Popen(parts, stdout=subprocess.PIPE)
+            try:
+                reports = analyze_archive(process.stdout, args.top)
+            except (ValueError, tarfile.TarError):
+                if process.wait():
+                    configuration['status-code'] = process.returncode
+                    return configuration
+                raise
+            finally:
+                process.stdout.close()
+            status = process.wait()
+            if status:
+                configuration['status-code'] = status
+                return configuration
+
+        if args.format == 'json':
+            print(json.dumps(reports, indent=2))
+        else:
+            print("\n\n".join(format_report(report) for report in reports))
+        return configuration
@@ -0,0 +1,436 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import glob
+import math
+import os
+import subprocess
+import threading
+import time
+import uuid
+
+from .base import Plugin
+from .. import history, util
+
+
+# Columns of a time series: time since the first sample in seconds, current and peak memory in
+# bytes, cumulative CPU time and throttled time in microseconds, cumulative number of throttled
+# and elapsed CFS enforcement periods, cumulative bytes read and written, and number of processes
+COLUMNS = ['time', 'memory', 'memory_peak', 'cpu_usec', 'throttled_usec', 'throttled_periods',
+           'periods', 'read_bytes', 'write_bytes', 'pids']
+
+
+def get_cgroup_paths(pid, proc_root='/proc', cgroup_root='/sys/fs/cgroup'):
+    """
+    Get the cgroup directories of a process.
+
+    Parameters
+    ----------
+    pid : int
+        process id
+    proc_root : str
+        mount point of procfs
+    cgroup_root : str
+        mount point of the cgroup file systems
+
+    Returns
+    -------
+    paths : dict[str, str]
+        mapping from controllers to directories for cgroup v1 or a mapping with the single key
+        `unified` for cgroup v2
+    """
+    paths = {}
+    with open(os.path.join(proc_root, str(pid), 'cgroup')) as fp:
+        for line in fp:
+            _, controllers, path = line.strip().split(':', 2)
+            if not controllers:
+                paths['unified'] = os.path.join(cgroup_root, path.lstrip('/'))
+                continue
+            for controller in controllers.split(','):
+                paths[controller] = os.path.join(cgroup_root, controllers, path.lstrip('/'))
+    # Hosts with cgroup v1 may also mount an empty unified hierarchy
+    if len(paths) > 1:
+        paths.pop('unified', None)
+    return paths
+
+
+def read_keyed(path):
+    """
+    Read a file of `key value` lines, e.g. `cpu.stat`.
+    """
+    with open(path) as fp:
+        return dict(line.split(None, 1) for line in fp if line.strip())
+
+
+def read_int(path, default=None):
+    """
+    Read a file containing a single integer, returning `default` if it does not exist.
+    """
+    try:
+        with open(path) as fp:
+            return int(fp.read().strip())
+    except (OSError, ValueError):
+        return default
+
+
+def read_sample(paths):
+    """
+    Read the resource usage of a cgroup.
+
+    Parameters
+    ----------
+    paths : dict[str, str]
+        cgroup directories as returned by :func:`get_cgroup_paths`
+
+    Returns
+    -------
+    sample : list[int]
+        values of the columns in :data:`COLUMNS` except `time`
+
+    Raises
+    ------
+    OSError
+        if the cgroup no longer exists
+    """
+    if 'unified' in paths:
+        root = paths['unified']
+        memory = read_int(os.path.join(root, 'memory.current'))
+        if memory is None:
+            raise FileNotFoundError(root)
+        cpu = read_keyed(os.path.join(root, 'cpu.stat'))
+        read_bytes = write_bytes = 0
+        try:
+            with open(os.path.join(root, 'io.stat')) as fp:
+                for line in fp:
+                    stats = dict(item.split('=') for item in line.split()[1:])
+                    read_bytes += int(stats.get('rbytes', 0))
+                    write_bytes += int(stats.get('wbytes', 0))
+        except OSError:
+            pass
+        return [
+            memory,
+            read_int(os.path.join(root, 'memory.peak'), memory),
+            int(cpu['usage_usec']),
+            int(cpu.get('throttled_usec', 0)),
+            int(cpu.get('nr_throttled', 0)),
+            int(cpu.get('nr_periods', 0)),
+            read_bytes,
+            write_bytes,
+            read_int(os.path.join(root, 'pids.current'), 0),
+        ]
+
+    memory = read_int(os.path.join(paths['memory'], 'memory.usage_in_bytes'))
+    if memory is None:
+        raise FileNotFoundError(paths['memory'])
+    cpu = read_keyed(os.path.join(paths['cpu'], 'cpu.stat')) if 'cpu' in paths else {}
+    read_bytes = write_bytes = 0
+    if 'blkio' in paths:
+        try:
+            with open(os.path.join(paths['blkio'], 'blkio.throttle.io_service_bytes')) as fp:
+                for line in fp:
+                    parts = line.split()
+                    if len(parts) == 3 and parts[1] == 'Read':
+                        read_bytes += int(parts[2])
+                    elif len(parts) == 3 and parts[1] == 'Write':
+                        write_bytes += int(parts[2])
+        except OSError:
+            pass
+    return [
+        memory,
+        read_int(os.path.join(paths['memory'], 'memory.max_usage_in_bytes'), memory),
+        read_int(os.path.join(paths.get('cpuacct', ''), 'cpuacct.usage'), 0) // 1000,
+        int(cpu.get('throttled_time', 0)) // 1000,
+        int(cpu.get('nr_throttled', 0)),
+        int(cpu.get('nr_periods', 0)),
+        read_bytes,
+        write_bytes,
+        read_int(os.path.join(paths['pids'], 'pids.current'), 0) if 'pids' in paths else 0,
+    ]
+
+
+class Sampler(threading.Thread):
+    """
+    Sample the resource usage of a container in a background thread.
+
+    The sampler waits for the container to start, reads its cgroup at regular intervals, and stops
+    when the container has exited or :meth:`stop` is called. Each sample reads a handful of small
+    files from the cgroup file system.
+
+    Parameters
+    ----------
+    docker : list[str]
+        docker CLI
+    container : str
+        name of the container
+    interval : float
+        interval between samples in seconds
+    """
+    PROC_ROOT = '/proc'
+    CGROUP_ROOT = '/sys/fs/cgroup'
+
+    def __init__(self, docker, container, interval=1.0):
+        super(Sampler, self).__init__(daemon=True)
+        self.docker = docker
+        self.container = container
+        self.interval = interval
+        self.samples = []
+        self.error = None
+        self._stopped = threading.Event()
+
+    def get_pid(self):
+        """
+        Get the process id of the container or `None` if it is not running.
+        """
+        try:
+            output = subprocess.check_output(
+                self.docker + ['container', 'inspect', '--format', '{{.State.Pid}}',
+                               self.container],
+                stderr=subprocess.DEVNULL, universal_newlines=True)
+        except subprocess.CalledProcessError:
+            return None
+        return int(output.strip()) or None
+
+    def run(self):
+        pid = None
+        while pid is None:
+            if self._stopped.wait(self.interval):
+                return
+            pid = self.get_pid()
+        try:
+            paths = get_cgroup_paths(pid, self.PROC_ROOT, self.CGROUP_ROOT)
+        except OSError as ex:
+            # The daemon may run on another host, e.g. in a virtual machine
+            self.error = "could not locate the cgroup of the container: %s" % ex
+            return
+        started = time.time()
+        while True:
+            try:
+                sample = read_sample(paths)
+            except (OSError, KeyError, ValueError) as ex:
+                # The cgroup is removed once the container has exited
+                if not self.samples:
+                    self.error = "could not read the cgroup of the container: %s" % ex
+                return
+            self.samples.append([round(time.time() - started, 3)] + sample)
+            if self._stopped.wait(self.interval):
+                return
+
+    def stop(self):
+        """
+        Stop sampling and wait for the thread to finish.
+        """
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+
+
+def write_series(path, samples):
+    """
+    Write a time series of samples as a CSV file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as fp:
+        fp.write(",".join(COLUMNS) + "\n")
+        for sample in samples:
+            fp.write(",".join(map(str, sample)) + "\n")
+
+
+def read_series(path):
+    """
+    Read a time series of samples from a CSV file.
+    """
+    with open(path) as fp:
+        header = fp.readline().strip().split(',')
+        return [dict(zip(header, map(float, line.split(',')))) for line in fp if line.strip()]
+
+
+def summarize(samples):
+    """
+    Summarize a time series of samples.
+
+    Parameters
+    ----------
+    samples : list[dict]
+        samples keyed by the names in :data:`COLUMNS`
+
+    Returns
+    -------
+    summary : dict
+        peak memory in bytes, mean and peak CPU usage in cores over sampling intervals, fraction
+        of enforcement periods in which the container was throttled, time throttled in seconds,
+        bytes read and written, and peak number of processes
+    """
+    first, last = samples[0], samples[-1]
+    elapsed = last['time'] - first['time']
+    cores = [(b['cpu_usec'] - a['cpu_usec']) / 1e6 / (b['time'] - a['time'])
+             for a, b in zip(samples, samples[1:]) if b['time'] > a['time']]
+    # Series recorded by earlier versions do not include the number of periods
+    periods = last.get('periods', 0) - first.get('periods', 0)
+    return {
+        'duration': elapsed,
+        'memory_peak': max(max(sample['memory'], sample['memory_peak']) for sample in samples),
+        'cpu_mean': (last['cpu_usec'] - first['cpu_usec']) / 1e6 / elapsed if elapsed else 0,
+        'cpu_peak': max(cores) if cores else 0,
+        'cpu_p95': history.percentile(cores, 95) if cores else 0,
+        # Containers without a CPU quota have no enforcement periods and are never throttled
+        'throttled': (last['throttled_periods'] - first['throttled_periods']) / periods
+        if periods else 0,
+        'throttled_time': (last['throttled_usec'] - first['throttled_usec']) / 1e6,
+        'read_bytes': last['read_bytes'] - first['read_bytes'],
+        'write_bytes': last['write_bytes'] - first['write_bytes'],
+        'pids_peak': max(sample['pids'] for sample in samples),
+    }
+
+
+def recommend(summaries, headroom=1.2, memory_step=64 * 2 ** 20, cpu_step=0.5):
+    """
+    Recommend resource settings given summaries of previous runs.
+
+    Parameters
+    ----------
+    summaries : list[dict]
+        summaries as returned by :func:`summarize`
+    headroom : float
+        factor applied to the peak memory
+    memory_step : int
+        granularity of the recommended memory limit in bytes
+    cpu_step : float
+        granularity of the recommended number of CPUs
+
+    Returns
+    -------
+    settings : dict
+        recommended values of `run/memory`, `run/cpus`, and `run/cpu-shares`
+    """
+    memory = max(summary['memory_peak'] for summary in summaries) * headroom
+    memory = max(math.ceil(memory / memory_step), 1) * memory_step
+    cpus = max(summary['cpu_p95'] for summary in summaries)
+    cpus = max(math.ceil(cpus / cpu_step), 1) * cpu_step
+    return {
+        'memory': util.format_size(memory),
+        'cpus': cpus,
+        'cpu-shares': int(1024 * cpus),
+    }
+
+
+class MeasurePlugin(Plugin):
+    """
+    Sample the resource usage of the container and recommend resource settings.
+
+    If :code:`run/measure/enabled` is set, the plugin reads the memory, CPU, throttling, I/O, and
+    process counters of the container's cgroup (v1 or v2) every :code:`run/measure/interval`
+    seconds. The time series is written to :code:`.di/measurements/<hash>/` in the workspace, where
+    :code:`<hash>` identifies the configuration before plugins are applied. After the run, the
+    plugin prints a summary and recommends :code:`run/memory`, :code:`run/cpus`, and
+    :code:`run/cpu-shares` based on all measured runs of the same configuration. The container
+    is named :code:`di-<random>` unless :code:`run/name` is set so the plugin can find it.
+    """
+    COMMANDS = ['run']
+    ORDER = 5
+    SCHEMA = {
+        "properties": {
+            "run": {
+                "properties": {
+                    "measure": {
+                        "type": "object",
+                        "description": "Sample the resource usage of the container.",
+                        "properties": {
+                            "enabled": {
+                                "type": "boolean",
+                                "description": "Whether to sample the resource usage."
+                            },
+                            "interval": {
+                                "type": "number",
+                                "description": "Interval between samples in seconds.",
+                                "minimum": 0.01,
+                                "default": 1.0
+                            }
+                        },
+                        "additionalProperties": False
+                    }
+                },
+                "additionalProperties": False
+            }
+        },
+        "additionalProperties": False
+    }
+
+    def __init__(self):
+        super(MeasurePlugin, self).__init__()
+        self.sampler = None
+        self.directory = None
+
+    def add_arguments(self, parser):
+        self.arguments['measure'] = '/run/measure/enabled'
+        parser.add_argument('--measure', action='store_true', default=None,
+                            help='Sample the resource usage of the container.')
+
+    def apply(self, configuration, schema, args):
+        super(MeasurePlugin, self).apply(configuration, schema, args)
+        measure = configuration['run'].get('measure', {})
+        if not measure.get('enabled') or configuration['dry-run']:
+            return configuration
+        if not util.is_local_endpoint(configuration):
+            self.logger.warning("cannot measure containers on docker endpoint '%s' because the "
+                                "daemon does not run on this host",
+                                configuration['endpoint']['name'])
+            return configuration
+        # Identify the configuration before other plugins add values that differ between runs and
+        # independently of the endpoint the container is dispatched to
+        config_hash = history.hash_configuration({
+            key: value for key, value in configuration.items()
+            if key not in ('docker', 'endpoint', 'labels')
+        })
+        self.directory = os.path.join(configuration['workspace'], '.di', 'measurements',
+                                      config_hash[:12])
+        if 'name' not in configuration['run']:
+            configuration['run']['name'] = 'di-%s' % uuid.uuid4().hex[:12]
+        self.sampler = Sampler(configuration['docker'].split(), configuration['run']['name'],
+                               measure['interval'])
+        self.sampler.start()
+        return configuration
+
+    def handoff(self):
+        if self.sampler:
+            self.logger.warning("measurements are not supported if the process is replaced")
+        return []
+
+    def cleanup(self):
+        sampler, self.sampler = self.sampler, None
+        if not sampler:
+            return
+        sampler.stop()
+        if sampler.error:
+            self.logger.warning(sampler.error)
+        if len(sampler.samples) < 2:
+            self.logger.warning("not enough samples to summarize the resource usage")
+            return
+        write_series(os.path.join(self.directory, '%d.csv' % time.time()), sampler.samples)
+        summary = summarize([dict(zip(COLUMNS, sample)) for sample in sampler.samples])
+        self.logger.info(
+            "peak memory %.1f MiB, cpu %.2f cores on average (%.2f peak), throttled in %.1f%% of "
+            "periods (%.1fs), read %.1f MiB, wrote %.1f MiB, %d processes at most",
+            summary['memory_peak'] / 2 ** 20, summary['cpu_mean'], summary['cpu_peak'],
+            100 * summary['throttled'], summary['throttled_time'], summary['read_bytes'] / 2 ** 20,
+            summary['write_bytes'] / 2 ** 20, summary['pids_peak'])
+
+        summaries = []
+        for filename in sorted(glob.glob(os.path.join(self.directory, '*.csv'))):
+            series = read_series(filename)
+            if len(series) > 1:
+                summaries.append(summarize(series))
+        settings = recommend(summaries)
+        self.logger.info("recommended settings based on %d measured run(s): memory: %s, cpus: %s, "
+                         "cpu-shares: %d", len(summaries), settings['memory'], settings['cpus'],
+                         settings['cpu-shares'])
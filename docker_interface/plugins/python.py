@@ -12,12 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import fnmatch
+import json
 import os
+import re
+import shlex
 import socket
+import subprocess
 import uuid
 
 from .base import Plugin
-from ..util import get_free_port
+from ..util import get_free_port, is_ignored, read_dockerignore
+
+
+INCLUDE_PATTERN = re.compile(r'^\s*(-r|-c|--requirement|--constraint)(\s*=\s*|\s+)(?P<path>\S+)')
 
 
 class JupyterPlugin(Plugin):
@@ -28,6 +36,10 @@ class JupyterPlugin(Plugin):
     ORDER = 960
     COMMANDS = ['run']
 
+    def __init__(self):
+        super(JupyterPlugin, self).__init__()
+        self.publish = self.token = None
+
     def apply(self, configuration, schema, args):
         cmd = configuration.setdefault('run', {}).get('cmd', [])
         # Check whether the user is starting a notebook
@@ -37,13 +49,17 @@ class JupyterPlugin(Plugin):
                 cmd.append('--no-browser')
             # Open the standard port for the notebook
             free_port = get_free_port(range(8888, 9999))
-            configuration['run'].setdefault('publish', []).append({
+            self.publish = {
                 'container': 8888,
                 'host': free_port,
-            })
+            }
+            configuration['run'].setdefault('publish', []).append(self.publish)
 
-            if not any([x.startswith('--NotebookApp.token=') for x in cmd]):
-                token = uuid.uuid4().hex
+            tokens = [x for x in cmd if x.startswith('--NotebookApp.token=')]
+            if tokens:
+                token = tokens[0].partition('=')[2].strip("'")
+            else:
+                token = self.token = uuid.uuid4().hex
                 cmd.append("--NotebookApp.token='%s'" % token)
 
             self.logger.info(
@@ -54,3 +70,319 @@ class JupyterPlugin(Plugin):
                 cmd.append('--ip=0.0.0.0')
 
         return configuration
+
+    def compile(self, configuration, launcher):
+        if not self.publish:
+            return
+        # Use the first port that does not appear in the list of listening sockets
+        port = launcher.variable(
+            'DI_JUPYTER_PORT', 'listening=$( (ss -Htln || netstat -tln) 2> /dev/null || true); '
+            'i=8888; while echo "$listening" | grep -Eq "[:.]$i[[:space:]]"; do i=$((i + 1)); '
+            'done; echo $i')
+        for publish in configuration['run']['publish']:
+            if publish == self.publish:
+                publish['host'] = port
+        cmd = configuration['run']['cmd']
+        if self.token:
+            token = launcher.variable(
+                'DI_JUPYTER_TOKEN', "od -An -N16 -tx1 /dev/urandom | tr -d ' \\n'")
+            cmd[cmd.index("--NotebookApp.token='%s'" % self.token)] = \
+                "--NotebookApp.token='%s'" % token
+        else:
+            token = [x for x in cmd if x.startswith('--NotebookApp.token=')][0]
+            token = token.partition('=')[2].strip("'")
+        message = "containerized notebook server will be available at http://%s:%s?token=%s" % (
+            launcher.variable('DI_HOSTNAME', 'hostname'), port, token)
+        launcher.add_line('echo %s >&2' % launcher.quote(message))
+
+
+def find_requirements(path, filenames):
+    """
+    Find requirement files and the requirement and constraint files they include.
+
+    Parameters
+    ----------
+    path : str
+        path of the build context
+    filenames : list[str]
+        requirement files relative to the build context
+
+    Returns
+    -------
+    filenames : list[str]
+        requirement files and included files relative to the build context
+    """
+    result = []
+    pending = list(filenames)
+    while pending:
+        filename = os.path.normpath(pending.pop(0))
+        if filename in result:
+            continue
+        result.append(filename)
+        with open(os.path.join(path, filename)) as fp:  # pylint: disable=invalid-name
+            for line in fp:
+                match = INCLUDE_PATTERN.match(line)
+                if match:
+                    pending.append(os.path.join(os.path.dirname(filename), match.group('path')))
+    return result
+
+
+def find_files(path, patterns):
+    """
+    Find files in a build context that match any of the patterns.
+
+    Parameters
+    ----------
+    path : str
+        path of the build context
+    patterns : list[str]
+        glob patterns matched against the names of files
+
+    Returns
+    -------
+    filenames : list[str]
+        sorted files relative to the build context excluding files ignored by `.dockerignore`
+    """
+    ignore = read_dockerignore(path)
+    result = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames[:] = [dirname for dirname in dirnames if dirname not in ('.di', '.git')]
+        for filename in filenames:
+            relpath = os.path.relpath(os.path.join(dirpath, filename), path)
+            if any(fnmatch.fnmatch(filename, pattern) for pattern in patterns) and \
+                    not is_ignored(relpath, ignore):
+                result.append(relpath)
+    return sorted(result)
+
+
+def build_copy_instructions(filenames):
+    """
+    Build `COPY` instructions that preserve the directories of files relative to the working
+    directory.
+
+    Parameters
+    ----------
+    filenames : list[str]
+        files relative to the build context
+
+    Returns
+    -------
+    instructions : list[str]
+        one `COPY` instruction per directory (in JSON form if a path contains whitespace or quotes)
+    """
+    directories = {}
+    for filename in filenames:
+        directories.setdefault(os.path.dirname(filename), []).append(filename)
+    instructions = []
+    for directory, files in sorted(directories.items()):
+        args = files + ['%s/' % (directory or '.')]
+        # Use the JSON form if any path would be split or misread by the Dockerfile parser
+        if any(re.search(r'[\s"\'\\]', arg) for arg in args):
+            instructions.append('COPY %s' % json.dumps(args))
+        else:
+            instructions.append('COPY %s' % " ".join(args))
+    return instructions
+
+
+def generate_dockerfile(options, requirements, extensions, cache_mount):
+    """
+    Generate a Dockerfile for a Python project whose layers are ordered for caching.
+
+    Dependencies are installed first, extensions are compiled in a separate stage, and the source is
+    copied last so that changes to the source only invalidate the last layers.
+
+    Parameters
+    ----------
+    options : dict
+        options from `build/python`
+    requirements : list[str]
+        requirement files relative to the build context
+    extensions : list[str]
+        build scripts and extension sources relative to the build context (empty if the project
+        does not have extensions)
+    cache_mount : bool
+        whether to use BuildKit cache mounts for pip
+
+    Returns
+    -------
+    dockerfile : str
+        contents of the Dockerfile
+    """
+    workdir = options['workdir']
+    if cache_mount:
+        lines = ['# syntax=docker/dockerfile:1']
+        run = 'RUN --mount=type=cache,target=/root/.cache/pip'
+        pip = 'pip install'
+    else:
+        lines = []
+        run = 'RUN'
+        pip = 'pip install --no-cache-dir'
+    lines.extend([
+        '# Generated by docker interface from `build/python`; edit the configuration instead.',
+        'FROM %s AS dependencies' % options['base-image'],
+        'WORKDIR %s' % workdir,
+        'ENV PIP_DISABLE_PIP_VERSION_CHECK=1 PYTHONPATH=%s' % workdir,
+    ])
+    if requirements:
+        lines.extend(build_copy_instructions(requirements))
+        lines.append('%s %s %s' % (run, pip, " ".join(
+            '-r %s' % shlex.quote(filename) for filename in options['requirements'])))
+    if extensions:
+        lines.extend(['', 'FROM dependencies AS extensions'])
+        lines.extend(build_copy_instructions(extensions))
+        lines.append('%s %s setuptools && python setup.py build_ext --build-lib /tmp/extensions' %
+                     (run, pip))
+    lines.extend(['', 'FROM dependencies', 'COPY . .'])
+    if extensions:
+        lines.append('COPY --from=extensions /tmp/extensions/ ./')
+    return "\n".join(lines) + "\n"
+
+
+def supports_buildkit(configuration):
+    """
+    Check whether an image is built using BuildKit.
+
+    The builder and :code:`DOCKER_BUILDKIT` take precedence. Otherwise, the version of the docker
+    daemon is queried unless :code:`dry-run` is set, in which case BuildKit is assumed because it is
+    the default builder of current docker versions.
+
+    Parameters
+    ----------
+    configuration : dict
+        configuration
+
+    Returns
+    -------
+    buildkit : bool
+        whether the image is built using BuildKit
+    """
+    builder = configuration['build'].get('builder', 'default')
+    if builder != 'default':
+        return builder != 'classic'
+    if os.environ.get('DOCKER_BUILDKIT'):
+        return os.environ['DOCKER_BUILDKIT'] != '0'
+    # Nothing is executed in a dry run
+    if configuration.get('dry-run'):
+        return True
+    # BuildKit is the default builder since docker 23.0
+    try:
+        version = subprocess.check_output(
+            configuration['docker'].split() + ['version', '--format', '{{.Server.Version}}'],
+            stderr=subprocess.DEVNULL, universal_newlines=True)
+        return int(version.split('.')[0]) >= 23
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return False
+
+
+class PythonBuildPlugin(Plugin):
+    """
+    Generate a Dockerfile for a Python project whose layers are ordered for caching.
+
+    Requirement files (and the files they include) are copied and installed first. If the project
+    has a :code:`setup.py` and extension sources, the build script and the sources are copied to a
+    separate stage that compiles the extensions. The source is copied last, together with the
+    compiled extensions, so that editing the source only rebuilds the last two layers. The source is
+    available on the :code:`PYTHONPATH` rather than installed. pip caches downloads in a BuildKit
+    cache mount if the image is built using BuildKit.
+
+    The Dockerfile is written to :code:`build/python/file` in the build context and replaces
+    :code:`build/file`. The plugin runs before
+    :class:`docker_interface.plugins.git.GitCachePlugin` so that cache sources are derived for the
+    generated Dockerfile.
+    """
+    COMMANDS = ['build']
+    ENABLED = False
+    ORDER = 984
+    SCHEMA = {
+        "properties": {
+            "build": {
+                "properties": {
+                    "python": {
+                        "type": "object",
+                        "description": "Generate a Dockerfile for a Python project.",
+                        "properties": {
+                            "file": {
+                                "type": "string",
+                                "description": "Path of the generated Dockerfile relative to the build context.",
+                                "default": "Dockerfile.di"
+                            },
+                            "base-image": {
+                                "type": "string",
+                                "description": "Image to install the project in.",
+                                "default": "python:3"
+                            },
+                            "workdir": {
+                                "type": "string",
+                                "description": "Directory of the project in the image.",
+                                "default": "/workspace"
+                            },
+                            "requirements": {
+                                "type": "array",
+                                "description": "Requirement or lock files relative to the build context (defaults to `requirements.txt` if it exists).",
+                                "items": {
+                                    "type": "string"
+                                }
+                            },
+                            "extensions": {
+                                "type": "array",
+                                "description": "Patterns of extension sources that are compiled before the rest of the source is copied.",
+                                "items": {
+                                    "type": "string"
+                                },
+                                "default": ["*.pyx", "*.pxd", "*.c", "*.cc", "*.cpp", "*.h"]
+                            },
+                            "cache-mount": {
+                                "type": "boolean",
+                                "description": "Cache pip downloads in a BuildKit cache mount (detected from the builder by default)."
+                            }
+                        },
+                        "additionalProperties": False
+                    }
+                },
+                "additionalProperties": False
+            }
+        },
+        "additionalProperties": False
+    }
+
+    def apply(self, configuration, schema, args):
+        super(PythonBuildPlugin, self).apply(configuration, schema, args)
+        build = configuration['build']
+        options = build.get('python')
+        if not options:
+            return configuration
+        path = os.path.join(configuration['workspace'], build['path'])
+        if 'requirements' not in options:
+            options['requirements'] = [filename for filename in ['requirements.txt']
+                                       if os.path.isfile(os.path.join(path, filename))]
+        requirements = find_requirements(path, options['requirements'])
+
+        extensions = []
+        if os.path.isfile(os.path.join(path, 'setup.py')):
+            extensions = find_files(path, options['extensions'])
+        if extensions:
+            extensions = [filename for filename in ['setup.py', 'setup.cfg', 'pyproject.toml']
+                          if os.path.isfile(os.path.join(path, filename))] + extensions
+
+        cache_mount = options.get('cache-mount')
+        if cache_mount is None:
+            cache_mount = supports_buildkit(configuration)
+        dockerfile = generate_dockerfile(options, requirements, extensions, cache_mount)
+
+        filename = os.path.join(path, options['file'])
+        # The build file is resolved relative to the build context by the build specification
+        build['file'] = options['file']
+        if configuration['dry-run']:
+            self.logger.info("dry-run generation of '%s':\n%s", filename, dockerfile)
+            return configuration
+        # Only write the Dockerfile if it has changed to avoid invalidating the build context
+        try:
+            with open(filename) as fp:  # pylint: disable=invalid-name
+                unchanged = fp.read() == dockerfile
+        except OSError:
+            unchanged = False
+        if not unchanged:
+            with open(filename, 'w') as fp:  # pylint: disable=invalid-name
+                fp.write(dockerfile)
+            self.logger.info("generated '%s'", filename)
+        return configuration
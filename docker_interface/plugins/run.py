@@ -13,19 +13,88 @@
 # limitations under the License.
 
 import argparse
+import os
 import sys
 from ..docker_interface import build_docker_run_command
-from .. import util
+from ..spec import RunSpec
 from .base import Plugin, ExecutePlugin
+from .. import util
 
 
 class RunPlugin(ExecutePlugin):
     """
     Run a command inside a docker container.
+
+    If the command line arguments would exceed the limit of the operating system (e.g. because
+    the configuration defines thousands of environment variables), environment variables and labels
+    are moved to private temporary files passed using :code:`--env-file` and :code:`--label-file`.
+    The files are removed once the container has exited. A warning is logged if the container
+    bind-mounts paths on this host but runs on a remote docker endpoint.
     """
     COMMANDS = ['run']
     ORDER = 1000
-    build_command = staticmethod(build_docker_run_command)
+
+    def __init__(self):
+        super(RunPlugin, self).__init__()
+        self.spilled = []
+
+    def build_command(self, configuration):
+        # Bind mounts refer to paths on this host, e.g. the workspace and the home directory
+        binds = [mount['source'] for mount in configuration['run'].get('mount', [])
+                 if mount['type'] == 'bind']
+        if binds and not util.is_local_endpoint(configuration):
+            self.logger.warning(
+                "docker endpoint '%s' does not run on this host but the container bind-mounts "
+                "paths on this host (%s); the paths must exist on the docker host",
+                configuration['endpoint']['name'], ", ".join(binds))
+        if configuration['dry-run']:
+            return build_docker_run_command(configuration)
+        # Create missing bind-mount sources because `--mount` does not create them like `--volume`
+        for mount in configuration['run'].get('mount', []):
+            if mount['type'] == 'bind':
+                path = os.path.join(configuration['workspace'], mount['source'])
+                if not os.path.exists(path):
+                    self.logger.debug("creating bind-mount source '%s'", path)
+                    os.makedirs(path)
+        spec, paths = RunSpec.from_configuration(configuration).spill()
+        if paths:
+            self.logger.debug("moved environment variables and labels to %s to fit the command "
+                              "line arguments within `ARG_MAX`", ", ".join(paths))
+            self.spilled.extend(paths)
+        return spec.to_argv()
+
+    def apply(self, configuration, schema, args):
+        watching = configuration['run'].get('watch', {}).get('enabled')
+        if configuration['dry-run'] or not (watching or configuration['run'].get('exec')):
+            return super(RunPlugin, self).apply(configuration, schema, args)
+        # Skip the execution of the command by the base class
+        configuration = super(ExecutePlugin, self).apply(configuration, schema, args)
+        self.parts = self.build_command(configuration)
+        if watching:
+            from ..watch import watch
+            configuration['status-code'] = watch(configuration, self.parts, logger=self.logger)
+        else:
+            # The session replaces the process with the command after applying all plugins
+            self.handoff_parts = self.parts
+            configuration['status-code'] = 0
+        return configuration
+
+    def cleanup(self):
+        for path in self.spilled:
+            try:
+                os.unlink(path)
+            except OSError:  # pragma: no cover
+                pass
+        self.spilled = []
+
+    def handoff(self):
+        return [['rm', '-f'] + self.spilled] if self.spilled else []
+
+    def compile(self, configuration, launcher):
+        for mount in configuration['run'].get('mount', []):
+            if mount['type'] == 'bind' and launcher.SEPARATOR not in mount['source']:
+                path = os.path.abspath(os.path.join(configuration['workspace'], mount['source']))
+                launcher.add_line('mkdir -p %s' % launcher.quote(path))
 
 
 class RunConfigurationPlugin(Plugin):
@@ -85,6 +154,58 @@ class RunConfigurationPlugin(Plugin):
                                 "readonly": {
                                     "type": "boolean",
                                     "description": "Whether to mount the volume read-only."
+                                },
+                                "consistency": {
+                                    "type": "string",
+                                    "description": "Consistency requirements of the mount (only relevant for Docker Desktop).",
+                                    "enum": [
+                                        "default",
+                                        "consistent",
+                                        "cached",
+                                        "delegated"
+                                    ]
+                                },
+                                "bind-propagation": {
+                                    "type": "string",
+                                    "description": "Propagation of bind mounts created in the mount.",
+                                    "enum": [
+                                        "private",
+                                        "rprivate",
+                                        "shared",
+                                        "rshared",
+                                        "slave",
+                                        "rslave"
+                                    ]
+                                },
+                                "volume-nocopy": {
+                                    "type": "boolean",
+                                    "description": "Do not populate a new volume with the data at the destination in the image."
+                                },
+                                "volume-subpath": {
+                                    "type": "string",
+                                    "description": "Path inside the volume to mount instead of the volume root."
+                                },
+                                "volume-driver": {
+                                    "type": "string",
+                                    "description": "Name of the volume driver used to create the volume."
+                                },
+                                "volume-opt": {
+                                    "type": "object",
+                                    "description": "Options passed to the volume driver.",
+                                    "additionalProperties": {
+                                        "type": "string"
+                                    }
+                                },
+                                "tmpfs-size": {
+                                    "type": [
+                                        "integer",
+                                        "string"
+                                    ],
+                                    "description": "Size of the tmpfs mount in bytes or with a unit suffix (e.g. `1g`)."
+                                },
+                                "tmpfs-mode": {
+                                    "type": "integer",
+                                    "description": "File mode of the tmpfs in octal."
                                 }
                             },
                             "required": [
@@ -200,6 +321,13 @@ class RunConfigurationPlugin(Plugin):
                         "type": "array",
                         "description": "Set meta data on a container"
                     },
+                    "label-file": {
+                        "type": "array",
+                        "description": "Read in a line delimited file of labels",
+                        "items": {
+                            "type": "string"
+                        }
+                    },
                     "rm": {
                         "type": "boolean",
                         "description": "Automatically remove the container when it exits",
@@ -214,6 +342,49 @@ class RunConfigurationPlugin(Plugin):
                         "type": "string",
                         "description": "Memory limit"
                     },
+                    "memory-swap": {
+                        "type": "string",
+                        "description": "Swap limit equal to memory plus swap: '-1' to enable unlimited swap"
+                    },
+                    "cpus": {
+                        "type": "number",
+                        "description": "Number of CPUs",
+                        "minimum": 0
+                    },
+                    "cpu-quota": {
+                        "type": "integer",
+                        "description": "Limit CPU CFS (Completely Fair Scheduler) quota"
+                    },
+                    "cpuset-cpus": {
+                        "type": "string",
+                        "description": "CPUs in which to allow execution (0-3, 0,1)"
+                    },
+                    "cpuset-mems": {
+                        "type": "string",
+                        "description": "MEMs in which to allow execution (0-3, 0,1)"
+                    },
+                    "pids-limit": {
+                        "type": "integer",
+                        "description": "Tune container pids limit (set -1 for unlimited)"
+                    },
+                    "shm-size": {
+                        "type": "string",
+                        "description": "Size of /dev/shm"
+                    },
+                    "ipc": {
+                        "type": "string",
+                        "description": "IPC mode to use"
+                    },
+                    "ulimit": {
+                        "type": "object",
+                        "description": "Ulimit options keyed by resource name with values of the form `soft[:hard]` (e.g. `nofile: 1024:2048`).",
+                        "additionalProperties": {
+                            "type": [
+                                "string",
+                                "integer"
+                            ]
+                        }
+                    },
                     "interactive": {
                         "type": "boolean",
                         "description": "Keep STDIN open even if not attached"
@@ -240,6 +411,52 @@ class RunConfigurationPlugin(Plugin):
                     "gpus": {
                         "type": "string",
                         "description": "GPU devices to add to the container (‘all’ to pass all GPUs)",
+                    },
+                    "exec": {
+                        "type": "boolean",
+                        "description": "Replace the docker interface process with the docker CLI and release resources held by plugins in a supervisor process once the container has exited."
+                    },
+                    "watch": {
+                        "type": "object",
+                        "description": "Restart the command whenever files in the workspace change.",
+                        "properties": {
+                            "enabled": {
+                                "type": "boolean",
+                                "description": "Whether to watch the workspace."
+                            },
+                            "include": {
+                                "type": "array",
+                                "description": "Glob patterns of files to watch relative to the workspace (defaults to all files not excluded by `.dockerignore`).",
+                                "items": {
+                                    "type": "string"
+                                }
+                            },
+                            "exclude": {
+                                "type": "array",
+                                "description": "Glob patterns of files to ignore.",
+                                "items": {
+                                    "type": "string"
+                                }
+                            },
+                            "build": {
+                                "type": "array",
+                                "description": "Glob patterns of files that require building the image again when they change (in addition to the Dockerfile and `.dockerignore`).",
+                                "items": {
+                                    "type": "string"
+                                }
+                            },
+                            "debounce": {
+                                "type": "number",
+                                "description": "Time in seconds without further changes before restarting the command.",
+                                "default": 0.2
+                            },
+                            "poll-interval": {
+                                "type": "number",
+                                "description": "Interval in seconds between checks for changes if inotify is not available.",
+                                "default": 0.5
+                            }
+                        },
+                        "additionalProperties": False
                     }
                 },
                 "additionalProperties": False
@@ -250,11 +467,29 @@ class RunConfigurationPlugin(Plugin):
 
     def add_arguments(self, parser):
         super(RunConfigurationPlugin, self).add_arguments(parser)
+        self.arguments['exec'] = '/run/exec'
+        parser.add_argument('--exec', action='store_true', default=None,
+                            help='Replace the docker interface process with the docker CLI.')
+        self.arguments['watch'] = '/run/watch/enabled'
+        parser.add_argument('--watch', action='store_true', default=None,
+                            help='Restart the command whenever files in the workspace change.')
         self.add_argument(parser, '/run/cmd', name='cmd', nargs=argparse.REMAINDER, type=None)
 
+    def __init__(self):
+        super(RunConfigurationPlugin, self).__init__()
+        self.detected = []
+
     def apply(self, configuration, schema, args):
         super(RunConfigurationPlugin, self).apply(configuration, schema, args)
         # Set some sensible defaults (could also be published as variables)
-        util.set_default(configuration, '/run/tty', sys.stdout.isatty())
-        util.set_default(configuration, '/run/interactive', sys.stdout.isatty())
+        run = configuration.setdefault('run', {})
+        self.detected = [key for key in ['tty', 'interactive'] if key not in run]
+        for key in self.detected:
+            run[key] = sys.stdout.isatty()
         return configuration
+
+    def compile(self, configuration, launcher):
+        if self.detected:
+            tty = launcher.variable('DI_TTY', 'if [ -t 1 ]; then echo True; else echo False; fi')
+            for key in self.detected:
+                configuration['run'][key] = tty
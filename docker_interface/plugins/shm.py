@@ -0,0 +1,98 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+
+from .base import Plugin
+from .. import util
+
+
+class SharedMemoryPlugin(Plugin):
+    """
+    Size the shared memory :code:`/dev/shm` of the container automatically.
+
+    Docker limits :code:`/dev/shm` to 64 MB by default which is too small for multiprocessing data
+    loaders (e.g. PyTorch's :code:`DataLoader`) and Jupyter kernels. Unless :code:`run/shm-size` is
+    set or the container does not use a private IPC namespace, the plugin sets :code:`shm-size` to
+    the fraction :code:`run/shm-fraction` of the memory available to the container, i.e. the smaller
+    of the host memory and :code:`run/memory`. The plugin warns if the command looks like a
+    multiprocessing workload but the shared memory is smaller than :code:`MIN_WORKLOAD_SHM_SIZE`.
+
+    The plugin runs after substitution so references in :code:`run/memory` and :code:`run/cmd` are
+    resolved.
+    """
+    COMMANDS = ['run']
+    ORDER = 982
+    SCHEMA = {
+        "properties": {
+            "run": {
+                "properties": {
+                    "shm-fraction": {
+                        "type": "number",
+                        "description": "Fraction of the memory available to the container used for /dev/shm if `shm-size` is not set (use 0 to keep the docker default).",
+                        "minimum": 0,
+                        "maximum": 1,
+                        "default": 0.5
+                    }
+                },
+                "additionalProperties": False
+            }
+        },
+        "additionalProperties": False
+    }
+    # IPC modes for which the container has its own /dev/shm that we can size
+    PRIVATE_IPC_MODES = (None, '', 'private', 'shareable')
+    DEFAULT_SHM_SIZE = 64 * 2 ** 20
+    MIN_WORKLOAD_SHM_SIZE = 2 ** 30
+    WORKLOAD_PATTERN = re.compile(
+        r'\b(jupyter|torchrun|torch\.distributed|num_workers|multiprocessing|dask|ray|horovodrun|'
+        r'mpirun|accelerate)\b'
+    )
+
+    def add_arguments(self, parser):
+        self.add_argument(parser, '/run/shm-fraction')
+
+    def apply(self, configuration, schema, args):
+        super(SharedMemoryPlugin, self).apply(configuration, schema, args)
+        run = configuration['run']
+        if run.get('ipc') not in self.PRIVATE_IPC_MODES:
+            return configuration
+
+        fraction = run.get('shm-fraction')
+        if fraction and 'shm-size' not in run:
+            memory = util.get_host_memory()
+            try:
+                limit = util.parse_size(run['memory']) if run.get('memory') else None
+            except ValueError:
+                self.logger.warning("could not parse memory limit '%s'", run['memory'])
+                limit = None
+            if limit:
+                memory = min(memory, limit) if memory else limit
+            if memory:
+                # Round down to whole megabytes
+                size = int(memory * fraction) // 2 ** 20 * 2 ** 20
+                run['shm-size'] = util.format_size(max(size, self.DEFAULT_SHM_SIZE))
+                self.logger.debug("set shm-size to %s", run['shm-size'])
+
+        try:
+            size = util.parse_size(run.get('shm-size', self.DEFAULT_SHM_SIZE))
+        except ValueError:
+            self.logger.warning("could not parse shared memory size '%s'", run['shm-size'])
+            return configuration
+        match = self.WORKLOAD_PATTERN.search(" ".join(run.get('cmd', [])))
+        if match and size < self.MIN_WORKLOAD_SHM_SIZE:
+            self.logger.warning(
+                "the command appears to use shared memory (`%s`) but /dev/shm is only %s; consider "
+                "increasing `run/shm-size`", match.group(1), util.format_size(size))
+        return configuration
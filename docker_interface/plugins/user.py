@@ -12,8 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import pwd
-import grp
 import os
 import subprocess
 import tempfile
@@ -21,7 +19,8 @@ import uuid
 
 from .base import Plugin, SubstitutionPlugin
 from .run import RunConfigurationPlugin
-from .. import util
+from .. import usage, util
+from ..spec import get_labels
 
 
 class UserPlugin(Plugin):
@@ -53,6 +52,7 @@ class UserPlugin(Plugin):
     def __init__(self):
         super(UserPlugin, self).__init__()
         self.tempdir = None
+        self.user = self.group = None
 
     def add_arguments(self, parser):
         self.add_argument(parser, '/run/user')
@@ -75,6 +75,8 @@ class UserPlugin(Plugin):
         group : grp.struct_group
             Group object.
         """
+        import grp
+        import pwd
         user = user or os.getuid()
         # Convert the information we have obtained to a user object
         try:
@@ -99,10 +101,29 @@ class UserPlugin(Plugin):
 
         return user, group
 
+    @staticmethod
+    def get_label_options(configuration):
+        """
+        Get the options that label the helper container so `di gc` can remove it if it leaks.
+
+        Parameters
+        ----------
+        configuration : dict
+            configuration
+
+        Returns
+        -------
+        options : list[str]
+            `--label` options of `docker create`
+        """
+        labels = get_labels(configuration) + ['%s=user' % usage.label('helper')]
+        return ['--label=%s' % label for label in labels]
+
     def apply(self, configuration, schema, args):
         # Do not call the super class because we want to do something more sophisticated with the
         # arguments
         user, group = self.get_user_group(*(args.user or '').split(':'))
+        self.user, self.group = (user, group) if args.user else (None, None)
         SubstitutionPlugin.VARIABLES['user'] = {
             'uid': user.pw_uid,
             'name': user.pw_name,
@@ -122,15 +143,16 @@ class UserPlugin(Plugin):
             # Create a docker image
             image = util.get_value(configuration, '/run/image')
             image = SubstitutionPlugin.substitute_variables(configuration, image, '/run')
-            status = subprocess.call([configuration['docker'], 'create', '--name', name, image, 'sh'])
+            docker = configuration['docker'].split()
+            status = subprocess.call(docker + ['create', '--name', name] +
+                                     self.get_label_options(configuration) + [image, 'sh'])
             if status:
                 raise RuntimeError(
                     "Could not create container from image '%s'. Did you run `di build`?" % image)
             # Copy out the passwd and group files, mount them, and append the necessary information
             for filename in ['passwd', 'group']:
                 path = os.path.join(self.tempdir.name, filename)
-                subprocess.check_call([
-                    configuration['docker'], 'cp', '%s:/etc/%s' % (name, filename), path])
+                subprocess.check_call(docker + ['cp', '%s:/etc/%s' % (name, filename), path])
                 util.set_default(configuration, '/run/mount', []).append({
                     'type': 'bind',
                     'source': path,
@@ -151,10 +173,52 @@ class UserPlugin(Plugin):
                 assert os.path.isfile(path)
 
             # Destroy the container
-            subprocess.check_call(['docker', 'rm', name])
+            subprocess.check_call(docker + ['rm', name])
 
         return configuration
 
     def cleanup(self):
         if self.tempdir:
             self.tempdir.cleanup()
+
+    def handoff(self):
+        return [['rm', '-rf', self.tempdir.name]] if self.tempdir else []
+
+    def compile(self, configuration, launcher):
+        # Resolve the host user when the launcher runs unless it was given explicitly
+        if self.user:
+            uid, name = self.user.pw_uid, self.user.pw_name
+            gid, group = self.group.gr_gid, self.group.gr_name
+        else:
+            uid = launcher.variable('DI_UID', 'id -u')
+            name = launcher.variable('DI_USER', 'id -un')
+            gid = launcher.variable('DI_GID', 'id -g')
+            group = launcher.variable('DI_GROUP', 'id -gn')
+            # Let plugins compiled later derive values such as the home directory at runtime
+            SubstitutionPlugin.VARIABLES['user'] = {'uid': uid, 'name': name}
+            SubstitutionPlugin.VARIABLES['group'] = {'gid': gid, 'name': group}
+        configuration['run']['user'] = '%s:%s' % (uid, gid)
+
+        # Copy the passwd and group files to the workspace and replace them atomically because
+        # concurrent launches of the same user share the files
+        docker = launcher.join(configuration['docker'].split())
+        directory = os.path.abspath(os.path.join(configuration['workspace'], '.di', 'users'))
+        launcher.add_line('mkdir -p %s' % launcher.quote(directory))
+        launcher.add_line('di_container=$(%s create %s %s sh)' % (
+            docker, launcher.join(self.get_label_options(configuration)),
+            launcher.quote(configuration['run']['image'])))
+        lines = {
+            'passwd': "%s:x:%s:%s:%s:/%s:/bin/sh" % (name, uid, gid, name, name),
+            'group': "%s:x:%s:%s" % (group, gid, name),
+        }
+        for filename, line in lines.items():
+            path = launcher.quote(os.path.join(directory, '%s-%s' % (filename, uid)))
+            launcher.add_line('%s cp "$di_container:/etc/%s" %s.$$' % (docker, filename, path))
+            launcher.add_line('echo %s >> %s.$$' % (launcher.quote(line), path))
+            launcher.add_line('mv -f %s.$$ %s' % (path, path))
+            configuration['run'].setdefault('mount', []).append({
+                'type': 'bind',
+                'source': os.path.join(directory, '%s-%s' % (filename, uid)),
+                'destination': '/etc/%s' % filename
+            })
+        launcher.add_line('%s rm "$di_container" > /dev/null' % docker)
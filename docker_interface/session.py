@@ -0,0 +1,774 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import copy
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import weakref
+
+from .plugins import Plugin, BasePlugin, ExecutePlugin
+from .plugins.base import load_frozen
+from .spec import Record
+from . import history, util
+
+
+# Argument types are cached by name so the cache does not contain executable objects
+PARSER_TYPES = {cls.__name__: cls for cls in util.TYPES.values()}
+
+
+class ArgumentRecorder:
+    """
+    Stand-in for an argument parser that records the arguments plugins add.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def add_argument(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+
+
+def get_parser_spec(command, plugins):
+    """
+    Get the arguments that plugins add to the parser of a command.
+
+    Constructing the arguments requires walking the schema of each plugin so the result is cached
+    on disk. The cache is keyed by the command and the classes and source files of the plugins;
+    plugins must thus add the same arguments every time :code:`add_arguments` is called.
+
+    Parameters
+    ----------
+    command : str
+        command to parse arguments for
+    plugins : list[Plugin]
+        plugins that are relevant to the command
+
+    Returns
+    -------
+    spec : list[tuple]
+        for each plugin, the positional and keyword arguments of each call to `add_argument` and
+        the mapping from argument names to paths in the configuration
+    """
+    key = [command]
+    for plugin in plugins:
+        cls = plugin.__class__
+        filename = getattr(sys.modules[cls.__module__], '__file__', None) or ''
+        # Modules loaded from a zipapp do not exist on disk so we use the archive instead
+        while filename and not os.path.exists(filename):
+            filename = os.path.dirname(filename)
+        key.append((cls.__module__, cls.__qualname__,
+                    os.stat(filename).st_mtime_ns if filename else None))
+    key = hashlib.sha1(repr(key).encode()).hexdigest()
+    path = os.path.join(util.get_cache_dir(), 'parsers', '%s.json' % key)
+    try:
+        with open(path) as fp:
+            spec = json.load(fp)
+        for calls, _ in spec:
+            for _, kwargs in calls:
+                if kwargs.get('type') is not None:
+                    kwargs['type'] = PARSER_TYPES[kwargs['type']]
+        return spec
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    spec = []
+    for plugin in plugins:
+        recorder = ArgumentRecorder()
+        plugin.add_arguments(recorder)
+        spec.append((recorder.calls, dict(plugin.arguments)))
+
+    # Write the cache atomically because other invocations may read it concurrently
+    names = {cls: name for name, cls in PARSER_TYPES.items()}
+    try:
+        cached = json.dumps([
+            ([(positional, dict(kwargs, type=names[kwargs['type']]) if kwargs.get('type')
+               is not None else kwargs) for positional, kwargs in calls], arguments)
+            for calls, arguments in spec
+        ])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = '%s.%d' % (path, os.getpid())
+        with open(temp, 'w') as fp:
+            fp.write(cached)
+        os.replace(temp, path)
+    except (OSError, KeyError, TypeError, ValueError) as ex:
+        logging.getLogger('di').debug("could not cache parser specification: %s", ex)
+    return spec
+
+
+def get_image_id(configuration, command):
+    """
+    Get the id of the image used by a command.
+
+    Parameters
+    ----------
+    configuration : dict
+        resolved configuration
+    command : str
+        docker interface command
+
+    Returns
+    -------
+    image_id : str or None
+        id of the image or `None` if the command does not use an image or it does not exist
+    """
+    image = history.get_image_name(configuration, command)
+    docker = configuration.get('docker')
+    return history.get_image_id(docker, image) if docker and image else None
+
+
+def read_container_id(cidfile):
+    """
+    Read the id of a container written by `docker run --cidfile`.
+
+    Parameters
+    ----------
+    cidfile : str or None
+        path of the file
+
+    Returns
+    -------
+    container_id : str or None
+        id of the container or `None` if the file does not exist
+    """
+    if not cidfile or not os.path.isfile(cidfile):
+        return None
+    with open(cidfile) as fp:
+        return fp.read().strip() or None
+
+
+def spawn_supervisor(pid, commands, interval=1):
+    """
+    Start a shell that executes commands once a process has exited.
+
+    The supervisor runs in a new session so it is not affected by signals sent to the process
+    group of the terminal, e.g. when the user presses Ctrl+C.
+
+    Parameters
+    ----------
+    pid : int
+        id of the process to wait for
+    commands : list[list[str]]
+        commands to execute
+    interval : float
+        interval between checks whether the process is alive in seconds
+
+    Returns
+    -------
+    supervisor : subprocess.Popen
+        supervisor process
+    """
+    import shlex
+    import subprocess
+    script = "while kill -0 %d 2> /dev/null; do sleep %s; done\n" % (pid, interval)
+    script += "".join(" ".join(map(shlex.quote, command)) + "\n" for command in commands)
+    return subprocess.Popen(['sh', '-c', script], stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+
+
+class Result(Record):
+    """
+    Result of executing a command.
+
+    Attributes
+    ----------
+    status : int
+        status code of the command
+    configuration : dict
+        resolved configuration
+    argv : list[str] or None
+        command line arguments of the docker command
+    container_id : str or None
+        id of the container if the command started a container
+    timings : dict
+        time spent preparing the command (`setup`), running the container (`container`), in
+        total (`total`), and applying each plugin (`plugins`) in seconds
+    """
+    __slots__ = ('status', 'configuration', 'argv', 'container_id', 'timings')
+
+
+class Preparation:
+    """
+    Resolved configuration and docker commands of an invocation that has not been executed yet.
+
+    Plugins may hold resources such as CPU leases or temporary files until the preparation is
+    cleaned up, e.g. by using it as a context manager.
+
+    Attributes
+    ----------
+    command : str
+        docker interface command
+    configuration : dict
+        resolved configuration
+    commands : list[list[str]]
+        docker commands to execute in order
+    plugins : list[Plugin]
+        plugins that were applied
+    timings : dict
+        time spent applying each plugin in seconds
+    image_id : str or None
+        id of the image of the container once :meth:`resolve_image_id` has been called
+    """
+    def __init__(self, command, configuration, commands, plugins, timings, started, config_hash):
+        self.command = command
+        self.configuration = configuration
+        self.commands = commands
+        self.plugins = plugins
+        self.timings = timings
+        self.started = started
+        self.config_hash = config_hash
+        self.image_id = None
+
+    def resolve_image_id(self):
+        """
+        Inspect the image of the container before it starts so the run history refers to the image
+        that was run even if the tag is moved later.
+
+        Returns
+        -------
+        image_id : str or None
+            id of the image or `None` if the command does not start a container, is a dry-run, or
+            the image does not exist locally yet
+        """
+        if self.command == 'run' and not self.configuration.get('dry-run'):
+            self.image_id = get_image_id(self.configuration, self.command)
+        return self.image_id
+
+    @property
+    def argv(self):
+        """
+        list[str] or None : command line arguments of the main docker command
+        """
+        return self.commands[-1][1] if self.commands else None
+
+    def iter_commands(self, cidfile=None):
+        """
+        Iterate over the docker commands to execute.
+
+        Parameters
+        ----------
+        cidfile : str or None
+            file to which docker should write the id of the container started by the main command
+
+        Yields
+        ------
+        plugin : ExecutePlugin
+            plugin that constructed the command
+        parts : list[str]
+            command line arguments of the command
+        """
+        for plugin, parts in self.commands:
+            if cidfile and parts is self.argv and self.command == 'run':
+                index = parts.index('run') + 1
+                parts = parts[:index] + ['--cidfile=%s' % cidfile] + parts[index:]
+            yield plugin, parts
+
+    def cleanup(self):
+        """
+        Tear down the plugins in reverse order.
+        """
+        for plugin in reversed(self.plugins):
+            plugin.cleanup()
+        self.plugins = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cleanup()
+
+
+class Session:
+    """
+    Load plugins and build the schema once to prepare and run many commands.
+
+    The command line interface creates a session for each invocation but orchestrators can reuse
+    a session to launch many containers without reloading plugins and rebuilding the schema.
+
+    Parameters
+    ----------
+    plugins : dict or None
+        mapping from plugin names to plugin classes (defaults to all installed plugins)
+    max_concurrency : int or None
+        maximum number of commands executed concurrently by :meth:`run_async` and
+        :meth:`start_async` (unlimited by default)
+
+    Examples
+    --------
+    >>> session = Session()
+    >>> result = session.run({'workspace': '.', 'run': {'image': 'ubuntu'}},
+    ...                      {'/run/cmd': ['echo', 'hello']})  # doctest: +SKIP
+    >>> result.status, result.container_id  # doctest: +SKIP
+    (0, '3f4e...')
+    """
+    def __init__(self, plugins=None, max_concurrency=None):
+        self.logger = logging.getLogger('di')
+        self.max_concurrency = max_concurrency
+        # Semaphores are bound to the event loop they are used on
+        self._semaphores = weakref.WeakKeyDictionary()
+        self.plugin_cls = Plugin.load_plugins() if plugins is None else dict(plugins)
+        # Start from the merged schema of a zipapp if available
+        frozen = load_frozen()
+        self.schema = copy.deepcopy(BasePlugin.SCHEMA if frozen is None else frozen.SCHEMA)
+        for name, cls in self.plugin_cls.items():
+            if frozen is None or name not in frozen.PLUGINS:
+                self.schema = util.merge(self.schema, copy.deepcopy(cls.SCHEMA))
+        self._parsers = {}
+
+    def get_plugins(self, command, configuration):
+        """
+        Instantiate the plugins that are enabled and relevant to a command.
+
+        Parameters
+        ----------
+        command : str
+            docker interface command
+        configuration : dict
+            configuration which may enable or disable plugins using :code:`plugins`
+
+        Returns
+        -------
+        plugins : list[Plugin]
+            plugins sorted by the order in which they are applied
+
+        Raises
+        ------
+        ValueError
+            if the configuration refers to unknown plugins or :code:`plugins` is malformed
+        """
+        enabled = {name: cls.ENABLED for name, cls in self.plugin_cls.items()}
+        plugins = configuration.get('plugins')
+        if isinstance(plugins, list):
+            names = [name.lower() for name in plugins]
+            enabled = {name: name in names for name in enabled}
+        elif isinstance(plugins, dict):
+            names = [name.lower() for name in plugins.get('enable', [])]
+            enabled.update((name, True) for name in names)
+            disabled = [name.lower() for name in plugins.get('disable', [])]
+            enabled.update((name, False) for name in disabled)
+            names += disabled
+        elif plugins is None:
+            names = []
+        else:
+            raise ValueError("'plugins' must be a `list`, `dict`, or `None` but got `%s`" %
+                             type(plugins))
+        unknown = [name for name in names if name not in self.plugin_cls]
+        if unknown:
+            raise ValueError("could not resolve plugins %s. Available plugins: %s" %
+                             (", ".join(unknown), ", ".join(self.plugin_cls)))
+
+        plugins = sorted([cls() for name, cls in self.plugin_cls.items() if enabled[name]],
+                         key=lambda x: x.ORDER)
+        return [plugin for plugin in plugins
+                if plugin.COMMANDS == 'all' or command in plugin.COMMANDS]
+
+    def parse_args(self, command, plugins, args=None):
+        """
+        Parse command line arguments for a command.
+
+        Parameters
+        ----------
+        command : str
+            docker interface command
+        plugins : list[Plugin]
+            plugins relevant to the command (their mapping from arguments to paths in the
+            configuration is updated)
+        args : list[str] or None
+            command line arguments
+
+        Returns
+        -------
+        args : argparse.Namespace
+            parsed arguments
+        """
+        key = (command,) + tuple(plugin.__class__ for plugin in plugins)
+        if key not in self._parsers:
+            parser = argparse.ArgumentParser('di %s' % command)
+            spec = get_parser_spec(command, plugins)
+            for calls, _ in spec:
+                for positional, kwargs in calls:
+                    parser.add_argument(*positional, **kwargs)
+            self._parsers[key] = parser, [arguments for _, arguments in spec]
+        parser, arguments = self._parsers[key]
+        for plugin, arguments_ in zip(plugins, arguments):
+            plugin.arguments = dict(arguments_)
+        return parser.parse_args(args or [])
+
+    def _setup(self, command, configuration, overrides, args):
+        configuration = copy.deepcopy(configuration)
+        for path, value in (overrides or {}).items():
+            util.set_value(configuration, path, value)
+        plugins = self.get_plugins(command, configuration)
+        args = self.parse_args(command, plugins, args)
+        # Overrides take precedence over command line arguments for the same path
+        for plugin in plugins:
+            for name, path in plugin.arguments.items():
+                if path in (overrides or {}):
+                    setattr(args, name.replace('-', '_'), None)
+        util.set_default_from_schema(configuration, self.schema)
+        return configuration, plugins, args, history.hash_configuration(configuration)
+
+    def _apply(self, plugin, configuration, args, timings, defer=False):
+        """
+        Apply a plugin and record the time it took, returning the updated configuration and the
+        command if execution is deferred.
+        """
+        self.logger.debug("applying plugin '%s'", plugin)
+        tic = time.time()
+        parts = None
+        try:
+            if defer and isinstance(plugin, ExecutePlugin):
+                # Set values from the command line without executing the command
+                configuration = Plugin.apply(plugin, configuration, self.schema, args)
+                parts = plugin.build_command(configuration)
+            else:
+                configuration = plugin.apply(configuration, self.schema, args)
+            assert configuration is not None, "plugin '%s' returned `None`" % plugin
+        finally:
+            elapsed = time.time() - tic
+            # Attribute the time spent executing a command to the container rather than the plugin
+            if isinstance(plugin, ExecutePlugin) and plugin.elapsed is not None:
+                elapsed -= plugin.elapsed
+            timings[plugin.__class__.__name__] = elapsed
+        self.logger.debug("configuration:\n%s", json.dumps(configuration, indent=4))
+        return configuration, parts
+
+    def _record(self, command, configuration, started, config_hash, status, setup_time,
+                container_time, timings, image_id=None):
+        # Record the invocation in the run history of the workspace
+        if command not in history.COMMANDS or configuration.get('dry-run'):
+            return
+        try:
+            # Builds are inspected once the image has been built; runs are inspected before the
+            # container starts unless the image was only pulled by the run
+            image = history.get_image_name(configuration, command)
+            if image_id is None:
+                image_id = get_image_id(configuration, command)
+            history.record(
+                configuration['workspace'], started=started, command=command,
+                config_hash=config_hash, image=image, image_id=image_id, status=status,
+                setup_time=setup_time, container_time=container_time, plugin_times=timings,
+            )
+        except Exception as ex:  # pragma: no cover
+            self.logger.warning("failed to record invocation in the run history: %s", ex)
+
+    def handoff(self, plugins, parts):
+        """
+        Replace the current process with a command and release the resources of the plugins in a
+        supervisor process once the command has exited.
+
+        Parameters
+        ----------
+        plugins : list[Plugin]
+            plugins that were applied
+        parts : list[str]
+            command line arguments of the command
+
+        Raises
+        ------
+        OSError
+            if the command could not be executed (the supervisor is stopped and the plugins hold on
+            to their resources)
+        """
+        commands = [command for plugin in plugins for command in plugin.handoff()]
+        supervisor = spawn_supervisor(os.getpid(), commands) if commands else None
+        self.logger.debug("handing off to command '%s'", " ".join(map(str, parts)))
+        for handler in logging.getLogger().handlers:
+            handler.flush()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            os.execvpe(parts[0], parts, os.environ)
+        except OSError:
+            if supervisor is not None:
+                supervisor.kill()
+                supervisor.wait()
+            raise
+
+    def apply(self, command, configuration, args=None, overrides=None, started=None):
+        """
+        Apply all plugins to execute a command like the command line interface.
+
+        Parameters
+        ----------
+        command : str
+            docker interface command
+        configuration : dict
+            configuration (not modified)
+        args : list[str] or None
+            command line arguments of the command
+        overrides : dict or None
+            mapping from paths in the configuration to values that replace the configured values
+        started : float or None
+            time at which the invocation started (defaults to now)
+
+        Returns
+        -------
+        result : Result
+            result of the command
+        """
+        started = started or time.time()
+        configuration, plugins, args, config_hash = self._setup(
+            command, configuration, overrides, args)
+
+        status = 0
+        setup_time = container_time = argv = image_id = None
+        timings = {}
+        self.logger.debug("configuration:\n%s", json.dumps(configuration, indent=4))
+        try:
+            # The main command is executed by the last plugin that executes commands
+            main = [plugin for plugin in plugins if isinstance(plugin, ExecutePlugin)][-1:]
+            for plugin in plugins:
+                if plugin in main and command == 'run' and not configuration.get('dry-run'):
+                    image_id = get_image_id(configuration, command)
+                try:
+                    configuration, _ = self._apply(plugin, configuration, args, timings)
+                except Exception as ex:  # pragma: no cover
+                    self.logger.exception("failed to apply plugin '%s': %s", plugin, ex)
+                    message = "please rerun the command using `di --log-level debug` and file a " \
+                        "new issue containing the output of the command here: https://github." \
+                        "com/spotify/docker_interface/issues/new"
+                    self.logger.fatal("\033[%dm%s\033[0m", 31, message)
+                    status = 3
+                    break
+                if isinstance(plugin, ExecutePlugin):
+                    argv = plugin.parts or argv
+                    if plugin.started is not None:
+                        setup_time = plugin.started - started
+                        container_time = plugin.elapsed
+            handoffs = [plugin.handoff_parts for plugin in plugins
+                        if isinstance(plugin, ExecutePlugin) and plugin.handoff_parts]
+            if handoffs and not status:
+                # The invocation is not recorded in the run history because its status is unknown
+                # once the process has been replaced
+                self.handoff(plugins, handoffs[0])
+        finally:
+            for plugin in reversed(plugins):
+                self.logger.debug("tearing down plugin '%s'", plugin)
+                plugin.cleanup()
+
+        status = configuration.get('status-code', status)
+        self._record(command, configuration, started, config_hash, status, setup_time,
+                     container_time, timings, image_id)
+        return Result(status=status, configuration=configuration, argv=argv, timings={
+            'setup': setup_time, 'container': container_time, 'total': time.time() - started,
+            'plugins': timings,
+        })
+
+    def prepare(self, configuration, overrides=None, args=None, command='run'):
+        """
+        Resolve a configuration and construct the docker commands without executing them.
+
+        Parameters
+        ----------
+        configuration : dict
+            configuration (not modified)
+        overrides : dict or None
+            mapping from paths in the configuration to values that replace the configured values,
+            e.g. `{'/run/cmd': ['python', 'train.py']}`
+        args : list[str] or None
+            command line arguments of the command
+        command : str
+            docker interface command
+
+        Returns
+        -------
+        preparation : Preparation
+            resolved configuration and docker commands (must be cleaned up after use)
+        """
+        started = time.time()
+        configuration, plugins, args, config_hash = self._setup(
+            command, configuration, overrides, args)
+        commands = []
+        timings = {}
+        try:
+            for plugin in plugins:
+                configuration, parts = self._apply(plugin, configuration, args, timings, True)
+                if parts:
+                    commands.append((plugin, parts))
+        except Exception:
+            for plugin in reversed(plugins):
+                plugin.cleanup()
+            raise
+        return Preparation(command, configuration, commands, plugins, timings, started,
+                           config_hash)
+
+    def run(self, configuration, overrides=None, args=None, command='run'):
+        """
+        Prepare and execute a command.
+
+        Parameters
+        ----------
+        configuration : dict
+            configuration (not modified)
+        overrides : dict or None
+            mapping from paths in the configuration to values that replace the configured values
+        args : list[str] or None
+            command line arguments of the command
+        command : str
+            docker interface command
+
+        Returns
+        -------
+        result : Result
+            result of the command
+        """
+        with self.prepare(configuration, overrides, args, command) as preparation:
+            return self.execute(preparation)
+
+    def execute(self, preparation):
+        """
+        Execute the docker commands of a preparation.
+
+        Parameters
+        ----------
+        preparation : Preparation
+            prepared invocation (cleaned up after execution)
+
+        Returns
+        -------
+        result : Result
+            result of the command
+        """
+        dry_run = preparation.configuration['dry-run']
+        status = 0
+        setup_time = container_time = container_id = None
+        with tempfile.TemporaryDirectory() as tempdir:
+            cidfile = None if dry_run else os.path.join(tempdir, 'cid')
+            preparation.resolve_image_id()
+            for plugin, parts in preparation.iter_commands(cidfile):
+                status = plugin.execute_command(parts, dry_run)
+                if plugin.started is not None:
+                    setup_time = plugin.started - preparation.started
+                    container_time = plugin.elapsed
+                if status:
+                    break
+            container_id = read_container_id(cidfile)
+        return self.finish(preparation, status, setup_time, container_time, container_id)
+
+    def finish(self, preparation, status, setup_time=None, container_time=None,
+               container_id=None):
+        """
+        Clean up a preparation after its commands have been executed and record the invocation.
+
+        Parameters
+        ----------
+        preparation : Preparation
+            prepared invocation
+        status : int
+            status code of the commands
+        setup_time : float or None
+            time between the start of the invocation and the start of the container in seconds
+        container_time : float or None
+            time the container ran for in seconds
+        container_id : str or None
+            id of the container
+
+        Returns
+        -------
+        result : Result
+            result of the command
+        """
+        configuration = preparation.configuration
+        configuration['status-code'] = status
+        preparation.cleanup()
+        self._record(preparation.command, configuration, preparation.started,
+                     preparation.config_hash, status, setup_time, container_time,
+                     preparation.timings, preparation.image_id)
+        return Result(status=status, configuration=configuration, argv=preparation.argv,
+                      container_id=container_id, timings={
+                          'setup': setup_time, 'container': container_time,
+                          'total': time.time() - preparation.started,
+                          'plugins': dict(preparation.timings),
+                      })
+
+    async def start_async(self, configuration, overrides=None, args=None, command='run',
+                          capture=False):
+        """
+        Prepare a command and start executing it on the event loop.
+
+        The configuration is resolved in a thread because plugins may block. Execution starts as
+        soon as fewer than :code:`max_concurrency` commands are executing.
+
+        Parameters
+        ----------
+        configuration : dict
+            configuration (not modified)
+        overrides : dict or None
+            mapping from paths in the configuration to values that replace the configured values
+        args : list[str] or None
+            command line arguments of the command
+        command : str
+            docker interface command
+        capture : bool
+            whether to capture the output so it can be consumed using `async for stream, line in
+            execution` rather than inheriting it
+
+        Returns
+        -------
+        execution : docker_interface.aio.AsyncRun
+            execution whose result is available using `await execution.wait()`
+        """
+        import asyncio
+        from .aio import AsyncRun
+        # `get_event_loop` returns the running loop inside a coroutine (`get_running_loop` requires
+        # python 3.7)
+        loop = asyncio.get_event_loop()
+        semaphore = None
+        if self.max_concurrency:
+            # Semaphores reference their loop so closed loops are removed explicitly
+            for closed in [key for key in self._semaphores if key.is_closed()]:
+                del self._semaphores[closed]
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        preparation = await loop.run_in_executor(
+            None, self.prepare, configuration, overrides, args, command)
+        execution = AsyncRun(self, preparation, capture, semaphore)
+        try:
+            await execution.start()
+        except BaseException:
+            preparation.cleanup()
+            raise
+        return execution
+
+    async def run_async(self, configuration, overrides=None, args=None, command='run'):
+        """
+        Prepare and execute a command on the event loop.
+
+        Cancelling the coroutine stops the container.
+
+        Parameters
+        ----------
+        configuration : dict
+            configuration (not modified)
+        overrides : dict or None
+            mapping from paths in the configuration to values that replace the configured values
+        args : list[str] or None
+            command line arguments of the command
+        command : str
+            docker interface command
+
+        Returns
+        -------
+        result : Result
+            result of the command
+        """
+        execution = await self.start_async(configuration, overrides, args, command)
+        return await execution.wait()
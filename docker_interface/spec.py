@@ -0,0 +1,844 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shlex
+import struct
+import tempfile
+
+from . import usage, util
+
+
+# Maximum length of a single argument on Linux (`MAX_ARG_STRLEN`)
+MAX_ARG_LENGTH = 2 ** 17
+# Space reserved for the dynamic loader and changes to the environment as recommended by POSIX
+ARGV_HEADROOM = 2048
+POINTER_SIZE = struct.calcsize('P')
+
+
+class Record:
+    """
+    Immutable-by-convention record with a fixed set of fields.
+
+    Fields are declared in :code:`__slots__` and missing fields default to `None`. Records never
+    modify the values they hold so they can be shared between commands; use :meth:`replace` to
+    derive a record with different values.
+    """
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            setattr(self, name, kwargs.pop(name, None))
+        if kwargs:
+            raise TypeError("%s got unexpected fields: %s" % (
+                self.__class__.__name__, ", ".join(sorted(kwargs))))
+
+    def replace(self, **kwargs):
+        """
+        Create a shallow copy of the record with some fields replaced.
+
+        Parameters
+        ----------
+        kwargs : dict
+            fields to replace
+
+        Returns
+        -------
+        record : Record
+            new record of the same type
+        """
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(kwargs)
+        return self.__class__(**values)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and \
+            all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, ", ".join(
+            "%s=%r" % (name, getattr(self, name)) for name in self.__slots__
+            if getattr(self, name) is not None))
+
+
+def quote_csv(fields):
+    """
+    Join fields as a CSV record, quoting fields that contain commas or quotes.
+
+    Parameters
+    ----------
+    fields : list[str]
+        fields to join
+
+    Returns
+    -------
+    record : str
+        comma-separated fields
+    """
+    return ",".join('"%s"' % field.replace('"', '""') if ',' in field or '"' in field else field
+                    for field in fields)
+
+
+def get_labels(configuration, image=False):
+    """
+    Get the labels that docker interface applies to all objects it creates.
+
+    Parameters
+    ----------
+    configuration : dict
+        configuration
+    image : bool
+        whether the labels are applied to an image (the creation time is omitted because it would
+        change the image id on every build and defeat the build cache)
+
+    Returns
+    -------
+    labels : list[str]
+        labels of the form `key=value` (user-defined labels of the command should follow so they
+        take precedence)
+    """
+    exclude = usage.label('created') if image else None
+    return ['%s=%s' % (key, value) for key, value in configuration.get('labels', {}).items()
+            if key != exclude]
+
+
+class Mount(Record):
+    """
+    Mount of a bind, volume, or tmpfs in a container.
+
+    Bind-mount sources are absolute paths. Fields correspond to the keys of the `--mount` option of
+    `docker run` with dashes replaced by underscores.
+    """
+    __slots__ = ('type', 'source', 'destination', 'readonly', 'consistency', 'bind_propagation',
+                 'volume_nocopy', 'volume_subpath', 'volume_driver', 'volume_opt', 'tmpfs_size',
+                 'tmpfs_mode')
+
+    @classmethod
+    def from_configuration(cls, mount, workspace):
+        """
+        Create a mount from its declarative definition.
+
+        Parameters
+        ----------
+        mount : dict
+            mount definition
+        workspace : str
+            workspace relative to which bind-mount sources are resolved
+
+        Returns
+        -------
+        mount : Mount
+            mount
+        """
+        values = {key.replace('-', '_'): value for key, value in mount.items()}
+        if values['type'] == 'bind' and 'source' in values:
+            values['source'] = os.path.abspath(os.path.join(workspace, values['source']))
+        return cls(**values)
+
+    def to_argument(self):
+        """
+        Render the mount as the value of a `--mount` argument.
+
+        Returns
+        -------
+        spec : str
+            comma-separated list of `key=value` pairs
+        """
+        fields = []
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is None:
+                continue
+            key = name.replace('_', '-')
+            if name == 'volume_opt':
+                fields.extend('volume-opt=%s=%s' % item for item in value.items())
+            elif isinstance(value, bool):
+                fields.append('%s=%s' % (key, str(value).lower()))
+            else:
+                fields.append('%s=%s' % (key, value))
+        # Docker parses the specification as a CSV record so we need to quote fields with commas
+        return quote_csv(fields)
+
+    def to_engine(self):
+        """
+        Render the mount as an element of `HostConfig.Mounts` of the Engine API.
+
+        Returns
+        -------
+        mount : dict
+            mount in the format expected by the Engine API
+        """
+        mount = {'Type': self.type, 'Target': self.destination}
+        if self.source is not None:
+            mount['Source'] = self.source
+        if self.readonly is not None:
+            mount['ReadOnly'] = self.readonly
+        if self.consistency is not None:
+            mount['Consistency'] = self.consistency
+        if self.bind_propagation is not None:
+            mount['BindOptions'] = {'Propagation': self.bind_propagation}
+        volume = {}
+        if self.volume_nocopy is not None:
+            volume['NoCopy'] = self.volume_nocopy
+        if self.volume_subpath is not None:
+            volume['Subpath'] = self.volume_subpath
+        if self.volume_driver is not None or self.volume_opt is not None:
+            volume['DriverConfig'] = {'Name': self.volume_driver or 'local',
+                                      'Options': dict(self.volume_opt or {})}
+        if volume:
+            mount['VolumeOptions'] = volume
+        tmpfs = {}
+        if self.tmpfs_size is not None:
+            tmpfs['SizeBytes'] = util.parse_size(self.tmpfs_size)
+        if self.tmpfs_mode is not None:
+            # The CLI interprets the mode as an octal number
+            tmpfs['Mode'] = int(str(self.tmpfs_mode), 8)
+        if tmpfs:
+            mount['TmpfsOptions'] = tmpfs
+        return mount
+
+
+class Publish(Record):
+    """
+    Port of a container published on the host.
+    """
+    __slots__ = ('ip', 'host', 'container')
+
+    def to_argument(self):
+        """
+        Render the port as the value of a `--publish` argument.
+
+        Returns
+        -------
+        spec : str
+            specification in the format `ip:host:container`
+        """
+        return '%s:%s:%s' % tuple('' if value is None else value
+                                  for value in (self.ip, self.host, self.container))
+
+    def get_port(self):
+        """
+        Get the container port in the format used by the Engine API.
+
+        Returns
+        -------
+        port : str
+            port and protocol, e.g. `8888/tcp`
+        """
+        port = str(self.container)
+        return port if '/' in port else port + '/tcp'
+
+
+class Tmpfs(Record):
+    """
+    Temporary file system mounted in a container.
+    """
+    __slots__ = ('destination', 'options', 'mode', 'size')
+
+    def get_options(self):
+        """
+        Get the mount options of the file system.
+
+        Returns
+        -------
+        options : list[str]
+            mount options including the mode and size
+        """
+        options = list(self.options or [])
+        for key in ['mode', 'size']:
+            value = getattr(self, key)
+            if value is not None:
+                options.append('%s=%s' % (key, value))
+        return options
+
+    def to_argument(self):
+        """
+        Render the file system as the value of a `--tmpfs` argument.
+
+        Returns
+        -------
+        spec : str
+            destination optionally followed by a colon and comma-separated mount options
+        """
+        options = self.get_options()
+        return "%s:%s" % (self.destination, ",".join(options)) if options else self.destination
+
+
+def build_option_parts(option, values):
+    """
+    Construct command line arguments of the form `--<option>=<value>`.
+
+    Parameters
+    ----------
+    option : str
+        name of the option
+    values : object
+        value or list of values of the option (no arguments are constructed for falsy values)
+
+    Returns
+    -------
+    parts : list[str]
+        command line arguments
+    """
+    if not values:
+        return []
+    if not isinstance(values, list):
+        values = [values]
+    return ['--%s=%s' % (option, value) for value in values]
+
+
+def build_assignment_parts(option, items):
+    """
+    Construct command line arguments of the form `--<option>=<key>=<value>`.
+
+    Parameters
+    ----------
+    option : str
+        name of the option
+    items : iterable
+        `(key, value)` pairs
+
+    Returns
+    -------
+    parts : list[str]
+        command line arguments
+    """
+    return ['--%s=%s=%s' % (option, key, value) for key, value in items]
+
+
+def parse_env_file(path):
+    """
+    Parse an environment file in the format accepted by `docker run --env-file`.
+
+    Parameters
+    ----------
+    path : str
+        path of the file
+
+    Returns
+    -------
+    env : list[tuple[str, str or None]]
+        environment variables (the value is `None` if the variable is forwarded from the host)
+    """
+    env = []
+    with open(path) as fp:
+        for line in fp:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            key, sep, value = line.partition('=')
+            env.append((key, value if sep else None))
+    return env
+
+
+def get_argv_size(parts):
+    """
+    Get the number of bytes that arguments occupy when they are passed to a new process.
+
+    Parameters
+    ----------
+    parts : list[str]
+        arguments or environment variables in the format `key=value`
+
+    Returns
+    -------
+    size : int
+        size of the strings including terminators and pointers in bytes
+    """
+    return sum(len(str(part).encode()) + 1 + POINTER_SIZE for part in parts)
+
+
+def get_argv_limit(environ=None):
+    """
+    Get the number of bytes available for the arguments of a new process.
+
+    Parameters
+    ----------
+    environ : dict or None
+        environment passed to the process (defaults to :code:`os.environ`)
+
+    Returns
+    -------
+    limit : int
+        `ARG_MAX` less the size of the environment and some headroom
+    """
+    try:
+        arg_max = os.sysconf('SC_ARG_MAX')
+    except (AttributeError, ValueError, OSError):  # pragma: no cover
+        arg_max = MAX_ARG_LENGTH
+    environ = os.environ if environ is None else environ
+    return arg_max - get_argv_size('%s=%s' % item for item in environ.items()) - ARGV_HEADROOM
+
+
+def can_spill(key, value):
+    """
+    Check whether a `key=value` pair can be written to a file read using `--env-file` or
+    `--label-file` without changing its meaning.
+
+    The docker CLI reads such files line by line, strips leading whitespace, ignores comments, and
+    rejects keys that contain whitespace.
+
+    Parameters
+    ----------
+    key : str
+        name of the variable or label
+    value : str or None
+        value of the variable or label (`None` to forward a variable from the host)
+
+    Returns
+    -------
+    spillable : bool
+        whether the pair can be written to a file
+    """
+    if not key or key != key.lstrip() or key.startswith('#') or any(c.isspace() for c in key):
+        return False
+    return value is None or not ('\n' in value or value.endswith('\r'))
+
+
+def write_spill_file(items, kind, directory=None):
+    """
+    Write `key=value` pairs to a private temporary file.
+
+    Parameters
+    ----------
+    items : list[tuple[str, str or None]]
+        pairs to write (a value of `None` writes only the key)
+    kind : str
+        kind of the file used as part of its name, e.g. `env` or `label`
+    directory : str or None
+        directory to create the file in (defaults to the temporary directory of the system)
+
+    Returns
+    -------
+    path : str
+        path of the file which is only readable by the current user
+    """
+    fd, path = tempfile.mkstemp(prefix='di-%s-' % kind, suffix='.list', dir=directory)
+    with os.fdopen(fd, 'w') as fp:
+        for key, value in items:
+            fp.write(key if value is None else '%s=%s' % (key, value))
+            fp.write('\n')
+    return path
+
+
+class RunSpec(Record):
+    """
+    Fully resolved `docker run` command.
+
+    The spec is built once from a configuration using :meth:`from_configuration` and can be
+    rendered as command line arguments (:meth:`to_argv`), as the body of a container creation
+    request of the Engine API (:meth:`to_engine`), or as a shell script (:meth:`to_shell`) without
+    modifying the configuration or the spec itself. Use :meth:`replace` to derive variants, e.g.
+    `spec.replace(cmd=['bash'])`.
+
+    Scalar and list fields correspond to options of `docker run` with dashes replaced by
+    underscores. `env` is a list of `(key, value)` pairs where a value of `None` forwards the
+    variable from the host, `ulimit` is a list of `(name, value)` pairs, and `mount`, `publish`,
+    and `tmpfs` are lists of :class:`Mount`, :class:`Publish`, and :class:`Tmpfs` records.
+    """
+    # Options rendered as `--<option>=<value>` in the order they are passed to `docker run`
+    OPTIONS = [
+        'user', 'workdir', 'rm', 'interactive', 'tty', 'env-file', 'cpu-shares', 'name', 'network',
+        'label', 'label-file', 'memory', 'entrypoint', 'runtime', 'privileged', 'group-add', 'gpus',
+        'cpus', 'cpu-quota', 'cpuset-cpus', 'cpuset-mems', 'memory-swap', 'pids-limit', 'shm-size',
+        'ipc',
+    ]
+    __slots__ = tuple(option.replace('-', '_') for option in OPTIONS) + (
+        'docker', 'image', 'cmd', 'ulimit', 'mount', 'env', 'publish', 'tmpfs')
+
+    @classmethod
+    def from_configuration(cls, configuration):
+        """
+        Create a spec from a resolved configuration without modifying it.
+
+        Parameters
+        ----------
+        configuration : dict
+            configuration with keys `docker`, `workspace`, and `run`
+
+        Returns
+        -------
+        spec : RunSpec
+            spec of the `docker run` command
+        """
+        workspace = configuration['workspace']
+        run = configuration['run']
+        values = {option.replace('-', '_'): run[option] for option in cls.OPTIONS if option in run}
+        for key in ['env_file', 'label_file']:
+            if key in values:
+                values[key] = [os.path.join(workspace, path) for path in values[key]]
+        labels = get_labels(configuration) + list(values.get('label', []))
+        if labels:
+            values['label'] = labels
+        return cls(
+            docker=configuration['docker'].split(),
+            image=run['image'],
+            cmd=list(run.get('cmd', [])),
+            ulimit=list(run.get('ulimit', {}).items()),
+            mount=[Mount.from_configuration(mount, workspace) for mount in run.get('mount', [])],
+            env=list(run.get('env', {}).items()) + [('DOCKER_INTERFACE', 'true')],
+            publish=[Publish(**publish) for publish in run.get('publish', [])],
+            tmpfs=[Tmpfs(**tmpfs) for tmpfs in run.get('tmpfs', [])],
+            **values
+        )
+
+    def to_argv(self):
+        """
+        Render the spec as command line arguments.
+
+        Returns
+        -------
+        args : list[str]
+            sequence of command line arguments to run a command in a container
+        """
+        parts = list(self.docker or ['docker'])
+        parts.append('run')
+        for option in self.OPTIONS:
+            parts.extend(build_option_parts(option, getattr(self, option.replace('-', '_'))))
+        parts.extend(build_assignment_parts('ulimit', self.ulimit or []))
+        parts.extend('--mount=%s' % mount.to_argument() for mount in self.mount or [])
+        for key, value in self.env or []:
+            parts.append('--env=%s' % key if value is None else '--env=%s=%s' % (key, value))
+        parts.extend('--publish=%s' % publish.to_argument() for publish in self.publish or [])
+        for tmpfs in self.tmpfs or []:
+            parts.extend(['--tmpfs', tmpfs.to_argument()])
+        parts.append(self.image)
+        parts.extend(self.cmd or [])
+        return parts
+
+    def spill(self, limit=None, directory=None):
+        """
+        Move environment variables and labels to temporary files if the command line arguments
+        would exceed the limit of the operating system.
+
+        Variables are written to an additional `--env-file` after any existing files and labels to
+        an additional `--label-file` so the container is created with the same environment and
+        labels. Values that cannot be represented in such files, e.g. because they span multiple
+        lines, remain on the command line.
+
+        Parameters
+        ----------
+        limit : int or None
+            maximum size of the arguments in bytes (defaults to :func:`get_argv_limit`)
+        directory : str or None
+            directory to create the files in (defaults to the temporary directory of the system)
+
+        Returns
+        -------
+        spec : RunSpec
+            spec whose arguments fit within the limit (the spec itself if nothing was moved)
+        paths : list[str]
+            paths of the files that were created; the caller is responsible for removing them
+        """
+        argv = self.to_argv()
+        limit = get_argv_limit() if limit is None else limit
+        if get_argv_size(argv) <= limit and \
+                all(len(str(part).encode()) < MAX_ARG_LENGTH for part in argv):
+            return self, []
+
+        spec = self
+        paths = []
+        # Later values take precedence so only the last value of each key needs to be kept
+        env = list(dict(self.env or []).items())
+        labels = list(dict(label.partition('=')[::2] if '=' in label else (label, None)
+                           for label in self.label or []).items())
+        for kind, items, field in [('env', env, 'env'), ('label', labels, 'label')]:
+            # Labels without a value are ignored in label files
+            spilled = [(key, value) for key, value in items if can_spill(key, value) and
+                       (value is not None or kind == 'env')]
+            if not spilled:
+                continue
+            path = write_spill_file(spilled, kind, directory)
+            paths.append(path)
+            keys = {key for key, _ in spilled}
+            remaining = [(key, value) for key, value in items if key not in keys]
+            if kind == 'label':
+                remaining = [key if value is None else '%s=%s' % (key, value)
+                             for key, value in remaining]
+            spec = spec.replace(**{
+                field: remaining,
+                field + '_file': list(getattr(spec, field + '_file') or []) + [path],
+            })
+        return spec, paths
+
+    def to_shell(self):
+        """
+        Render the spec as a shell script.
+
+        Returns
+        -------
+        script : str
+            POSIX shell script that replaces itself with the `docker run` command
+        """
+        return "#!/bin/sh\nexec %s\n" % " ".join(shlex.quote(str(part)) for part in self.to_argv())
+
+    def get_env(self, environ=None):
+        """
+        Resolve the environment variables of the container like the docker CLI.
+
+        Parameters
+        ----------
+        environ : dict or None
+            environment of the host used to resolve forwarded variables (defaults to
+            :code:`os.environ`)
+
+        Returns
+        -------
+        env : list[str]
+            environment variables in the format `key=value`
+        """
+        environ = os.environ if environ is None else environ
+        items = []
+        for env_file in self.env_file or []:
+            items.extend(parse_env_file(env_file))
+        items.extend(self.env or [])
+        env = {}
+        for key, value in items:
+            # Forwarded variables that are not set on the host are omitted
+            if value is None:
+                if key not in environ:
+                    continue
+                value = environ[key]
+            env[key] = value
+        return ['%s=%s' % item for item in env.items()]
+
+    def get_device_requests(self):
+        """
+        Translate the `gpus` option to device requests of the Engine API.
+
+        Returns
+        -------
+        requests : list[dict]
+            device requests
+        """
+        if self.gpus is None:
+            return []
+        request = {'Driver': '', 'Capabilities': [['gpu']]}
+        gpus = str(self.gpus)
+        if gpus == 'all':
+            request['Count'] = -1
+        elif gpus.startswith('device='):
+            request['DeviceIDs'] = gpus[len('device='):].split(',')
+        else:
+            request['Count'] = int(gpus)
+        return [request]
+
+    def to_engine(self, environ=None):
+        """
+        Render the spec as the body of a `POST /containers/create` request of the Engine API.
+
+        The name of the container is passed as a query parameter and is not part of the body.
+
+        Parameters
+        ----------
+        environ : dict or None
+            environment of the host used to resolve forwarded variables (defaults to
+            :code:`os.environ`)
+
+        Returns
+        -------
+        body : dict
+            body of the request
+        """
+        labels = {}
+        for label_file in self.label_file or []:
+            labels.update((key, value) for key, value in parse_env_file(label_file)
+                          if value is not None)
+        labels.update(label.partition('=')[::2] for label in self.label or [])
+        host_config = {
+            'AutoRemove': bool(self.rm),
+            'Privileged': bool(self.privileged),
+            'Mounts': [mount.to_engine() for mount in self.mount or []],
+            'Tmpfs': {tmpfs.destination: ",".join(tmpfs.get_options())
+                      for tmpfs in self.tmpfs or []},
+            'PortBindings': {},
+            'Ulimits': [],
+            'DeviceRequests': self.get_device_requests(),
+        }
+        for publish in self.publish or []:
+            host_config['PortBindings'].setdefault(publish.get_port(), []).append({
+                'HostIp': publish.ip or '',
+                'HostPort': '' if publish.host is None else str(publish.host),
+            })
+        for name, value in self.ulimit or []:
+            soft, _, hard = str(value).partition(':')
+            host_config['Ulimits'].append({'Name': name, 'Soft': int(soft),
+                                           'Hard': int(hard or soft)})
+        for key, field, convert in [
+                ('cpu_shares', 'CpuShares', int),
+                ('cpu_quota', 'CpuQuota', int),
+                ('cpus', 'NanoCpus', lambda value: int(float(value) * 1e9)),
+                ('cpuset_cpus', 'CpusetCpus', str),
+                ('cpuset_mems', 'CpusetMems', str),
+                ('memory', 'Memory', util.parse_size),
+                ('memory_swap', 'MemorySwap',
+                 lambda value: -1 if str(value) == '-1' else util.parse_size(value)),
+                ('pids_limit', 'PidsLimit', int),
+                ('shm_size', 'ShmSize', util.parse_size),
+                ('ipc', 'IpcMode', str),
+                ('network', 'NetworkMode', str),
+                ('runtime', 'Runtime', str),
+                ('group_add', 'GroupAdd', lambda value: [str(item) for item in value])]:
+            value = getattr(self, key)
+            if value is not None:
+                host_config[field] = convert(value)
+
+        body = {
+            'Image': self.image,
+            'Cmd': list(self.cmd or []),
+            'Env': self.get_env(environ),
+            'Labels': labels,
+            'Tty': bool(self.tty),
+            'OpenStdin': bool(self.interactive),
+            'AttachStdin': bool(self.interactive),
+            'AttachStdout': True,
+            'AttachStderr': True,
+            'ExposedPorts': {port: {} for port in host_config['PortBindings']},
+            'HostConfig': host_config,
+        }
+        if self.user is not None:
+            body['User'] = str(self.user)
+        if self.workdir is not None:
+            body['WorkingDir'] = self.workdir
+        if self.entrypoint is not None:
+            body['Entrypoint'] = [self.entrypoint]
+        return body
+
+
+def resolve_build_spec(spec, workspace):
+    """
+    Resolve the `src` and `dest` paths of a BuildKit specification such as `type=local,src=path`
+    relative to the workspace.
+
+    Parameters
+    ----------
+    spec : str
+        comma-separated list of `key=value` pairs or an image reference
+    workspace : str
+        workspace relative to which paths are resolved
+
+    Returns
+    -------
+    spec : str
+        specification with absolute paths
+    """
+    fields = spec.split(',')
+    for i, field in enumerate(fields):
+        key, sep, value = field.partition('=')
+        if sep and key in ('src', 'dest'):
+            fields[i] = '%s=%s' % (key, os.path.abspath(os.path.join(workspace, value)))
+    return ",".join(fields)
+
+
+class BuildSpec(Record):
+    """
+    Fully resolved `docker build` command.
+
+    Fields correspond to options of `docker build` with dashes replaced by underscores except for
+    `tag` which is a list of all tags of the image, `build_arg` which is a list of `(key, value)`
+    pairs, and `path` which is the absolute path of the build context.
+    """
+    # Options rendered as `--<option>=<value>` in the order they are passed to `docker build`
+    OPTIONS = [
+        'tag', 'file', 'target', 'no-cache', 'quiet', 'cpu-shares', 'memory', 'cache-from',
+        'cache-to', 'secret', 'ssh', 'progress', 'label',
+    ]
+    __slots__ = tuple(option.replace('-', '_') for option in OPTIONS) + (
+        'docker', 'builder', 'build_arg', 'path')
+
+    @classmethod
+    def from_configuration(cls, configuration):
+        """
+        Create a spec from a resolved configuration without modifying it.
+
+        Parameters
+        ----------
+        configuration : dict
+            configuration with keys `docker`, `workspace`, and `build`
+
+        Returns
+        -------
+        spec : BuildSpec
+            spec of the `docker build` command
+
+        Raises
+        ------
+        ValueError
+            if the configuration requests features that the builder does not support
+        """
+        workspace = configuration['workspace']
+        build = configuration['build']
+        builder = build.get('builder', 'default')
+        if builder == 'classic':
+            for key in ['secret', 'ssh', 'cache-to', 'progress']:
+                if key in build:
+                    raise ValueError("`%s` is not supported by the classic builder" % key)
+
+        values = {option.replace('-', '_'): build[option] for option in cls.OPTIONS
+                  if option in build}
+        values['path'] = os.path.join(workspace, build['path'])
+        values['file'] = os.path.join(values['path'], build['file'])
+        values['tag'] = [build['tag']] + build.get('additional-tags', [])
+        for key in ['cache_from', 'cache_to', 'secret']:
+            if key in values:
+                values[key] = [resolve_build_spec(spec, workspace) for spec in values[key]]
+        build_arg = list(build.get('build-arg', {}).items())
+        labels = get_labels(configuration, image=True) + list(values.get('label', []))
+        if labels:
+            values['label'] = labels
+
+        # The docker CLI can only export the cache inline by embedding it in the image
+        if builder != 'buildx':
+            for spec in values.pop('cache_to', []):
+                if spec != 'type=inline':
+                    raise ValueError("cache export `%s` requires the buildx builder" % spec)
+                build_arg.append(('BUILDKIT_INLINE_CACHE', '1'))
+
+        return cls(docker=configuration.get('docker', 'docker').split(), builder=builder,
+                   build_arg=build_arg, **values)
+
+    def to_argv(self):
+        """
+        Render the spec as command line arguments.
+
+        Returns
+        -------
+        args : list[str]
+            sequence of command line arguments to build an image
+        """
+        parts = list(self.docker or ['docker'])
+        if self.builder == 'buildx':
+            # Load the image into the local image store so it is available to `di run`
+            parts.extend(['buildx', 'build', '--load'])
+        else:
+            if self.builder not in (None, 'default'):
+                parts = ['env', 'DOCKER_BUILDKIT=%d' % (self.builder == 'buildkit')] + parts
+            parts.append('build')
+        for option in self.OPTIONS:
+            parts.extend(build_option_parts(option, getattr(self, option.replace('-', '_'))))
+        # Later values take precedence so the inline cache argument overrides user arguments
+        parts.extend(build_assignment_parts('build-arg', dict(self.build_arg or []).items()))
+        parts.append(self.path)
+        return parts
+
+    def to_shell(self):
+        """
+        Render the spec as a shell script.
+
+        Returns
+        -------
+        script : str
+            POSIX shell script that replaces itself with the `docker build` command
+        """
+        return "#!/bin/sh\nexec %s\n" % " ".join(shlex.quote(str(part)) for part in self.to_argv())
@@ -0,0 +1,166 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+
+from . import util
+
+
+LABEL_PREFIX = 'com.spotify.docker-interface'
+# Docker labels cannot be changed after an object has been created so we keep track of the time
+# objects were last used in an index shared by all invocations on the host because cache volumes
+# and images are shared by all users (defaults to `usage.json` in the shared state directory)
+INDEX = None
+
+
+def label(name):
+    """
+    Get the fully qualified name of a docker interface label.
+
+    Parameters
+    ----------
+    name : str
+        short name of the label
+
+    Returns
+    -------
+    label : str
+        fully qualified name of the label
+    """
+    return '%s.%s' % (LABEL_PREFIX, name)
+
+
+def get_index(index=None):
+    """
+    Get the path of the index of the times objects were last used.
+
+    Parameters
+    ----------
+    index : str or None
+        path of the index
+
+    Returns
+    -------
+    index : str
+        `index` if given, :code:`INDEX` if set, or `usage.json` in the directory shared by all
+        users of the host
+    """
+    return index or INDEX or os.path.join(util.get_shared_dir(), 'usage.json')
+
+
+def touch(kind, *names, index=None):
+    """
+    Record that docker objects were used.
+
+    Parameters
+    ----------
+    kind : str
+        kind of the objects (e.g. `volume` or `image`)
+    names : list[str]
+        names of the objects
+    index : str or None
+        path of the index (see :func:`get_index`)
+    """
+    now = time.time()
+    with util.locked_json(get_index(index), {}, 0o666) as usage:
+        objects = usage.setdefault(kind, {})
+        for name in names:
+            objects[name] = now
+
+
+def forget(kind, *names, index=None):
+    """
+    Remove docker objects from the index after they have been deleted.
+
+    Parameters
+    ----------
+    kind : str
+        kind of the objects (e.g. `volume` or `image`)
+    names : list[str]
+        names of the objects
+    index : str or None
+        path of the index (see :func:`get_index`)
+    """
+    with util.locked_json(get_index(index), {}, 0o666) as usage:
+        objects = usage.setdefault(kind, {})
+        for name in names:
+            objects.pop(name, None)
+
+
+def get_last_used(kind, index=None):
+    """
+    Get the times at which docker objects were last used.
+
+    Parameters
+    ----------
+    kind : str
+        kind of the objects (e.g. `volume` or `image`)
+    index : str or None
+        path of the index (see :func:`get_index`)
+
+    Returns
+    -------
+    last_used : dict[str, float]
+        mapping from object names to the time they were last used
+    """
+    with util.locked_json(get_index(index), {}, 0o666) as usage:
+        return dict(usage.get(kind, {}))
+
+
+def parse_labels(text):
+    """
+    Parse the labels of a docker object as reported by `docker ... --format '{{json .}}'`.
+
+    Parameters
+    ----------
+    text : str
+        comma-separated list of `key=value` pairs
+
+    Returns
+    -------
+    labels : dict[str, str]
+        mapping from label names to values
+    """
+    return dict(item.partition('=')[::2] for item in (text or '').split(',') if item)
+
+
+def select_evictions(objects, budget, count=None):
+    """
+    Select the least recently used objects to evict such that the remaining objects fit a budget.
+
+    Parameters
+    ----------
+    objects : list[dict]
+        objects with keys `name`, `size`, and `last_used`
+    budget : int or None
+        maximum total size of the objects to keep or `None` for no limit
+    count : int or None
+        maximum number of objects to keep or `None` for no limit
+
+    Returns
+    -------
+    evictions : list[dict]
+        objects to evict in the order they should be evicted
+    """
+    total = sum(obj['size'] for obj in objects)
+    remaining = len(objects)
+    evictions = []
+    for obj in sorted(objects, key=lambda obj: obj['last_used'] or 0):
+        if (budget is None or total <= budget) and (count is None or remaining <= count):
+            break
+        evictions.append(obj)
+        total -= obj['size']
+        remaining -= 1
+    return evictions
@@ -13,7 +13,11 @@
 # limitations under the License.
 
 import contextlib
+import fcntl
+import fnmatch
+import json
 import os
+import re
 import socket
 
 
@@ -24,6 +28,53 @@ TYPES = {
     'boolean': bool,
     'array': list,
 }
+SIZE_PATTERN = re.compile(r'^\s*(?P<value>\d+(\.\d*)?)\s*(?P<unit>[kmgtp]?)i?b?\s*$', re.IGNORECASE)
+SIZE_UNITS = 'kmgtp'
+# Directory in which invocations of all users on the host keep shared state
+SHARED_DIR = '/tmp/docker-interface'
+
+
+def get_cache_dir():
+    """
+    Get the directory in which docker interface caches data across invocations.
+
+    Returns
+    -------
+    path : str
+        path of the cache directory (`$XDG_CACHE_HOME/docker-interface` or
+        `~/.cache/docker-interface`)
+    """
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache'))
+    return os.path.join(root, 'docker-interface')
+
+
+def get_shared_dir():
+    """
+    Get the directory in which invocations of all users on the host keep shared state, e.g. CPU
+    leases.
+
+    The directory is created world-writable with the sticky bit set (like `/tmp`) so that users can
+    create files in it but cannot remove or replace the files of other users.
+
+    Returns
+    -------
+    path : str
+        path of the shared directory (:code:`SHARED_DIR`)
+
+    Raises
+    ------
+    OSError
+        if the path exists but is not a directory or is a symbolic link
+    """
+    try:
+        os.mkdir(SHARED_DIR, 0o1777)
+        # Apply the mode irrespective of the umask
+        os.chmod(SHARED_DIR, 0o1777)
+    except FileExistsError:
+        pass
+    if os.path.islink(SHARED_DIR) or not os.path.isdir(SHARED_DIR):
+        raise OSError("shared state directory '%s' is not a directory" % SHARED_DIR)
+    return SHARED_DIR
 
 
 def abspath(path, ref=None):
@@ -270,6 +321,86 @@ def apply(instance, func, path=None):
     return func(instance, path)
 
 
+def parse_size(value, base=1024):
+    """
+    Parse a size such as `512m`, `2G`, or `1.5GB` and return the number of bytes.
+
+    Parameters
+    ----------
+    value : str or int
+        size with an optional unit suffix or number of bytes
+    base : int
+        base of the unit suffixes (docker uses 1024 for resource limits and 1000 for reporting)
+
+    Returns
+    -------
+    size : int
+        number of bytes
+
+    Raises
+    ------
+    ValueError
+        if `value` is not a valid size
+    """
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = SIZE_PATTERN.match(value)
+    if not match:
+        raise ValueError("'%s' is not a valid size" % value)
+    unit = match.group('unit').lower()
+    exponent = SIZE_UNITS.index(unit) + 1 if unit else 0
+    return int(float(match.group('value')) * base ** exponent)
+
+
+def format_size(size):
+    """
+    Format a number of bytes using the largest binary unit that represents it without a remainder.
+
+    Parameters
+    ----------
+    size : int
+        number of bytes
+
+    Returns
+    -------
+    value : str
+        size with a unit suffix understood by docker (e.g. `512m`)
+    """
+    size = int(size)
+    suffix = ''
+    for unit in SIZE_UNITS:
+        if size == 0 or size % 1024:
+            break
+        size //= 1024
+        suffix = unit
+    return '%d%s' % (size, suffix)
+
+
+def get_host_memory(path='/proc/meminfo'):
+    """
+    Get the total memory of the host.
+
+    Parameters
+    ----------
+    path : str
+        path of the kernel's memory information
+
+    Returns
+    -------
+    memory : int or None
+        total memory in bytes or `None` if the memory cannot be determined
+    """
+    try:
+        with open(path) as fp:
+            for line in fp:
+                key, _, value = line.partition(':')
+                if key == 'MemTotal':
+                    return parse_size(value.strip())
+    except OSError:  # pragma: no cover
+        pass
+    return None
+
+
 def get_free_port(ports=None):
     """
     Get a free port.
@@ -301,3 +432,158 @@ def get_free_port(ports=None):
                     raise
 
     raise RuntimeError("could not find a free port")
+
+
+@contextlib.contextmanager
+def locked_json(path, default=None, mode=0o600):
+    """
+    Load a JSON document while holding an exclusive lock and write it back on exit.
+
+    Symbolic links are not followed so other users cannot redirect writes to files they do not own.
+
+    Parameters
+    ----------
+    path : str
+        path of the JSON document (created if it does not exist)
+    default :
+        value to use if the document does not exist or is empty
+    mode : int
+        file mode to apply irrespective of the umask if the document is created
+
+    Yields
+    ------
+    value :
+        mutable JSON value that is written back to `path` when the context exits without an error
+    """
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, 0o700, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, mode)
+        os.fchmod(fd, mode)
+    except FileExistsError:
+        fd = os.open(path, os.O_RDWR | os.O_NOFOLLOW)
+    with open(fd, 'r+') as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        text = fp.read()
+        value = json.loads(text) if text.strip() else default
+        yield value
+        fp.seek(0)
+        fp.truncate()
+        json.dump(value, fp)
+
+
+def is_process_alive(pid):
+    """
+    Check whether a process is alive.
+
+    Parameters
+    ----------
+    pid : int
+        process id
+
+    Returns
+    -------
+    alive : bool
+        whether the process is alive
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # pragma: no cover
+        pass
+    return True
+
+
+def is_local_endpoint(configuration):
+    """
+    Check whether containers run on this host.
+
+    Parameters
+    ----------
+    configuration : dict
+        configuration whose `endpoint` is set if the container was dispatched to one of several
+        docker endpoints
+
+    Returns
+    -------
+    local : bool
+        whether the docker daemon runs on this host (endpoints given by a docker context are only
+        local if the host of the context has been resolved to a unix socket)
+    """
+    endpoint = configuration.get('endpoint')
+    return not endpoint or endpoint.get('host', '').startswith('unix://')
+
+
+def get_host_cpus(path='/proc/stat'):
+    """
+    Get the number of CPUs of the host.
+
+    Parameters
+    ----------
+    path : str
+        path of the kernel's CPU statistics
+
+    Returns
+    -------
+    cpus : int or None
+        number of online CPUs or `None` if the number cannot be determined
+    """
+    try:
+        with open(path) as fp:
+            cpus = sum(1 for line in fp if line.startswith('cpu') and line[3].isdigit())
+    except OSError:  # pragma: no cover
+        return os.cpu_count()
+    return cpus or os.cpu_count()
+
+
+def read_dockerignore(path):
+    """
+    Read the patterns of a `.dockerignore` file.
+
+    Parameters
+    ----------
+    path : str
+        path of the build context
+
+    Returns
+    -------
+    patterns : list[str]
+        patterns of files to exclude from the build context
+    """
+    try:
+        with open(os.path.join(path, '.dockerignore')) as fp:
+            lines = [line.strip() for line in fp]
+    except OSError:
+        return []
+    return [os.path.normpath(line.lstrip('/')) for line in lines
+            if line and not line.startswith('#')]
+
+
+def is_ignored(relpath, patterns):
+    """
+    Check whether a path is excluded from the build context.
+
+    Parameters
+    ----------
+    relpath : str
+        path relative to the build context
+    patterns : list[str]
+        patterns from the `.dockerignore` file (later patterns take precedence and patterns
+        starting with `!` re-include files)
+
+    Returns
+    -------
+    ignored : bool
+        whether the path is excluded
+    """
+    ignored = False
+    for pattern in patterns:
+        negate = pattern.startswith('!')
+        pattern = pattern.lstrip('!')
+        # Patterns also apply to all children of matching directories
+        if fnmatch.fnmatch(relpath, pattern) or fnmatch.fnmatch(relpath, pattern + '/*') or \
+                fnmatch.fnmatch(relpath, pattern.replace('**/', '')):
+            ignored = not negate
+    return ignored
@@ -0,0 +1,474 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import ctypes
+import ctypes.util
+import errno
+import fnmatch
+import logging
+import os
+import select
+import struct
+import subprocess
+import time
+
+from .util import is_ignored, read_dockerignore
+
+
+# Constants from `sys/inotify.h`
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | \
+    IN_DELETE
+EVENT = struct.Struct('iIII')
+# Directories that are never watched because docker interface and git write to them
+EXCLUDED_DIRS = {'.di', '.git'}
+
+
+def match_patterns(relpath, patterns):
+    """
+    Check whether a relative path or its file name matches any of the glob patterns.
+    """
+    name = os.path.basename(relpath)
+    return any(fnmatch.fnmatch(relpath, pattern) or fnmatch.fnmatch(name, pattern)
+               for pattern in patterns)
+
+
+class PathFilter:
+    """
+    Decide which files in a workspace are watched.
+
+    Files are watched if they are not excluded by the `.dockerignore` file of the workspace, match
+    at least one of the `include` patterns, and match none of the `exclude` patterns. Patterns are
+    matched against paths relative to the workspace and against file names.
+
+    Parameters
+    ----------
+    root : str
+        path of the workspace
+    include : list[str] or None
+        glob patterns of files to watch (defaults to all files)
+    exclude : list[str] or None
+        glob patterns of files to ignore
+    """
+    def __init__(self, root, include=None, exclude=None):
+        self.root = root
+        self.include = include or ['*']
+        self.exclude = exclude or []
+        self.patterns = read_dockerignore(root)
+
+    def is_pruned(self, relpath):
+        """
+        Check whether a directory and all its children are excluded.
+        """
+        return relpath.split(os.sep)[0] in EXCLUDED_DIRS or is_ignored(relpath, self.patterns) \
+            or match_patterns(relpath, self.exclude)
+
+    def __call__(self, relpath):
+        if relpath.split(os.sep)[0] in EXCLUDED_DIRS or is_ignored(relpath, self.patterns):
+            return False
+        return match_patterns(relpath, self.include) and not match_patterns(relpath, self.exclude)
+
+
+class PollingWatcher:
+    """
+    Detect changes of files by periodically comparing their size and modification time.
+
+    Parameters
+    ----------
+    root : str
+        path of the directory to watch
+    path_filter : PathFilter
+        filter applied to paths relative to `root`
+    interval : float
+        interval between scans in seconds
+    """
+    def __init__(self, root, path_filter, interval=0.5):
+        self.root = root
+        self.path_filter = path_filter
+        self.interval = interval
+        self.state = self.scan()
+
+    def scan(self):
+        """
+        Get the size and modification time of all watched files.
+        """
+        state = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            reldir = os.path.relpath(dirpath, self.root)
+            dirnames[:] = [dirname for dirname in dirnames if not self.path_filter.is_pruned(
+                os.path.normpath(os.path.join(reldir, dirname)))]
+            for filename in filenames:
+                relpath = os.path.normpath(os.path.join(reldir, filename))
+                if self.path_filter(relpath):
+                    try:
+                        stat = os.stat(os.path.join(dirpath, filename))
+                    except OSError:
+                        continue
+                    state[relpath] = (stat.st_size, stat.st_mtime_ns)
+        return state
+
+    def poll(self, timeout=None):
+        """
+        Wait for changes.
+
+        Parameters
+        ----------
+        timeout : float or None
+            maximum time to wait in seconds or `None` to wait indefinitely
+
+        Returns
+        -------
+        changes : set[str]
+            paths of changed files relative to the root (empty if the timeout expired)
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            state = self.scan()
+            changes = {relpath for relpath in set(state) | set(self.state)
+                       if state.get(relpath) != self.state.get(relpath)}
+            self.state = state
+            if changes:
+                return changes
+            remaining = self.interval if deadline is None else deadline - time.time()
+            if remaining <= 0:
+                return set()
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Detect changes of files using the inotify API of the Linux kernel.
+
+    Parameters
+    ----------
+    root : str
+        path of the directory to watch
+    path_filter : PathFilter
+        filter applied to paths relative to `root`
+
+    Raises
+    ------
+    OSError
+        if inotify is not available or the limit of watches has been reached
+    """
+    def __init__(self, root, path_filter):
+        self.root = root
+        self.path_filter = path_filter
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            self._raise()
+        self.watches = {}
+        try:
+            self.add_watches('.')
+        except OSError:
+            self.close()
+            raise
+
+    def _raise(self):
+        code = ctypes.get_errno()
+        raise OSError(code, os.strerror(code))
+
+    def add_watches(self, reldir):
+        """
+        Watch a directory and all its children that are not pruned.
+
+        Returns
+        -------
+        relpaths : list[str]
+            paths of the files in the directories relative to the root
+        """
+        relpaths = []
+        for dirpath, dirnames, filenames in os.walk(os.path.join(self.root, reldir)):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                self._raise()
+            self.watches[wd] = os.path.normpath(os.path.relpath(dirpath, self.root))
+            dirnames[:] = [dirname for dirname in dirnames if not self.path_filter.is_pruned(
+                os.path.normpath(os.path.join(self.watches[wd], dirname)))]
+            relpaths.extend(os.path.normpath(os.path.join(self.watches[wd], filename))
+                            for filename in filenames)
+        return relpaths
+
+    def read_events(self):
+        """
+        Read pending events and return the paths they refer to relative to the root.
+        """
+        try:
+            buffer = os.read(self.fd, 65536)
+        except OSError as ex:
+            if ex.errno == errno.EAGAIN:
+                return set()
+            raise  # pragma: no cover
+        relpaths = set()
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = EVENT.unpack_from(buffer, offset)
+            offset += EVENT.size
+            name = os.fsdecode(buffer[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:  # pragma: no cover
+                # Events were lost so we report a change of the root
+                relpaths.add('.')
+                continue
+            if wd not in self.watches:
+                continue
+            relpath = os.path.normpath(os.path.join(self.watches[wd], name))
+            if mask & IN_ISDIR:
+                # Watch new directories and report the files created before the watch was added
+                if mask & (IN_CREATE | IN_MOVED_TO) and not self.path_filter.is_pruned(relpath):
+                    try:
+                        relpaths.update(self.add_watches(relpath))
+                    except OSError:  # pragma: no cover
+                        pass
+                continue
+            relpaths.add(relpath)
+        return {relpath for relpath in relpaths if relpath == '.' or self.path_filter(relpath)}
+
+    def poll(self, timeout=None):
+        """
+        Wait for changes.
+
+        Parameters
+        ----------
+        timeout : float or None
+            maximum time to wait in seconds or `None` to wait indefinitely
+
+        Returns
+        -------
+        changes : set[str]
+            paths of changed files relative to the root (empty if the timeout expired)
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - time.time(), 0)
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            changes = self.read_events() if readable else set()
+            if changes or (deadline is not None and time.time() >= deadline):
+                return changes
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def create_watcher(root, path_filter, interval=0.5):
+    """
+    Create a watcher using inotify if available and polling otherwise.
+
+    Parameters
+    ----------
+    root : str
+        path of the directory to watch
+    path_filter : PathFilter
+        filter applied to paths relative to `root`
+    interval : float
+        interval between scans in seconds if polling
+
+    Returns
+    -------
+    watcher : InotifyWatcher or PollingWatcher
+        watcher
+    """
+    try:
+        return InotifyWatcher(root, path_filter)
+    except (OSError, AttributeError) as ex:
+        logging.getLogger('di').debug("falling back to polling because inotify is not available: "
+                                      "%s", ex)
+        return PollingWatcher(root, path_filter, interval)
+
+
+def wait_for_changes(watcher, debounce, timeout=None):
+    """
+    Wait for changes and collect further changes until none occur for `debounce` seconds.
+
+    Parameters
+    ----------
+    watcher : InotifyWatcher or PollingWatcher
+        watcher
+    debounce : float
+        quiet period in seconds
+    timeout : float or None
+        maximum time to wait for the first change in seconds
+
+    Returns
+    -------
+    changes : set[str]
+        paths of changed files relative to the root of the watcher
+    detected : float or None
+        time at which the first change was detected
+    """
+    changes = watcher.poll(timeout)
+    if not changes:
+        return changes, None
+    detected = time.time()
+    while True:
+        more = watcher.poll(debounce)
+        if not more:
+            return changes, detected
+        changes |= more
+
+
+def get_build_inputs(configuration):
+    """
+    Get the paths of files that require the image to be built again if they change.
+
+    Parameters
+    ----------
+    configuration : dict
+        configuration
+
+    Returns
+    -------
+    paths : list[str]
+        paths of the Dockerfile and `.dockerignore` of the build context
+    patterns : list[str]
+        glob patterns of further inputs of the build relative to the workspace
+    """
+    build = configuration.get('build')
+    if not build or 'file' not in build:
+        return [], []
+    workspace = configuration['workspace']
+    paths = [os.path.join(workspace, build['path'], build['file']),
+             os.path.join(workspace, build['path'], '.dockerignore')]
+    paths = [os.path.normpath(os.path.relpath(path, workspace)) for path in paths]
+    return paths, configuration['run']['watch'].get('build', [])
+
+
+def watch(configuration, argv, stop=None, logger=None):
+    """
+    Run a command in a container and restart it whenever watched files in the workspace change.
+
+    The container is created once and restarted using `docker start` for as long as the image
+    does not change. If the Dockerfile, the `.dockerignore` file, or files matching the build
+    patterns change, the image is built using `di build` first and the container is created again.
+
+    Parameters
+    ----------
+    configuration : dict
+        resolved configuration
+    argv : list[str]
+        `docker run` command
+    stop : threading.Event or None
+        event to stop watching
+    logger : logging.Logger or None
+        logger for progress reports
+
+    Returns
+    -------
+    status : int
+        status code of the last run of the command
+    """
+    logger = logger or logging.getLogger('di')
+    run = configuration['run']
+    options = run['watch']
+    workspace = configuration['workspace']
+    docker = argv[:argv.index('run')]
+    # The container is removed by the watcher rather than docker because it is restarted
+    create = docker + ['create'] + [part for part in argv[len(docker) + 1:]
+                                    if part != '--rm' and not part.startswith('--rm=')]
+    remove = bool(run.get('rm'))
+    start = docker + ['start', '--attach']
+    if run.get('interactive'):
+        start.append('--interactive')
+    path_filter = PathFilter(workspace, options.get('include'), options.get('exclude'))
+    build_paths, build_patterns = get_build_inputs(configuration)
+    watcher = create_watcher(workspace, path_filter, options['poll-interval'])
+    logger.info("watching '%s' using %s", workspace, watcher.__class__.__name__)
+
+    container = process = None
+    status = 0
+    changes, detected = set(), None
+    try:
+        while True:
+            build_time = None
+            if any(relpath in build_paths or relpath == '.' or
+                   match_patterns(relpath, build_patterns) for relpath in changes):
+                build_time = time.time()
+                if build_image(configuration):
+                    logger.warning("failed to build the image; waiting for further changes")
+                    changes, detected = wait_for_changes(watcher, options['debounce'])
+                    continue
+                build_time = time.time() - build_time
+                path_filter.patterns = read_dockerignore(workspace)
+                if container:
+                    subprocess.call(docker + ['rm', '--force', container],
+                                    stdout=subprocess.DEVNULL)
+                    container = None
+            if container is None:
+                container = subprocess.check_output(create, universal_newlines=True).strip()
+            process = subprocess.Popen(start + [container])
+            if detected is not None:
+                logger.info("restarted after %d changed file(s) in %.3fs%s", len(changes),
+                            time.time() - detected, '' if build_time is None else
+                            ' (including %.3fs to build the image)' % build_time)
+
+            # Wait for changes while the command is running and after it has completed
+            changes = set()
+            while not changes:
+                if stop is not None and stop.is_set():
+                    return status
+                if process is not None and process.poll() is not None:
+                    status = process.returncode
+                    logger.info("command exited with status code %d; waiting for changes", status)
+                    process = None
+                changes, detected = wait_for_changes(watcher, options['debounce'],
+                                                     options['poll-interval'])
+            if process is not None:
+                if process.poll() is None:
+                    subprocess.call(docker + ['kill', container], stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL)
+                status = process.wait()
+                process = None
+    except KeyboardInterrupt:
+        logger.info("stopped watching")
+        return status
+    finally:
+        if process is not None and process.poll() is None:
+            subprocess.call(docker + ['kill', container], stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+            process.wait()
+        if container and remove:
+            subprocess.call(docker + ['rm', '--force', container], stdout=subprocess.DEVNULL)
+        watcher.close()
+
+
+def build_image(configuration):
+    """
+    Build the image of a configuration using `di build`.
+
+    Returns
+    -------
+    status : int
+        status code of the build
+    """
+    from .session import Session
+    configuration = copy.deepcopy(configuration)
+    configuration.pop('status-code', None)
+    return Session().apply('build', configuration, []).status
@@ -0,0 +1,219 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import ast
+import copy
+import os
+import pprint
+import py_compile
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipapp
+
+from .plugins.base import BasePlugin, iter_entry_points, load_object
+from . import util
+
+
+PACKAGE = os.path.dirname(os.path.abspath(__file__))
+MAIN = """from docker_interface.cli import entry_point
+
+entry_point()
+"""
+
+
+def get_builtin_plugins(setup=None):
+    """
+    Get the built-in plugins listed in `setup.py`.
+
+    Parameters
+    ----------
+    setup : str or None
+        path of `setup.py` (defaults to the file next to the package)
+
+    Returns
+    -------
+    plugins : dict[str, str]
+        mapping from plugin names to references of the form `module:attribute`
+    """
+    setup = setup or os.path.join(os.path.dirname(PACKAGE), 'setup.py')
+    try:
+        with open(setup) as fp:
+            tree = ast.parse(fp.read())
+    except OSError:
+        # Fall back to the entry points of the installed package
+        return {entry_point.name: entry_point.value
+                for entry_point in iter_entry_points('docker_interface.plugins')
+                if entry_point.value.startswith('docker_interface.')}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and \
+                any(getattr(target, 'id', None) == 'PLUGINS' for target in node.targets):
+            names = ast.literal_eval(node.value)
+            return {name.lower(): 'docker_interface.plugins:%sPlugin' % name for name in names}
+    raise ValueError("could not find `PLUGINS` in '%s'" % setup)
+
+
+def build_frozen_module(plugins):
+    """
+    Generate the source of a module that freezes the plugin registry and the merged schema.
+
+    Parameters
+    ----------
+    plugins : dict[str, str]
+        mapping from plugin names to references of the form `module:attribute`
+
+    Returns
+    -------
+    source : str
+        source of the module
+    """
+    schema = copy.deepcopy(BasePlugin.SCHEMA)
+    for reference in plugins.values():
+        schema = util.merge(schema, copy.deepcopy(load_object(reference).SCHEMA))
+    return "PLUGINS = %s\n\nSCHEMA = %s\n" % (pprint.pformat(plugins), pprint.pformat(schema))
+
+
+def build_archive(output, interpreter='/usr/bin/env python3', requirements=None, setup=None):
+    """
+    Build an executable zipapp of docker interface.
+
+    The archive contains the sources of the package together with bytecode compiled by the
+    current interpreter and a frozen registry of the built-in plugins and their merged schema.
+    Plugins installed separately are discovered using their entry points as usual. The bytecode is
+    stored next to the sources because zip imports ignore `__pycache__` directories; other
+    interpreters fall back to the sources.
+
+    Parameters
+    ----------
+    output : str
+        path of the archive
+    interpreter : str
+        interpreter for the shebang line of the archive
+    requirements : list[str] or None
+        requirements to install into the archive using `pip` (packages with extension modules
+        cannot be imported from an archive and must be installed on the host instead)
+    setup : str or None
+        path of `setup.py` used to discover the built-in plugins
+    """
+    with tempfile.TemporaryDirectory() as staging:
+        if requirements:
+            subprocess.check_call([sys.executable, '-m', 'pip', 'install', '--quiet',
+                                   '--no-compile', '--target', staging] + list(requirements))
+        package = os.path.join(staging, 'docker_interface')
+        shutil.copytree(PACKAGE, package, ignore=shutil.ignore_patterns('__pycache__', '*.py[co]'))
+        with open(os.path.join(package, '_frozen.py'), 'w') as fp:
+            fp.write(build_frozen_module(get_builtin_plugins(setup)))
+        with open(os.path.join(staging, '__main__.py'), 'w') as fp:
+            fp.write(MAIN)
+
+        # Compile all modules such that the bytecode is used without checking the sources
+        kwargs = {}
+        if hasattr(py_compile, 'PycInvalidationMode'):
+            kwargs['invalidation_mode'] = py_compile.PycInvalidationMode.UNCHECKED_HASH
+        for dirpath, _, filenames in os.walk(staging):
+            for filename in filenames:
+                if filename.endswith('.py'):
+                    filename = os.path.join(dirpath, filename)
+                    py_compile.compile(filename, cfile=filename + 'c',
+                                       dfile=os.path.relpath(filename, staging), doraise=True,
+                                       **kwargs)
+
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        zipapp.create_archive(staging, output, interpreter)
+
+
+def measure_startup(args, env=None, repeat=5):
+    """
+    Measure the wall time of running a command.
+
+    Parameters
+    ----------
+    args : list[str]
+        command to run
+    env : dict or None
+        environment of the command
+    repeat : int
+        number of repetitions
+
+    Returns
+    -------
+    times : list[float]
+        wall times of each run in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        tic = time.time()
+        subprocess.check_call(args, env=env, stdout=subprocess.DEVNULL)
+        times.append(time.time() - tic)
+    return times
+
+
+def benchmark(archive, args=None, repeat=5):
+    """
+    Compare the cold start of an archive with the cold start of the installed package.
+
+    The package is run from a fresh copy of its sources without writing bytecode to emulate the
+    first invocation after `pip install` on an ephemeral worker.
+
+    Parameters
+    ----------
+    archive : str
+        path of the archive
+    args : list[str] or None
+        arguments passed to `di` (defaults to `--help`)
+    repeat : int
+        number of repetitions
+
+    Returns
+    -------
+    times : dict[str, list[float]]
+        wall times of the archive and the installed package in seconds
+    """
+    args = args or ['--help']
+    with tempfile.TemporaryDirectory() as path:
+        shutil.copytree(PACKAGE, os.path.join(path, 'docker_interface'),
+                        ignore=shutil.ignore_patterns('__pycache__', '*.py[co]'))
+        env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+        return {
+            'zipapp': measure_startup([sys.executable, archive] + args, env, repeat),
+            'installed': measure_startup([sys.executable, '-c', MAIN] + args,
+                                         dict(env, PYTHONPATH=path), repeat),
+        }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser('python -m docker_interface.zipapp',
+                                     description='Build an executable zipapp of docker interface.')
+    parser.add_argument('--output', '-o', default='di.pyz', help='Path of the archive.')
+    parser.add_argument('--python', default='/usr/bin/env python3',
+                        help='Interpreter for the shebang line of the archive.')
+    parser.add_argument('--requirement', '-r', action='append', dest='requirements',
+                        help='Requirement to install into the archive.')
+    parser.add_argument('--benchmark', type=int, nargs='?', const=5, default=0,
+                        help='Compare the cold start of the archive with the installed package.')
+    args = parser.parse_args(args)
+
+    build_archive(args.output, args.python, args.requirements)
+    print("built '%s' (%d KiB)" % (args.output, os.path.getsize(args.output) // 1024))
+    if args.benchmark:
+        for name, times in benchmark(args.output, repeat=args.benchmark).items():
+            print("%-10s min %.3fs median %.3fs" % (name, min(times),
+                                                    sorted(times)[len(times) // 2]))
+
+
+if __name__ == '__main__':
+    main()
@@ -17,7 +17,9 @@ from setuptools import setup, find_packages
 PLUGINS = [
     'Run', 'Build', 'WorkspaceMount', 'Substitution', 'User', 'HomeDir', 'RunConfiguration',
     'BuildConfiguration', 'Validation', 'GoogleCloudCredentials', 'GoogleContainerRegistry',
-    'Jupyter'
+    'Jupyter', 'History', 'Cpuset', 'SharedMemory', 'Cache', 'CachePrune',
+    'GitCache', 'Images', 'Compile', 'Measure', 'ImageAnalyze', 'PythonBuild',
+    'Endpoint', 'Queue', 'QueueServe', 'Dataset', 'Label', 'GarbageCollection'
 ]
 
 
@@ -0,0 +1,32 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from docker_interface import history, util
+
+
+@pytest.fixture(autouse=True)
+def history_database(tmpdir_factory, monkeypatch):
+    # Keep the run history of tests out of the workspaces, e.g. those of the examples
+    path = str(tmpdir_factory.mktemp('history').join('history.sqlite'))
+    monkeypatch.setattr(history, 'DATABASE', path)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def shared_dir(tmpdir_factory, monkeypatch):
+    # Keep state shared by all users of the host, e.g. CPU leases, out of the host
+    path = str(tmpdir_factory.mktemp('shared').join('docker-interface'))
+    monkeypatch.setattr(util, 'SHARED_DIR', path)
+    return path
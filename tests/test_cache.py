@@ -0,0 +1,106 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import os
+import pytest
+from docker_interface import usage
+from docker_interface.plugins import cache
+
+
+@pytest.fixture(autouse=True)
+def index(tmpdir, monkeypatch):
+    path = str(tmpdir.join('usage.json'))
+    monkeypatch.setattr(usage, 'INDEX', path)
+    return path
+
+
+def test_cache_plugin():
+    configuration = {
+        'dry-run': True,
+        'run': {
+            'env': {'PIP_CACHE_DIR': '/custom'},
+            'caches': [
+                {'kind': 'pip'},
+                {'kind': 'ccache', 'volume': 'my-ccache'},
+                {'kind': 'custom', 'path': '/models', 'env': ['MODEL_CACHE']},
+            ]
+        }
+    }
+    configuration = cache.CachePlugin().apply(configuration, None, argparse.Namespace())
+    run = configuration['run']
+    assert [(mount['source'], mount['destination']) for mount in run['mount']] == [
+        ('di-cache-pip', '/var/cache/docker-interface/pip'),
+        ('my-ccache', '/var/cache/docker-interface/ccache'),
+        ('di-cache-custom', '/models'),
+    ]
+    assert run['env'] == {
+        'PIP_CACHE_DIR': '/custom',
+        'CCACHE_DIR': '/var/cache/docker-interface/ccache',
+        'MODEL_CACHE': '/models',
+    }
+
+
+def test_create_volume(tmpdir, caplog):
+    # Volumes do not exist and the helper container fails
+    log = tmpdir.join('docker.log')
+    docker = tmpdir.join('docker')
+    docker.write('#!/bin/sh\necho "$@" >> %s\ncase "$1" in volume) [ "$2" = create ];; '
+                 '*) exit 1;; esac\n' % log)
+    docker.chmod(0o755)
+    configuration = {'docker': str(docker), 'run': {'image': 'distroless'}}
+    cache.CachePlugin().create_volume(configuration, 'di-cache-pip', 'pip')
+    inspect, create, chmod = [line.split() for line in log.read().splitlines()]
+    assert create[:2] == ['volume', 'create'] and create[-1] == 'di-cache-pip'
+    assert chmod[-4:] == [cache.CachePlugin.HELPER_IMAGE, 'chmod', '1777', '/cache']
+    assert "could not make cache volume 'di-cache-pip' writable" in caplog.text
+
+
+def test_shared_index(shared_dir, monkeypatch):
+    # Cache volumes are shared by all users so their last use is recorded in a host-wide index
+    monkeypatch.setattr(usage, 'INDEX', None)
+    usage.touch('volume', 'di-cache-pip')
+    path = os.path.join(shared_dir, 'usage.json')
+    assert usage.get_index() == path and os.stat(path).st_mode & 0o777 == 0o666
+    assert 'di-cache-pip' in usage.get_last_used('volume')
+
+
+def test_get_cache_volumes(monkeypatch):
+    volumes = [
+        {'Name': 'di-cache-pip', 'Links': '0', 'Size': '1.5GB',
+         'Labels': '%s=pip,%s=100' % (usage.label('cache'), usage.label('created'))},
+        {'Name': 'di-cache-npm', 'Links': '1', 'Size': 'N/A',
+         'Labels': '%s=npm,%s=200' % (usage.label('cache'), usage.label('created'))},
+        {'Name': 'other', 'Links': '0', 'Size': '1GB', 'Labels': ''},
+    ]
+    monkeypatch.setattr(cache.subprocess, 'check_output', lambda *args, **kwargs:
+                        json.dumps(volumes))
+    usage.touch('volume', 'di-cache-npm')
+    pip, npm = cache.get_cache_volumes('docker')
+    assert pip == {'name': 'di-cache-pip', 'kind': 'pip', 'size': 1500000000, 'links': 0,
+                   'created': 100, 'last_used': 100}
+    assert npm['size'] == 0 and npm['links'] == 1 and npm['last_used'] > 200
+
+
+def test_select_evictions():
+    objects = [
+        {'name': 'a', 'size': 5, 'last_used': 3},
+        {'name': 'b', 'size': 3, 'last_used': 1},
+        {'name': 'c', 'size': 4, 'last_used': 2},
+    ]
+    assert [obj['name'] for obj in usage.select_evictions(objects, 12)] == []
+    assert [obj['name'] for obj in usage.select_evictions(objects, 9)] == ['b']
+    assert [obj['name'] for obj in usage.select_evictions(objects, 5)] == ['b', 'c']
+    assert [obj['name'] for obj in usage.select_evictions(objects, 0)] == ['b', 'c', 'a']
@@ -0,0 +1,117 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import subprocess
+import time
+import pytest
+from docker_interface import cli
+from docker_interface.launcher import Launcher
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('plain', 'plain'),
+    ('', "''"),
+    ('a b', "'a b'"),
+    ('\0X\0', '"${X}"'),
+    ("--user=\0UID\0:'", '--user="${UID}"\':\'"\'"\'\''),
+])
+def test_quote(value, expected):
+    assert Launcher.quote(value) == expected
+
+
+def test_quote_unbalanced():
+    with pytest.raises(ValueError):
+        Launcher.quote('\0X')
+
+
+def test_variable_conflict():
+    launcher = Launcher('run')
+    assert launcher.variable('X', 'echo 1') == launcher.variable('X', 'echo 1')
+    with pytest.raises(ValueError):
+        launcher.variable('X', 'echo 2')
+
+
+@pytest.fixture
+def workspace(tmpdir):
+    # Record the commands and emulate copying files from a container
+    docker = tmpdir.join('docker')
+    docker.write('#!/bin/sh\n'
+                 'echo "$@" >> %s\n'
+                 'case "$1" in create) echo c0ffee;; cp) echo "root:x:0:0" > "$3";; esac\n'
+                 % tmpdir.join('docker.log'))
+    docker.chmod(0o755)
+    tmpdir.join('di.yml').write('docker: %s\nrun:\n  image: ubuntu\n  env:\n    A: "a b"\n'
+                                % docker)
+    return tmpdir
+
+
+def test_compile_run(workspace):
+    cli.entry_point(['-f', str(workspace.join('di.yml')), 'compile', 'run', 'echo', 'hello'])
+    launcher = workspace.join('di-run.sh')
+    assert 'exec ' in launcher.read()
+
+    output = subprocess.check_output([str(launcher), 'world'], stdin=subprocess.DEVNULL,
+                                     universal_newlines=True)
+    assert output == ''
+    create, _, _, _, run = workspace.join('docker.log').read().splitlines()
+    assert create.startswith('create --label=') and create.endswith(' ubuntu sh')
+    # The creation time of objects is computed when the launcher runs
+    created = re.search(r'--label=\S+\.created=(\d+)', run).group(1)
+    assert abs(int(created) - time.time()) < 60
+    uid, gid = subprocess.check_output(['id', '-u']), subprocess.check_output(['id', '-g'])
+    assert '--user=%s:%s' % (int(uid), int(gid)) in run
+    assert '--tty=False' in run and '--env=A=a b' in run
+    assert run.endswith('ubuntu echo hello world')
+    passwd = workspace.join('.di', 'users', 'passwd-%d' % int(uid)).read().splitlines()
+    assert passwd[0] == 'root:x:0:0' and passwd[1].startswith(
+        subprocess.check_output(['id', '-un'], universal_newlines=True).strip())
+    assert workspace.join('.di', 'home').check(dir=True)
+
+    # The launcher refuses to run once the configuration has changed
+    workspace.join('di.yml').write('\n', mode='a')
+    process = subprocess.run([str(launcher)], stderr=subprocess.PIPE)
+    assert process.returncode == 2 and b'has changed' in process.stderr
+
+
+def test_compile_run_as_other_user(workspace):
+    cli.entry_point(['-f', str(workspace.join('di.yml')), 'compile', 'run'])
+    # Emulate a different user running the launcher
+    bin_dir = workspace.ensure_dir('bin')
+    fake_id = bin_dir.join('id')
+    fake_id.write('#!/bin/sh\ncase "$1" in -u|-g) echo 4242;; -un) echo someone;; '
+                  '-gn) echo team;; esac\n')
+    fake_id.chmod(0o755)
+    env = dict(os.environ, PATH='%s:%s' % (bin_dir, os.environ['PATH']))
+    subprocess.check_call([str(workspace.join('di-run.sh'))], stdin=subprocess.DEVNULL, env=env)
+    run = workspace.join('docker.log').read().splitlines()[-1]
+    assert '--user=4242:4242' in run
+    # The home directory is derived from the user running the launcher
+    assert '--env=HOME=/someone' in run and ',destination=/someone' in run
+    passwd = workspace.join('.di', 'users', 'passwd-4242').read().splitlines()
+    assert passwd[1] == 'someone:x:4242:4242:someone:/someone:/bin/sh'
+
+
+def test_compile_jupyter(workspace):
+    output = workspace.join('notebook.sh')
+    cli.entry_point(['-f', str(workspace.join('di.yml')), 'compile', '--output', str(output),
+                     'run', 'jupyter', 'notebook'])
+    process = subprocess.run([str(output)], stdin=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                             universal_newlines=True, check=True)
+    assert 'available at http://' in process.stderr
+    run = workspace.join('docker.log').read().splitlines()[-1]
+    token = process.stderr.strip().rpartition('token=')[2]
+    assert len(token) == 32 and "--NotebookApp.token='%s'" % token in run
+    assert '--publish=:%s:8888' % process.stderr.split(':')[2].partition('?')[0] in run
@@ -0,0 +1,144 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import os
+import pytest
+from docker_interface import Session, config
+from docker_interface.plugins import BasePlugin
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    config.CACHE.clear()
+    yield
+    config.CACHE.clear()
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    # Record the files that are parsed
+    parsed = []
+    read_file = config.read_file
+
+    def _read_file(path):
+        parsed.append(os.path.basename(path))
+        return read_file(path)
+
+    monkeypatch.setattr(config, 'read_file', _read_file)
+    return parsed
+
+
+@pytest.mark.parametrize('base, overlay, expected', [
+    ({'a': {'b': 1, 'c': 2}}, {'a': {'b': 3}}, {'a': {'b': 3, 'c': 2}}),
+    ({'a': [1, 2]}, {'a': [3]}, {'a': [3]}),
+    ({'a': [1, 2]}, {'a+': [3]}, {'a': [1, 2, 3]}),
+    ({}, {'a+': [3]}, {'a': [3]}),
+    ({'a': {'b': 1, 'c': 2}}, {'a': {'b': None}}, {'a': {'c': 2}}),
+    ({'a': {'b': 1}}, {'a': 'x'}, {'a': 'x'}),
+    ({}, {'a': {'b+': [1], 'c': None}}, {'a': {'b': [1], 'c': None}}),
+    ({'a': {'b': 1}}, {'a': {'c': None}}, {'a': {'b': 1, 'c': None}}),
+    ({'a': 'x'}, {'a': {'b': {'c+': [1]}}}, {'a': {'b': {'c': [1]}}}),
+])
+def test_merge_configurations(base, overlay, expected):
+    assert config.merge_configurations(base, overlay) == expected
+
+
+def test_merge_configurations_invalid():
+    with pytest.raises(ValueError):
+        config.merge_configurations({'a': 'x'}, {'a+': [1]})
+
+
+@pytest.fixture
+def tree(tmpdir):
+    tmpdir.join('base.yml').write('workspace: .\nrun:\n  image: ubuntu\n  env: {A: "1", B: "2"}\n'
+                                  '  mount: [{type: tmpfs, destination: /tmp}]\n')
+    tmpdir.join('gpu.yml').write('run:\n  runtime: nvidia\n')
+    project = tmpdir.mkdir('project')
+    project.join('di.yml').write('extends: [../base.yml, ../gpu.yml]\nworkspace: .\nrun:\n'
+                                 '  env: {B: null}\n  mount+: [{type: tmpfs, destination: /x}]\n')
+    project.join('local.yml').write('run:\n  image: local\n')
+    return tmpdir
+
+
+def test_load_configuration(tree):
+    project = tree.join('project')
+    configuration = config.load_configuration([str(project.join('di.yml')),
+                                               str(project.join('local.yml'))])
+    assert os.path.samefile(configuration['workspace'], str(project))
+    assert configuration['run'] == {
+        'image': 'local',
+        'runtime': 'nvidia',
+        'env': {'A': '1'},
+        'mount': [{'type': 'tmpfs', 'destination': '/tmp'},
+                  {'type': 'tmpfs', 'destination': '/x'}],
+    }
+    assert configuration['config-files'] == [str(tree.join(name)) for name in [
+        'base.yml', 'gpu.yml', 'project/di.yml', 'project/local.yml']]
+
+
+def test_load_configuration_forward_env(tmpdir):
+    # `null` forwards an environment variable of the host rather than removing it
+    tmpdir.join('di.yml').write('workspace: .\nplugins: [runconfiguration, run, substitution, '
+                                'validation]\nrun:\n  image: ubuntu\n  tty: false\n'
+                                '  env: {FOO: null, X: "1"}\n')
+    configuration = config.load_configuration(str(tmpdir.join('di.yml')))
+    assert configuration['run']['env'] == {'FOO': None, 'X': '1'}
+    with Session().prepare(configuration) as preparation:
+        assert '--env=FOO' in preparation.argv
+
+
+def test_load_configuration_cycle(tmpdir):
+    tmpdir.join('a.yml').write('extends: b.yml\n')
+    tmpdir.join('b.yml').write('extends: a.yml\n')
+    with pytest.raises(ValueError):
+        config.load_configuration(str(tmpdir.join('a.yml')))
+
+
+def test_memoisation(tree, parses):
+    # Resolving many configurations that share a base parses the base once
+    for i in range(5):
+        tree.join('leaf%d.yml' % i).write('extends: base.yml\nrun:\n  cmd: [echo, "%d"]\n' % i)
+        config.load_configuration(str(tree.join('leaf%d.yml' % i)))
+    assert parses.count('base.yml') == 1
+
+    # Resolved files are cached on disk across processes and invalidated when any input changes
+    cache_dir = str(tree.join('cache'))
+    config.CACHE.clear()
+    config.load_configuration(str(tree.join('leaf0.yml')), cache_dir)
+    config.CACHE.clear()
+    del parses[:]
+    config.load_configuration(str(tree.join('leaf0.yml')), cache_dir)
+    assert not parses
+    tree.join('base.yml').write('run:\n  image: debian\n')
+    config.CACHE.clear()
+    configuration = config.load_configuration(str(tree.join('leaf0.yml')), cache_dir)
+    assert configuration['run']['image'] == 'debian' and parses == ['leaf0.yml', 'base.yml']
+
+
+def test_base_plugin_overlays(tree, tmpdir, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir.join('xdg')))
+    project = tree.join('project')
+    parser = argparse.ArgumentParser()
+    base = BasePlugin()
+    base.add_arguments(parser)
+    args, _ = parser.parse_known_args(['-f', str(project.join('di.yml')), '-f',
+                                       str(project.join('local.yml')), 'run'])
+    configuration = base.apply(None, None, args)
+    assert configuration['run']['image'] == 'local'
+    assert len(configuration['config-files']) == 4
+
+    args, _ = parser.parse_known_args(['-f', str(project.join('missing.yml')), 'run'])
+    with pytest.raises(FileNotFoundError):
+        base.apply(None, None, args)
@@ -0,0 +1,99 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import pytest
+from docker_interface.plugins import cpuset
+
+
+@pytest.fixture
+def sysfs(tmpdir):
+    # Two NUMA nodes with four physical cores each and two hyperthreads per core
+    root = tmpdir.mkdir('system')
+    root.mkdir('cpu').join('online').write('0-15\n')
+    for node, cpus in enumerate(['0-3,8-11', '4-7,12-15']):
+        root.join('node').ensure_dir('node%d' % node).join('cpulist').write(cpus + '\n')
+    for cpu in range(16):
+        root.join('cpu').ensure_dir('cpu%d' % cpu, 'topology').join('thread_siblings_list') \
+            .write('%d,%d\n' % (cpu % 8, cpu % 8 + 8))
+    return str(root)
+
+
+@pytest.mark.parametrize('text, cpus', [
+    ('0-3,8', [0, 1, 2, 3, 8]),
+    ('5', [5]),
+    ('', []),
+])
+def test_parse_format_cpu_list(text, cpus):
+    assert cpuset.parse_cpu_list(text) == cpus
+    assert cpuset.format_cpu_list(cpus) == text
+
+
+def test_read_topology(sysfs):
+    assert cpuset.read_topology(sysfs) == {
+        0: [0, 8, 1, 9, 2, 10, 3, 11],
+        1: [4, 12, 5, 13, 6, 14, 7, 15],
+    }
+
+
+def test_allocate_cpus(sysfs):
+    topology = cpuset.read_topology(sysfs)
+    assert cpuset.allocate_cpus(topology, set(), 2) == ([0, 8], [0])
+    # Prefer the node with the fewest free CPUs that satisfy the request
+    assert cpuset.allocate_cpus(topology, {0, 8, 1, 9}, 4) == ([2, 10, 3, 11], [0])
+    assert cpuset.allocate_cpus(topology, {0, 8, 1, 9}, 5) == ([4, 12, 5, 13, 6], [1])
+    # Span nodes if necessary
+    assert cpuset.allocate_cpus(topology, {0, 8, 1, 9}, 10) == (
+        [4, 12, 5, 13, 6, 14, 7, 15, 2, 10], [0, 1])
+    with pytest.raises(RuntimeError):
+        cpuset.allocate_cpus(topology, {0}, 16)
+
+
+def test_plugin_leases(sysfs, tmpdir, monkeypatch):
+    monkeypatch.setattr(cpuset.CpusetPlugin, 'SYSFS_ROOT', sysfs)
+    lease_file = str(tmpdir.join('leases.json'))
+    # Pretend that another live process holds a lease on the first core of node 0
+    with open(lease_file, 'w') as fp:
+        json.dump({'leases': [{'pid': os.getppid(), 'cpus': [0, 8], 'mems': [0]}]}, fp)
+
+    plugin = cpuset.CpusetPlugin()
+    configuration = {
+        'dry-run': False,
+        'run': {'cpuset': {'cores': 2, 'lease-file': lease_file}},
+    }
+    configuration = plugin.apply(configuration, None, type('args', (), {'cores': None}))
+    assert configuration['run']['cpuset-cpus'] == '1,9'
+    assert configuration['run']['cpuset-mems'] == '0'
+    with open(lease_file) as fp:
+        assert len(json.load(fp)['leases']) == 2
+
+    plugin.cleanup()
+    with open(lease_file) as fp:
+        assert [lease['cpus'] for lease in json.load(fp)['leases']] == [[0, 8]]
+
+
+def test_plugin_default_lease_file(sysfs, shared_dir, monkeypatch):
+    monkeypatch.setattr(cpuset.CpusetPlugin, 'SYSFS_ROOT', sysfs)
+    plugin = cpuset.CpusetPlugin()
+    configuration = {'dry-run': False, 'run': {'cpuset': {'cores': 1}}}
+    plugin.apply(configuration, None, type('args', (), {'cores': None}))
+    # The lease file is shared by all users of the host
+    lease_file = os.path.join(shared_dir, 'cpuset.json')
+    assert os.stat(lease_file).st_mode & 0o777 == 0o666
+    plugin.cleanup()
+
+    # Launchers cannot lease CPUs
+    with pytest.raises(ValueError):
+        plugin.compile(configuration, None)
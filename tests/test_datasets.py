@@ -0,0 +1,141 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+import pytest
+from docker_interface import datasets, Session
+
+
+@pytest.fixture
+def source(tmpdir):
+    source = tmpdir.mkdir('source')
+    source.join('a.txt').write('a' * 10)
+    source.mkdir('sub').join('b.txt').write('b' * 20)
+    source.mkdir('empty')
+    return str(source)
+
+
+@pytest.fixture
+def root(tmpdir):
+    return str(tmpdir.join('cache'))
+
+
+def test_fill(root, source):
+    dataset = datasets.Dataset(root, source)
+    assert dataset.fill() == {'copied': 2, 'linked': 0, 'removed': 0, 'bytes': 30}
+    assert datasets.get_manifest(dataset.path) == datasets.get_manifest(source)
+
+    # Only changed files are copied again and deleted files are removed
+    with open(os.path.join(source, 'a.txt'), 'w') as fp:
+        fp.write('changed')
+    os.unlink(os.path.join(source, 'sub', 'b.txt'))
+    assert dataset.fill() == {'copied': 1, 'linked': 0, 'removed': 1, 'bytes': 7}
+    assert datasets.get_manifest(dataset.path) == datasets.get_manifest(source)
+    assert dataset.fill()['copied'] == 0
+
+
+def test_fill_link(root, source):
+    dataset = datasets.Dataset(root, source)
+    assert dataset.fill(link=True)['linked'] == 2
+    assert os.path.samefile(os.path.join(source, 'a.txt'), os.path.join(dataset.path, 'a.txt'))
+    assert datasets.list_datasets(root)[0]['size'] == 0
+
+
+def test_fill_file(root, source):
+    dataset = datasets.Dataset(root, os.path.join(source, 'a.txt'))
+    dataset.fill()
+    assert dataset.path.endswith('a.txt') and open(dataset.path).read() == 'a' * 10
+
+
+def test_fill_shared(root, source, monkeypatch):
+    # The second fill waits for the first and has nothing left to copy
+    started = threading.Event()
+    proceed = threading.Event()
+    copy_file = datasets.copy_file
+
+    def _copy_file(*args):
+        started.set()
+        assert proceed.wait(10)
+        return copy_file(*args)
+
+    monkeypatch.setattr(datasets, 'copy_file', _copy_file)
+    results = []
+    first = threading.Thread(target=lambda: results.append(datasets.Dataset(root, source).fill()))
+    first.start()
+    assert started.wait(10)
+    second = threading.Thread(target=lambda: results.append(datasets.Dataset(root, source).fill()))
+    second.start()
+    proceed.set()
+    first.join(10)
+    second.join(10)
+    # Either thread may acquire the lock first
+    assert sorted(result['copied'] for result in results) == [0, 2]
+
+
+def test_evict(root, tmpdir):
+    keys = []
+    for i, size in enumerate([10, 20, 30]):
+        source = tmpdir.mkdir('source%d' % i)
+        source.join('data').write('x' * size)
+        dataset = datasets.Dataset(root, str(source))
+        dataset.fill()
+        keys.append(dataset.key)
+
+    # The least recently used dataset is in use so the next one is evicted instead
+    in_use = datasets.Dataset(root, None, keys[0])
+    in_use.acquire('use')
+    evicted = datasets.evict(root, 25, exclude=[keys[2]])
+    assert [dataset['name'] for dataset in evicted] == [keys[1]]
+    in_use.release()
+    assert {dataset['name'] for dataset in datasets.list_datasets(root)} == {keys[0], keys[2]}
+    assert [dataset['name'] for dataset in datasets.evict(root, 0)] == [keys[0], keys[2]]
+    assert not datasets.list_datasets(root)
+
+
+def test_dataset_plugin(root, source, tmpdir):
+    configuration = {
+        'workspace': str(tmpdir),
+        'docker': 'true',
+        'plugins': ['runconfiguration', 'run', 'substitution', 'validation', 'dataset'],
+        'run': {
+            'image': 'ubuntu',
+            'datasets': [{'source': 'source', 'destination': '/data'}],
+        },
+        'dataset-cache': {'root': root},
+    }
+    with Session().prepare(configuration) as preparation:
+        path = datasets.Dataset(root, source).path
+        assert '--mount=type=bind,source=%s,destination=/data,readonly=true' % path in \
+            preparation.argv
+        # The dataset is in use until the container has exited
+        assert not datasets.evict(root, 0)
+    assert os.path.isfile(os.path.join(path, 'sub', 'b.txt'))
+    assert datasets.evict(root, 0)
+
+
+@pytest.mark.parametrize('overrides', [{}, {'/dry-run': True}, {'/endpoint/name': 'remote'}])
+def test_dataset_plugin_missing_source(root, tmpdir, overrides):
+    configuration = {
+        'workspace': str(tmpdir),
+        'docker': 'true',
+        'plugins': ['runconfiguration', 'run', 'substitution', 'validation', 'dataset'],
+        'run': {
+            'image': 'ubuntu',
+            'datasets': [{'source': 'missing', 'destination': '/data'}],
+        },
+        'dataset-cache': {'root': root},
+    }
+    with pytest.raises(ValueError, match=r'run/datasets/0.*does not exist'):
+        Session().prepare(configuration, overrides)
@@ -0,0 +1,199 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import os
+import pytest
+from docker_interface import docker_interface
+from docker_interface.spec import Mount, can_spill, get_argv_size
+
+
+@pytest.mark.parametrize('mount, expected', [
+    ({'type': 'bind', 'source': 'data', 'destination': '/data', 'readonly': True,
+      'bind-propagation': 'rslave'},
+     'type=bind,source=/workspace/data,destination=/data,readonly=true,bind-propagation=rslave'),
+    ({'type': 'volume', 'source': 'cache', 'destination': '/cache', 'volume-nocopy': True,
+      'volume-subpath': 'pip'},
+     'type=volume,source=cache,destination=/cache,volume-nocopy=true,volume-subpath=pip'),
+    ({'type': 'volume', 'source': 'nfs', 'destination': '/nfs',
+      'volume-opt': {'type': 'nfs', 'o': 'addr=10.0.0.1,ro'}},
+     'type=volume,source=nfs,destination=/nfs,volume-opt=type=nfs,"volume-opt=o=addr=10.0.0.1,ro"'),
+    ({'type': 'tmpfs', 'destination': '/scratch', 'tmpfs-size': '1g', 'tmpfs-mode': 1770},
+     'type=tmpfs,destination=/scratch,tmpfs-size=1g,tmpfs-mode=1770'),
+])
+def test_mount_to_argument(mount, expected):
+    assert Mount.from_configuration(mount, '/workspace').to_argument() == expected
+
+
+def test_build_parameter_parts():
+    configuration = {'user': 'root', 'group-add': ['audio', 'video'], 'rm': False,
+                     'env': {'A': 1}, 'ulimit': {'nofile': '1024:2048'}}
+    expected = copy.deepcopy(configuration)
+    assert list(docker_interface.build_parameter_parts(
+        configuration, 'user', 'group-add', 'rm', 'workdir')) == \
+        ['--user=root', '--group-add=audio', '--group-add=video']
+    assert list(docker_interface.build_dict_parameter_parts(
+        configuration, 'env', 'ulimit', 'label', label={'flag': ''})) == \
+        ['--env=A=1', '--ulimit=nofile=1024:2048', '--label=flag=']
+    assert configuration == expected
+
+
+def test_build_docker_run_command():
+    configuration = {
+        'docker': 'docker',
+        'workspace': '/workspace',
+        'run': {
+            'image': 'ubuntu',
+            'cmd': ['bash'],
+            'mount': [{'type': 'tmpfs', 'destination': '/scratch'}],
+            'ulimit': {'nofile': '1024:2048'},
+        }
+    }
+    assert docker_interface.build_docker_run_command(configuration) == [
+        'docker', 'run', '--ulimit=nofile=1024:2048', '--mount=type=tmpfs,destination=/scratch',
+        '--env=DOCKER_INTERFACE=true', 'ubuntu', 'bash'
+    ]
+
+
+def build_configuration(**build):
+    build.setdefault('path', '.')
+    build.setdefault('file', 'Dockerfile')
+    build.setdefault('tag', 'image')
+    return {'docker': 'docker', 'workspace': '/workspace', 'build': build}
+
+
+@pytest.mark.parametrize('build, expected', [
+    ({}, ['docker', 'build', '--tag=image', '--file=/workspace/./Dockerfile', '/workspace/.']),
+    ({'builder': 'classic'}, ['env', 'DOCKER_BUILDKIT=0', 'docker', 'build', '--tag=image',
+                              '--file=/workspace/./Dockerfile', '/workspace/.']),
+    ({'builder': 'buildkit', 'cache-from': ['image:latest'], 'cache-to': ['type=inline'],
+      'secret': ['id=token,src=token.txt'], 'target': 'test'},
+     ['env', 'DOCKER_BUILDKIT=1', 'docker', 'build', '--tag=image',
+      '--file=/workspace/./Dockerfile', '--target=test', '--cache-from=image:latest',
+      '--secret=id=token,src=/workspace/token.txt', '--build-arg=BUILDKIT_INLINE_CACHE=1',
+      '/workspace/.']),
+    ({'builder': 'buildx', 'cache-from': ['type=local,src=.cache'],
+      'cache-to': ['type=local,dest=.cache,mode=max'], 'progress': 'plain', 'ssh': ['default']},
+     ['docker', 'buildx', 'build', '--load', '--tag=image', '--file=/workspace/./Dockerfile',
+      '--cache-from=type=local,src=/workspace/.cache',
+      '--cache-to=type=local,dest=/workspace/.cache,mode=max', '--ssh=default',
+      '--progress=plain', '/workspace/.']),
+])
+def test_build_docker_build_command(build, expected):
+    assert docker_interface.build_docker_build_command(build_configuration(**build)) == expected
+
+
+@pytest.mark.parametrize('build', [
+    {'builder': 'classic', 'secret': ['id=token']},
+    {'cache-to': ['type=local,dest=.cache']},
+])
+def test_build_docker_build_command_unsupported(build):
+    with pytest.raises(ValueError):
+        docker_interface.build_docker_build_command(build_configuration(**build))
+
+
+@pytest.fixture
+def run_configuration():
+    return {
+        'docker': 'docker',
+        'workspace': '/workspace',
+        'run': {
+            'image': 'ubuntu',
+            'cmd': ['bash'],
+            'rm': True,
+            'memory': '1g',
+            'gpus': 'all',
+            'env': {'HOME': '/home/user', 'TOKEN': None},
+            'mount': [{'type': 'bind', 'source': 'data', 'destination': '/data'}],
+            'publish': [{'container': 8888, 'host': 9999}],
+            'tmpfs': [{'destination': '/tmp', 'options': ['exec'], 'size': '1g'}],
+        }
+    }
+
+
+def test_run_spec_is_non_destructive(run_configuration):
+    expected = copy.deepcopy(run_configuration)
+    first = docker_interface.build_docker_run_command(run_configuration)
+    assert run_configuration == expected
+    assert docker_interface.build_docker_run_command(run_configuration) == first
+    assert '--tmpfs' in first and '/tmp:exec,size=1g' in first
+
+
+def test_run_spec_replace(run_configuration):
+    spec = docker_interface.RunSpec.from_configuration(run_configuration)
+    variant = spec.replace(cmd=['python'])
+    assert variant.to_argv()[-2:] == ['ubuntu', 'python']
+    assert spec.to_argv()[-2:] == ['ubuntu', 'bash']
+    assert variant.mount is spec.mount
+    assert variant != spec and spec.replace() == spec
+
+
+def test_run_spec_to_engine(run_configuration):
+    spec = docker_interface.RunSpec.from_configuration(run_configuration)
+    body = spec.to_engine({'TOKEN': 'secret'})
+    assert body['Cmd'] == ['bash']
+    assert body['Env'] == ['HOME=/home/user', 'TOKEN=secret', 'DOCKER_INTERFACE=true']
+    assert body['ExposedPorts'] == {'8888/tcp': {}}
+    host_config = body['HostConfig']
+    assert host_config['AutoRemove'] and host_config['Memory'] == 2 ** 30
+    assert host_config['PortBindings'] == {'8888/tcp': [{'HostIp': '', 'HostPort': '9999'}]}
+    assert host_config['Mounts'] == [{'Type': 'bind', 'Source': '/workspace/data',
+                                      'Target': '/data'}]
+    assert host_config['Tmpfs'] == {'/tmp': 'exec,size=1g'}
+    assert host_config['DeviceRequests'][0]['Count'] == -1
+    # Forwarded variables that are not set are omitted
+    assert 'TOKEN' not in ' '.join(spec.to_engine({})['Env'])
+
+
+def test_run_spec_to_shell(run_configuration):
+    run_configuration['run']['cmd'] = ['echo', 'hello world']
+    script = docker_interface.RunSpec.from_configuration(run_configuration).to_shell()
+    assert script.startswith('#!/bin/sh\nexec docker run ')
+    assert script.endswith(" ubuntu echo 'hello world'\n")
+
+
+def test_run_spec_spill(run_configuration, tmpdir):
+    run_configuration['run']['env'].update({'VAR%d' % i: 'x' * 100 for i in range(100)})
+    run_configuration['run']['env']['MULTILINE'] = 'first\nsecond'
+    run_configuration['run']['label'] = ['team=ml', 'flag', 'note=a=b']
+    spec = docker_interface.RunSpec.from_configuration(run_configuration)
+
+    # Nothing is moved if the arguments are within the limit
+    assert spec.spill(10 ** 6, str(tmpdir)) == (spec, [])
+
+    spilled, paths = spec.spill(1000, str(tmpdir))
+    assert len(paths) == 2 and all(path.startswith(str(tmpdir)) for path in paths)
+    assert all(os.stat(path).st_mode & 0o777 == 0o600 for path in paths)
+    argv = spilled.to_argv()
+    assert '--env=MULTILINE=first\nsecond' in argv and '--label=flag' in argv
+    assert '--env-file=%s' % paths[0] in argv and '--label-file=%s' % paths[1] in argv
+    assert get_argv_size(argv) < get_argv_size(spec.to_argv())
+    # The container is created with the same environment and labels
+    environ = {'TOKEN': 'secret'}
+    assert sorted(spilled.get_env(environ)) == sorted(spec.get_env(environ))
+    assert spilled.to_engine(environ)['Labels'] == spec.to_engine(environ)['Labels'] == \
+        {'team': 'ml', 'flag': '', 'note': 'a=b'}
+
+
+@pytest.mark.parametrize('key, value, expected', [
+    ('KEY', 'value', True),
+    ('KEY', None, True),
+    ('KEY', ' padded ', True),
+    ('KEY', 'two\nlines', False),
+    ('KEY', 'carriage\r', False),
+    ('#KEY', 'value', False),
+    ('MY KEY', 'value', False),
+])
+def test_can_spill(key, value, expected):
+    assert can_spill(key, value) == expected
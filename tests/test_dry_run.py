@@ -24,7 +24,7 @@ def configuration(request):
         return yaml.safe_load(fp)
 
 
-@pytest.mark.parametrize('command', ['build', 'run'])
+@pytest.mark.parametrize('command', ['build', 'run', 'history'])
 def test_cli(configuration, command):
     assert configuration is not None
     configuration['dry-run'] = True
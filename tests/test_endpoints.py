@@ -0,0 +1,190 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import http.server
+import json
+import socketserver
+import threading
+import pytest
+from docker_interface import Session, util
+from docker_interface.endpoints import Endpoint, Scheduler
+from docker_interface.plugins import EndpointPlugin
+
+
+class FakeEngine:
+    """
+    Minimal Engine API server that reports daemon information and the presence of images.
+    """
+    def __init__(self, running=0, memory=2 ** 34, images=(), path=None):
+        self.info = {'ContainersRunning': running, 'MemTotal': memory}
+        self.images = set(images)
+        self.requests = []
+        engine = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa: N802
+                engine.requests.append(self.path)
+                if self.path == '/info':
+                    status, body = 200, engine.info
+                elif self.path[len('/images/'):-len('/json')] in engine.images:
+                    status, body = 200, {'Id': 'sha256:c0ffee'}
+                else:
+                    status, body = 404, {'message': 'not found'}
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def address_string(self):
+                return 'fake'
+
+            def log_message(self, *args):
+                pass
+
+        if path:
+            class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+                daemon_threads = True
+            self.server = Server(path, Handler)
+            self.host = 'unix://%s' % path
+        else:
+            self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+            self.host = 'tcp://127.0.0.1:%d' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,),
+                                       daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def engines(tmpdir):
+    engines = [
+        FakeEngine(running=3),
+        FakeEngine(running=1, memory=2 ** 30, images=['ubuntu']),
+        FakeEngine(running=1, images=['ubuntu'], path=str(tmpdir.join('docker.sock'))),
+    ]
+    yield engines
+    for engine in engines:
+        engine.close()
+
+
+def test_scheduler_least_loaded(engines):
+    scheduler = Scheduler([Endpoint(host=engine.host) for engine in engines], refresh=60)
+    # The third engine has the image and more free memory than the second
+    endpoint, first = scheduler.acquire(image='ubuntu')
+    assert endpoint.host == engines[2].host
+    assert util.is_local_endpoint({'endpoint': endpoint.to_configuration()})
+    # Containers that are not yet reported by the daemon count towards the load
+    endpoint, second = scheduler.acquire(image='ubuntu')
+    assert endpoint.host == engines[1].host
+    # Endpoints without enough free memory are avoided
+    endpoint, third = scheduler.acquire(memory=2 ** 31, image='ubuntu')
+    assert endpoint.host == engines[2].host
+    scheduler.release(first)
+    scheduler.release(third)
+    assert scheduler.get_load(endpoint) == {'running': 1, 'free': 2 ** 34}
+
+    # Daemon information and the presence of images are cached
+    assert engines[1].requests.count('/info') == 1
+    assert engines[1].requests.count('/images/ubuntu/json') == 1
+    assert engines[0].requests.count('/images/ubuntu/json') == 3
+
+
+def test_scheduler_unreachable(engines):
+    unreachable = Endpoint(host='unix:///nonexistent/docker.sock', name='gone')
+    scheduler = Scheduler([unreachable, Endpoint(host=engines[0].host)])
+    endpoint, _ = scheduler.acquire()
+    assert endpoint.host == engines[0].host
+    with pytest.raises(ValueError):
+        Scheduler([unreachable]).acquire()
+
+
+def test_endpoint_from_configuration():
+    assert Endpoint.from_configuration('tcp://10.0.0.1:2375').host == 'tcp://10.0.0.1:2375'
+    endpoint = Endpoint.from_configuration('remote')
+    assert endpoint.context == 'remote' and not endpoint.uses_api
+    assert endpoint.get_docker('docker') == 'docker --context=remote'
+    assert Endpoint.from_configuration({'host': 'ssh://gpu', 'name': 'gpu'}).to_configuration() == \
+        {'name': 'gpu', 'host': 'ssh://gpu'}
+    with pytest.raises(ValueError):
+        Endpoint.from_configuration({'name': 'neither'})
+
+
+def test_run_on_endpoint(engines, tmpdir, monkeypatch, caplog):
+    monkeypatch.setattr(EndpointPlugin, 'SCHEDULERS', {})
+    # Log all docker invocations and emulate copying files from a container
+    log = tmpdir.join('docker.log')
+    docker = tmpdir.join('docker')
+    docker.write('#!/bin/sh\necho "$@" >> %s\n'
+                 'case "$2" in cp) echo "root:x:0:0" > "$4";; esac\n' % log)
+    docker.chmod(0o755)
+    configuration = {
+        'workspace': str(tmpdir),
+        'docker': str(docker),
+        'endpoints': [engine.host for engine in engines[:2]],
+        'plugins': ['endpoint', 'user', 'runconfiguration', 'run', 'substitution', 'validation'],
+        'run': {'image': 'ubuntu', 'tty': False, 'interactive': False},
+    }
+    result = Session().run(configuration)
+    assert result.status == 0
+    # The passwd and group files are bind-mounted from this host
+    assert 'does not run on this host but the container bind-mounts' in caplog.text
+    # All docker invocations use the least-loaded endpoint (the image is inspected again after
+    # the run because the fake docker does not report an id)
+    lines = log.read().splitlines()
+    assert [line.split()[:2] for line in lines] == [
+        ['--host=%s' % engines[1].host, command]
+        for command in ['create', 'cp', 'cp', 'rm', 'image', 'run', 'image']]
+    # The reservation is released once the container has exited
+    scheduler, = EndpointPlugin.SCHEDULERS.values()
+    assert all(not dispatched for dispatched in scheduler.dispatched.values())
+
+
+@pytest.mark.parametrize('host, local', [
+    ('unix:///var/run/docker.sock', True),
+    ('ssh://gpu', False),
+    (None, False),
+])
+def test_context_host(tmpdir, host, local):
+    docker = tmpdir.join('docker')
+    if host:
+        docker.write('#!/bin/sh\necho %s\n' % host)
+    else:
+        docker.write('#!/bin/sh\nexit 1\n')
+    docker.chmod(0o755)
+    endpoint = Endpoint.from_configuration('remote')
+    assert endpoint.resolve_host(str(docker)) == host
+    configuration = endpoint.to_configuration()
+    assert configuration['context'] == 'remote' and configuration.get('host') == host
+    assert util.is_local_endpoint({'endpoint': configuration}) == local
+
+
+def test_run_on_endpoint_dry_run(engines, tmpdir, monkeypatch, caplog):
+    monkeypatch.setattr(EndpointPlugin, 'SCHEDULERS', {})
+    caplog.set_level('INFO')
+    configuration = {
+        'workspace': str(tmpdir),
+        'dry-run': True,
+        'endpoints': [engines[0].host, {'context': 'gpu', 'name': 'big'}],
+        'plugins': ['endpoint', 'runconfiguration', 'run', 'substitution', 'validation'],
+        'run': {'image': 'ubuntu', 'tty': False, 'interactive': False},
+    }
+    with Session().prepare(configuration) as preparation:
+        # The daemons are not queried and the container is not dispatched
+        assert not engines[0].requests and not EndpointPlugin.SCHEDULERS
+        assert '--host' not in preparation.configuration['docker']
+    assert "endpoints '%s', 'big'" % engines[0].host in caplog.text
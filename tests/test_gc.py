@@ -0,0 +1,184 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import os
+import subprocess
+import time
+import pytest
+from docker_interface import usage, Session
+from docker_interface.plugins import gc
+
+
+@pytest.fixture(autouse=True)
+def index(tmpdir, monkeypatch):
+    path = str(tmpdir.join('usage.json'))
+    monkeypatch.setattr(usage, 'INDEX', path)
+    return path
+
+
+def labels(**values):
+    return {usage.label(key): str(value) for key, value in values.items()}
+
+
+class FakeDocker:
+    def __init__(self):
+        self.containers = [
+            {'ID': 'leaked', 'Names': 'leaked', 'State': 'created', 'Image': 'sha256:c',
+             'Labels': labels(project='/w', created=1000, helper='user')},
+            {'ID': 'running', 'Names': 'running', 'State': 'running', 'Image': 'sha256:a',
+             'Labels': labels(project='/w', created=1000)},
+            {'ID': 'recent', 'Names': 'recent', 'State': 'exited', 'Image': 'sha256:b',
+             'Labels': labels(project='/w', created=time.time())},
+        ]
+        self.images = [
+            {'Id': 'sha256:a', 'RepoTags': ['a:1'], 'Size': 10},
+            {'Id': 'sha256:b', 'RepoTags': ['b:1'], 'Size': 10},
+            {'Id': 'sha256:c', 'RepoTags': [], 'Size': 5},
+            {'Id': 'sha256:d', 'RepoTags': ['d:1', 'd:latest'], 'Size': 30},
+            {'Id': 'sha256:e', 'RepoTags': ['e:1'], 'Size': 30},
+            {'Id': 'sha256:f', 'RepoTags': [], 'Size': 5},
+        ]
+        for i, image in enumerate(self.images):
+            image['Config'] = {'Labels': labels(project='/w')}
+            image['Created'] = time.strftime('%Y-%m-%dT%H:%M:%S.123456789Z',
+                                             time.gmtime(100 * i))
+        # Untagged images are only removed after the grace period
+        self.images[-1]['Created'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        self.volumes = [
+            {'Name': 'di-cache-pip', 'Links': '0', 'Size': '2kB', 'Labels': 'a=b,%s=pip' %
+             usage.label('cache')},
+            {'Name': 'di-cache-npm', 'Links': '1', 'Size': '1kB', 'Labels': '%s=npm' %
+             usage.label('cache')},
+        ]
+        self.removed = []
+
+    def check_output(self, args, **kwargs):
+        args = args[1:]
+        if args[:2] == ['container', 'ls']:
+            if '{{json .}}' in args:
+                return "\n".join(json.dumps(dict(container, Labels=','.join(
+                    '%s=%s' % item for item in container['Labels'].items())))
+                    for container in self.containers)
+            return "\n".join(container['ID'] for container in self.containers)
+        if args[:4] == ['container', 'inspect', '--format', '{{.Image}}']:
+            return "\n".join(container['Image'] for container in self.containers
+                             if container['ID'] in args[4:])
+        if args[:2] == ['image', 'ls']:
+            return "\n".join(image['Id'] for image in self.images)
+        if args[:2] == ['image', 'inspect']:
+            return json.dumps(self.images)
+        if args[:2] == ['system', 'df']:
+            return json.dumps(self.volumes)
+        raise ValueError(args)  # pragma: no cover
+
+    def run(self, args, **kwargs):
+        self.removed.append(args[1:])
+        return subprocess.CompletedProcess(args, 0, '', '')
+
+
+@pytest.fixture
+def docker(monkeypatch):
+    docker = FakeDocker()
+    monkeypatch.setattr(gc.subprocess, 'check_output', docker.check_output)
+    monkeypatch.setattr(gc.subprocess, 'run', docker.run)
+    return docker
+
+
+@pytest.fixture
+def configuration():
+    return {
+        'docker': 'docker',
+        'dry-run': False,
+        'gc': {'grace': 3600, 'image-budget': '50', 'volume-budget': '1k', 'concurrency': 2},
+    }
+
+
+def test_select(docker, configuration):
+    usage.touch('image', 'e:1')
+    removals = gc.GarbageCollectionPlugin().select(configuration, now=10000)
+    assert [(kind, obj['name']) for kind, obj in removals] == [
+        ('container', 'leaked'),
+        # The image is only used by a container that is removed
+        ('image', 'sha256:c'),
+        # Images used by containers count towards the budget and `d` was used least recently
+        ('image', 'sha256:d'),
+        ('volume', 'di-cache-pip'),
+    ]
+
+    configuration['gc']['image-count'] = 2
+    removals = gc.GarbageCollectionPlugin().select(configuration, now=10000)
+    assert [obj['name'] for kind, obj in removals if kind == 'image'] == \
+        ['sha256:c', 'sha256:d', 'sha256:e']
+
+
+def test_select_shared_index(docker, configuration, shared_dir, monkeypatch):
+    # Images used by another user are recorded in the index shared by all users of the host
+    monkeypatch.setattr(usage, 'INDEX', None)
+    usage.touch('image', 'd:1', index=os.path.join(shared_dir, 'usage.json'))
+    removals = gc.GarbageCollectionPlugin().select(configuration, now=10000)
+    # The older image `d` is kept because it was used more recently
+    images = [obj['name'] for kind, obj in removals if kind == 'image']
+    assert 'sha256:e' in images and 'sha256:d' not in images
+
+
+@pytest.mark.parametrize('dry_run', [False, True])
+def test_gc(docker, configuration, dry_run):
+    configuration['dry-run'] = dry_run
+    gc.GarbageCollectionPlugin().apply(configuration, None, argparse.Namespace())
+    if dry_run:
+        assert not docker.removed
+    else:
+        # Containers are removed before the images they use
+        assert docker.removed[0] == ['container', 'rm', 'leaked']
+        assert sorted(docker.removed) == sorted([
+            ['container', 'rm', 'leaked'], ['image', 'rm', 'sha256:c'],
+            ['image', 'rm', 'd:1', 'd:latest'], ['volume', 'rm', 'di-cache-pip'],
+        ])
+
+
+def test_label_plugin(tmpdir):
+    configuration = {
+        'workspace': str(tmpdir),
+        'docker': 'true',
+        'plugins': ['runconfiguration', 'run', 'substitution', 'validation', 'label'],
+        'run': {'image': 'ubuntu', 'label': ['%s=custom' % usage.label('project')]},
+    }
+    with Session().prepare(configuration) as preparation:
+        argv = preparation.argv
+    project = usage.label('project')
+    assert argv.index('--label=%s=%s' % (project, tmpdir)) < \
+        argv.index('--label=%s=custom' % project)
+    assert any(arg.startswith('--label=%s=' % usage.label('config')) for arg in argv)
+    assert 'ubuntu:latest' in usage.get_last_used('image')
+
+
+def test_label_plugin_build(tmpdir):
+    configuration = {
+        'workspace': str(tmpdir),
+        'docker': 'true',
+        'plugins': ['buildconfiguration', 'build', 'substitution', 'validation', 'label'],
+        'build': {'tag': 'image'},
+    }
+    with Session().prepare(configuration, command='build') as preparation:
+        argv = preparation.argv
+    # The creation time would change the image id on every build
+    assert any(arg.startswith('--label=%s=' % usage.label('project')) for arg in argv)
+    assert not any(arg.startswith('--label=%s=' % usage.label('created')) for arg in argv)
+
+
+def test_parse_timestamp():
+    assert gc.parse_timestamp('1970-01-01T00:01:40.123456789Z') == 100
+    assert gc.parse_timestamp(None) == 0
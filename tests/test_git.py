@@ -0,0 +1,73 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+import pytest
+from docker_interface.plugins import git
+
+
+@pytest.fixture
+def repository(tmpdir):
+    workspace = str(tmpdir)
+
+    def _git(*args):
+        subprocess.check_call(['git', '-C', workspace, '-c', 'user.name=di', '-c',
+                               'user.email=di@example.com'] + list(args),
+                              stdout=subprocess.DEVNULL)
+        return git.git(workspace, 'rev-parse', 'HEAD')
+
+    _git('init', '-b', 'main')
+    commits = [_git('commit', '--allow-empty', '-m', str(i)) for i in range(3)]
+    _git('checkout', '-b', 'feature/x')
+    commits.extend(_git('commit', '--allow-empty', '-m', str(i)) for i in range(3, 5))
+    return workspace, commits
+
+
+@pytest.mark.parametrize('tag, repository', [
+    ('image', 'image'),
+    ('image:tag', 'image'),
+    ('localhost:5000/image', 'localhost:5000/image'),
+    ('localhost:5000/image:tag', 'localhost:5000/image'),
+])
+def test_get_repository(tag, repository):
+    assert git.get_repository(tag) == repository
+
+
+def test_get_git_tags(repository):
+    workspace, commits = repository
+    tags, candidates = git.get_git_tags(workspace, 'repo', ancestors=2)
+    assert tags == ['repo:git-%s' % commits[4], 'repo:branch-feature-x']
+    assert candidates == [
+        'repo:branch-feature-x',
+        'repo:git-%s' % commits[3],
+        'repo:git-%s' % commits[2],
+        'repo:branch-main',
+    ]
+
+
+def test_get_git_tags_not_a_repository(tmpdir):
+    assert git.get_git_tags(str(tmpdir), 'repo') == ([], [])
+
+
+def test_push_failure(tmpdir, caplog):
+    docker = tmpdir.join('docker')
+    docker.write('#!/bin/sh\nexit 1\n')
+    docker.chmod(0o755)
+    plugin = git.GitCachePlugin()
+    plugin.configuration = {'status-code': 0}
+    plugin.docker = [str(docker)]
+    plugin.tags = ['org/image:commit', 'org/image:branch']
+    plugin.push = True
+    plugin.cleanup()
+    assert "could not push 'org/image:branch'" in caplog.text
@@ -0,0 +1,64 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+from docker_interface import history
+from docker_interface.plugins.history import HistoryPlugin
+
+
+def test_percentile():
+    assert history.percentile([], 50) is None
+    assert history.percentile([3], 90) == 3
+    assert history.percentile([4, 1, 3, 2], 50) == 2.5
+    assert history.percentile([1, 2, 3, 4], 100) == 4
+
+
+def test_hash_configuration():
+    assert history.hash_configuration({'a': 1, 'b': 2}) == \
+        history.hash_configuration({'b': 2, 'a': 1})
+    assert history.hash_configuration({'a': 1}) != history.hash_configuration({'a': 2})
+
+
+def test_record_query(tmpdir):
+    workspace = str(tmpdir)
+    assert history.query(workspace) == []
+    for i in range(5):
+        history.record(workspace, started=i, command='run', image='ubuntu', image_id='sha256:1',
+                       status=i % 2, setup_time=0.1 * i, container_time=i,
+                       plugin_times={'UserPlugin': 0.01 * i})
+    history.record(workspace, started=5, command='build', image='ubuntu', status=0)
+
+    rows = history.query(workspace)
+    assert [row['started'] for row in rows] == list(range(6))
+    assert rows[1]['plugin_times'] == {'UserPlugin': 0.01}
+    assert len(history.query(workspace, 2)) == 2
+
+    run, build = history.summarize(rows, [0, 100])
+    assert run['command'] == 'run' and run['runs'] == 5 and run['failures'] == 2
+    assert run['container_time'] == [0, 4]
+    assert run['plugin_times']['UserPlugin'] == [0, 0.04]
+    assert build['runs'] == 1 and build['container_time'] == [None, None]
+
+
+def test_history_plugin(tmpdir, capsys):
+    workspace = str(tmpdir)
+    for i in range(3):
+        history.record(workspace, started=i, command='run', image='ubuntu',
+                       image_id='sha256:%s' % ('0123456789ab' if i else 'ba9876543210'), status=0)
+    configuration = {'workspace': workspace, 'docker': 'false'}
+    args = argparse.Namespace(limit=None, percentiles=[50], plugins=False)
+    HistoryPlugin().apply(configuration, None, args)
+    # Runs of different images under the same tag are summarized separately
+    out = capsys.readouterr().out
+    assert 'ubuntu (ba9876543210)' in out and 'ubuntu (0123456789ab)' in out
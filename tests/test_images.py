@@ -0,0 +1,115 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import os
+import pytest
+from docker_interface.plugins import images
+
+
+@pytest.fixture
+def workspace(tmpdir):
+    tmpdir.ensure_dir('base').join('Dockerfile').write('FROM ubuntu\n')
+    tmpdir.ensure_dir('dev').join('Dockerfile').write('FROM --platform=linux/amd64 org/base AS dev\n')
+    tmpdir.ensure_dir('app').join('Dockerfile').write('ARG BASE\nFROM $BASE\n')
+    return str(tmpdir)
+
+
+@pytest.fixture
+def fake_docker(tmpdir):
+    # Record builds and report the id of an image as the number of times it has been built
+    path = tmpdir.join('docker')
+    path.write('#!/bin/sh\n'
+               'log=%s\n'
+               'if [ "$1" = build ]; then echo "$@" >> $log; exit 0; fi\n'
+               'tag=${4}\n'
+               'echo "sha256:$(grep -c -- "--tag=$tag " $log 2> /dev/null || echo 0)"\n'
+               % tmpdir.join('builds.log'))
+    path.chmod(0o755)
+    return str(path), str(tmpdir.join('builds.log'))
+
+
+DEFINITIONS = {
+    'base': {'path': 'base', 'tag': 'org/base'},
+    'dev': {'path': 'dev'},
+    'app': {'path': 'app', 'build-arg': {'BASE': '@{dev}', 'BASE_ID': '@{dev/id}'}},
+    'docs': {'path': 'base', 'tag': 'docs', 'depends-on': ['base']},
+}
+
+
+def test_get_dependencies(workspace):
+    assert images.get_dependencies(DEFINITIONS, workspace) == {
+        'base': set(),
+        'dev': {'base'},
+        'app': {'dev'},
+        'docs': {'base'},
+    }
+    with pytest.raises(KeyError):
+        images.get_dependencies({'app': {'depends-on': ['missing']}}, workspace)
+
+
+def test_sort_topologically():
+    assert images.sort_topologically({'a': {'b'}, 'b': set(), 'c': {'a', 'b'}}) == ['b', 'a', 'c']
+    with pytest.raises(ValueError):
+        images.sort_topologically({'a': {'b'}, 'b': {'a'}})
+
+
+def test_hash_context(tmpdir):
+    tmpdir.join('a.txt').write('a')
+    tmpdir.ensure_dir('build').join('b.txt').write('b')
+    tmpdir.ensure_dir('.di').join('state').write('c')
+    digest = images.hash_context(str(tmpdir))
+    tmpdir.join('.di', 'state').write('d')
+    assert images.hash_context(str(tmpdir)) == digest
+    tmpdir.join('build', 'b.txt').write('c')
+    assert images.hash_context(str(tmpdir)) != digest
+    tmpdir.join('.dockerignore').write('build\n')
+    ignored = images.hash_context(str(tmpdir))
+    tmpdir.join('build', 'b.txt').write('d')
+    assert images.hash_context(str(tmpdir)) == ignored
+
+
+def test_build_graph(workspace, fake_docker):
+    docker, log = fake_docker
+
+    def _build():
+        configuration = {
+            'docker': docker,
+            'workspace': workspace,
+            'dry-run': False,
+            'images': DEFINITIONS,
+        }
+        plugin = images.ImagesPlugin()
+        configuration = plugin.apply(configuration, None, argparse.Namespace(jobs=2, force=False))
+        assert configuration['status-code'] == 0
+        with open(log) as fp:
+            return [line.split()[1] for line in fp]
+
+    builds = _build()
+    assert sorted(builds) == ['--tag=app', '--tag=dev', '--tag=docs', '--tag=org/base']
+    assert builds.index('--tag=org/base') < builds.index('--tag=dev') < builds.index('--tag=app')
+
+    # Nothing changed so nothing should be rebuilt
+    assert len(_build()) == 4
+
+    # Changing the context of the dev image should only rebuild dev and app
+    with open(os.path.join(workspace, 'dev', 'extra'), 'w') as fp:
+        fp.write('change')
+    assert _build()[4:] == ['--tag=dev', '--tag=app']
+
+
+def test_build_command():
+    assert images.ImagesPlugin().build_command({}) is None
+    with pytest.raises(ValueError):
+        images.ImagesPlugin().build_command({'images': {'base': {}}})
@@ -0,0 +1,177 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import os
+import threading
+import pytest
+from docker_interface import jobs, Session
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 0
+
+    def __call__(self):
+        return self.time
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def queue(clock):
+    return jobs.JobQueue(16, 4, backfill=60, clock=clock)
+
+
+def test_bin_packing(queue):
+    large = jobs.Job('alice', 12, 1)
+    medium = jobs.Job('bob', 8, 1)
+    small = jobs.Job('carol', 4, 3)
+    for job in [large, medium, small]:
+        queue.submit(job)
+    # The medium job does not fit next to the large one but the small one fills the gap
+    assert queue.schedule() == [large, small]
+    assert queue.allocated == (16, 4)
+    queue.cancel(large)
+    assert queue.schedule() == [medium]
+
+
+def test_oversized_job(queue):
+    with pytest.raises(ValueError):
+        queue.submit(jobs.Job('alice', 32, 1))
+
+
+def test_priority_and_fair_share(queue):
+    queue.submit(jobs.Job('alice', 8, 2))
+    queue.schedule()
+    # Bob has no running jobs and is admitted before alice unless alice's job has priority
+    alice, bob, urgent = jobs.Job('alice', 8), jobs.Job('bob', 8), jobs.Job('alice', 8, priority=1)
+    for job in [alice, bob]:
+        queue.submit(job)
+    assert queue.schedule() == [bob]
+    queue.cancel(bob)
+    queue.submit(urgent)
+    assert queue.schedule() == [urgent]
+
+
+def test_backfill_limit(queue, clock):
+    queue.submit(jobs.Job('alice', 8))
+    queue.schedule()
+    large = jobs.Job('bob', 16)
+    queue.submit(large)
+    clock.time = 30
+    small = jobs.Job('carol', 4)
+    queue.submit(small)
+    assert queue.schedule() == [small]
+    # The large job has waited too long and no further jobs may overtake it
+    queue.cancel(small)
+    clock.time = 90
+    queue.submit(jobs.Job('carol', 4))
+    assert queue.schedule() == []
+
+
+def test_status(queue, clock):
+    job = jobs.Job('alice', 8, 2)
+    queue.submit(job)
+    clock.time = 10
+    queue.schedule()
+    clock.time = 20
+    status = queue.get_status()
+    assert status['allocated'] == {'memory': 8, 'cpus': 2}
+    assert status['utilisation']['memory'] == .5
+    assert status['utilisation']['memory_mean'] == .25
+    assert status['wait']['p50'] == 10
+    assert status['admitted'] == 1 and [job['id'] for job in status['running']] == [job.id]
+
+
+def test_from_request():
+    job = jobs.Job.from_request({'memory': 1024, 'cpu-shares': 512, 'user': 'bob'}, 'alice')
+    assert (job.user, job.memory, job.cpus) == ('alice', 1024, .5)
+
+
+@pytest.fixture
+def server(tmpdir):
+    # Serve a queue for a single job in a background thread
+    path = str(tmpdir.join('queue.sock'))
+    server = jobs.QueueServer(jobs.JobQueue(2 ** 30, 1), path)
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    task = loop.create_task(server.serve(ready.set))
+
+    def _run():
+        with pytest.raises(asyncio.CancelledError):
+            loop.run_until_complete(task)
+        loop.close()
+
+    thread = threading.Thread(target=_run)
+    thread.start()
+    assert ready.wait(10)
+    yield server
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join(10)
+    assert not os.path.exists(path)
+
+
+def test_socket_path(shared_dir):
+    # A single queue is shared by all users of the host
+    assert jobs.get_socket_path() == os.path.join(shared_dir, 'queue.sock')
+    assert jobs.QueueServer(None).path == jobs.get_socket_path()
+
+
+def test_server(server):
+    first = jobs.connect(server.path)
+    assert jobs.request(first, {'memory': 2 ** 29, 'cpus': 1})['admitted']
+    # The second job blocks until the first releases its resources
+    second = jobs.connect(server.path)
+    second.sendall(b'{"memory": 1024, "cpus": 1}\n')
+    second.settimeout(.2)
+    with pytest.raises(OSError):
+        second.recv(1024)
+    first.close()
+    second.settimeout(10)
+    assert b'"admitted": true' in second.recv(1024)
+
+    with jobs.connect(server.path) as sock:
+        status = jobs.request(sock, {'command': 'status'})
+    assert status['admitted'] == 2 and len(status['running']) == 1
+    second.close()
+
+    with jobs.connect(server.path) as sock:
+        assert 'error' in jobs.request(sock, {'memory': 2 ** 31})
+    loop = asyncio.new_event_loop()
+    with pytest.raises(ValueError):
+        loop.run_until_complete(jobs.QueueServer(None, server.path).serve())
+    loop.close()
+
+
+def test_queue_plugin(server, tmpdir):
+    configuration = {
+        'workspace': str(tmpdir),
+        'docker': 'true',
+        'plugins': ['runconfiguration', 'run', 'substitution', 'validation', 'queue'],
+        'run': {'image': 'ubuntu', 'memory': '512m', 'cpus': 1},
+        'queue': {'enabled': True, 'socket': server.path},
+    }
+    session = Session()
+    assert session.run(configuration).status == 0
+    with jobs.connect(server.path) as sock:
+        status = jobs.request(sock, {'command': 'status'})
+    assert status['admitted'] == 1 and not status['running']
+
+    configuration['queue']['socket'] = str(tmpdir.join('missing.sock'))
+    with pytest.raises(ValueError):
+        session.run(configuration)
@@ -0,0 +1,135 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import io
+import json
+import tarfile
+import pytest
+from docker_interface import cli, layers
+
+
+def _add(archive, name, data=b'', kind=tarfile.REGTYPE, linkname=''):
+    info = tarfile.TarInfo(name)
+    info.type = kind
+    info.size = len(data)
+    info.linkname = linkname
+    archive.addfile(info, io.BytesIO(data) if data else None)
+
+
+def _layer(files, compress=False):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as archive:
+        for name, data in files:
+            if data is None:
+                _add(archive, name, kind=tarfile.DIRTYPE)
+            else:
+                _add(archive, name, data)
+    return gzip.compress(buffer.getvalue()) if compress else buffer.getvalue()
+
+
+LAYERS = [
+    # Base layer with a large binary, a configuration file, and a directory of temporary files
+    [('bin', None), ('bin/big', b'a' * 4096), ('etc/conf', b'x' * 10), ('tmp/build/a', b'b' * 300),
+     ('tmp/build/b', b'c' * 200)],
+    # Overwrite the configuration, copy the binary, and remove the temporary files
+    [('etc/conf', b'y' * 20), ('opt/big', b'a' * 4096), ('tmp/build/.wh.a', b'')],
+    # Hide the remaining temporary files
+    [('tmp/build/.wh..wh..opq', b''), ('tmp/build/c', b'd')],
+]
+HISTORY = [
+    {'created_by': '/bin/sh -c #(nop) ADD file:123 in / '},
+    {'created_by': 'ENV PATH=/usr/bin', 'empty_layer': True},
+    {'created_by': '/bin/sh -c cp /bin/big /opt/big'},
+    {'created_by': 'RUN /bin/sh -c rm -rf /tmp/build/* # buildkit'},
+]
+
+
+@pytest.fixture(params=['legacy', 'oci'])
+def archive(request, tmpdir):
+    path = tmpdir.join('image.tar')
+    config = json.dumps({'history': HISTORY}).encode()
+    with tarfile.open(str(path), 'w') as archive:
+        if request.param == 'legacy':
+            names = ['%d/layer.tar' % i for i in range(len(LAYERS))]
+            for name, files in zip(names, LAYERS):
+                _add(archive, name, _layer(files))
+            config_name = 'c0ffee.json'
+        else:
+            names = ['blobs/sha256/%d' % i for i in range(len(LAYERS))]
+            for name, files in zip(names, LAYERS):
+                _add(archive, name, _layer(files, compress=True))
+            config_name = 'blobs/sha256/c0ffee'
+            _add(archive, 'index.json', b'{"schemaVersion": 2}')
+        _add(archive, config_name, config)
+        # Identical layers are stored once and linked
+        _add(archive, 'link/layer.tar', kind=tarfile.SYMTYPE, linkname='../%s' % names[0])
+        _add(archive, 'manifest.json', json.dumps([{
+            'Config': config_name,
+            'RepoTags': ['org/app:latest'],
+            'Layers': names,
+        }]).encode())
+    return str(path)
+
+
+def test_analyze_archive(archive):
+    with open(archive, 'rb') as fp:
+        report, = layers.analyze_archive(fp)
+
+    assert report['image'] == 'org/app:latest'
+    assert [layer['instruction'] for layer in report['layers']] == [
+        'ADD file:123 in /', 'RUN cp /bin/big /opt/big', 'RUN rm -rf /tmp/build/*']
+    assert [layer['files'] for layer in report['layers']] == [4, 2, 1]
+    assert [layer['wasted'] for layer in report['layers']] == [510, 0, 0]
+    assert report['largest'][:2] == [
+        {'path': '/bin/big', 'size': 4096, 'layer': 0},
+        {'path': '/opt/big', 'size': 4096, 'layer': 1},
+    ]
+    assert [(item['path'], item['by'], item['removed']) for item in report['overwritten']] == [
+        ('/tmp/build/a', 1, True), ('/tmp/build/b', 2, True), ('/etc/conf', 1, False)]
+    assert report['duplicates'] == [
+        {'size': 4096, 'wasted': 4096, 'paths': ['/bin/big', '/opt/big'], 'layers': [0, 1]}]
+    assert report['wasted'] == 510 + 4096
+
+
+def test_read_archive_links(archive):
+    with open(archive, 'rb') as fp:
+        entries, sizes, _ = layers.read_archive(fp)
+    assert entries['link/layer.tar'] is entries[next(name for name in entries if '0' in name)]
+    assert set(sizes) == set(entries)
+
+
+def test_analyze_invalid_archive(tmpdir):
+    path = tmpdir.join('invalid.tar')
+    with tarfile.open(str(path), 'w') as archive:
+        _add(archive, 'foo.txt', b'bar')
+    with pytest.raises(ValueError):
+        with open(str(path), 'rb') as fp:
+            layers.analyze_archive(fp)
+
+
+@pytest.mark.parametrize('format_', ['text', 'json'])
+def test_image_analyze(archive, tmpdir, capsys, format_):
+    # Emulate `docker save` by streaming the fixture
+    docker = tmpdir.join('docker')
+    docker.write('#!/bin/sh\n[ "$1" = save ] && exec cat %s\nexit 1\n' % archive)
+    docker.chmod(0o755)
+    configuration = {'workspace': str(tmpdir), 'docker': str(docker)}
+    cli.entry_point(['image', 'analyze', 'org/app', '--format', format_], configuration)
+    out = capsys.readouterr().out
+    if format_ == 'json':
+        report, = json.loads(out)
+        assert report['wasted'] == 4606
+    else:
+        assert 'wasted' in out and '/tmp/build/a (removed)' in out and '/bin/big, /opt/big' in out
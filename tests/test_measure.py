@@ -0,0 +1,104 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import logging
+import time
+import pytest
+from docker_interface.plugins import measure
+
+
+@pytest.fixture
+def cgroup_v2(tmpdir):
+    tmpdir.ensure_dir('proc', '42').join('cgroup').write('0::/system.slice/docker-abc.scope\n')
+    root = tmpdir.ensure_dir('cgroup', 'system.slice', 'docker-abc.scope')
+    root.join('memory.current').write('1048576\n')
+    root.join('memory.peak').write('2097152\n')
+    root.join('cpu.stat').write('usage_usec 2000000\nuser_usec 1500000\nsystem_usec 500000\n'
+                                'nr_periods 10\nnr_throttled 2\nthrottled_usec 30000\n')
+    root.join('io.stat').write('8:0 rbytes=4096 wbytes=8192 rios=1 wios=2\n'
+                               '8:16 rbytes=4096 wbytes=0 rios=1 wios=0\n')
+    root.join('pids.current').write('3\n')
+    return tmpdir
+
+
+def test_get_cgroup_paths_v2(cgroup_v2):
+    paths = measure.get_cgroup_paths(42, str(cgroup_v2.join('proc')), str(cgroup_v2.join('cgroup')))
+    assert paths == {'unified': str(cgroup_v2.join('cgroup', 'system.slice', 'docker-abc.scope'))}
+    assert measure.read_sample(paths) == [1048576, 2097152, 2000000, 30000, 2, 10, 8192, 8192, 3]
+
+
+def test_cgroup_v1(tmpdir):
+    tmpdir.ensure_dir('proc', '42').join('cgroup').write(
+        '4:memory:/docker/abc\n3:cpu,cpuacct:/docker/abc\n2:pids:/docker/abc\n0::/\n')
+    memory = tmpdir.ensure_dir('cgroup', 'memory', 'docker', 'abc')
+    memory.join('memory.usage_in_bytes').write('100\n')
+    memory.join('memory.max_usage_in_bytes').write('200\n')
+    cpu = tmpdir.ensure_dir('cgroup', 'cpu,cpuacct', 'docker', 'abc')
+    cpu.join('cpuacct.usage').write('5000000\n')
+    cpu.join('cpu.stat').write('nr_periods 5\nnr_throttled 1\nthrottled_time 7000\n')
+    paths = measure.get_cgroup_paths(42, str(tmpdir.join('proc')), str(tmpdir.join('cgroup')))
+    assert set(paths) == {'memory', 'cpu', 'cpuacct', 'pids'}
+    assert measure.read_sample(paths) == [100, 200, 5000, 7, 1, 5, 0, 0, 0]
+
+
+def _series(cores, peak):
+    return [dict(zip(measure.COLUMNS, [t, peak // 2, peak, t * cores * 1e6, 0, 0, 0, 0, 0, 2]))
+            for t in range(5)]
+
+
+def test_summarize_and_recommend():
+    summary = measure.summarize(_series(1.5, 300 * 2 ** 20))
+    assert summary['cpu_mean'] == pytest.approx(1.5) and summary['cpu_p95'] == pytest.approx(1.5)
+    assert summary['memory_peak'] == 300 * 2 ** 20 and summary['pids_peak'] == 2
+    assert summary['throttled'] == 0
+    settings = measure.recommend([summary, measure.summarize(_series(0.2, 100 * 2 ** 20))])
+    assert settings == {'memory': '384m', 'cpus': 1.5, 'cpu-shares': 1536}
+
+
+def test_summarize_throttling():
+    # Throttling in every period of 100ms by 300ms on 4 cores exceeds the wall time
+    samples = [dict(zip(measure.COLUMNS, [t, 0, 0, 0, t * 3e6, t * 10, t * 10, 0, 0, 1]))
+               for t in range(3)]
+    summary = measure.summarize(samples)
+    assert summary['throttled'] == 1
+    assert summary['throttled_time'] == 6
+
+
+def test_measure_plugin(cgroup_v2, monkeypatch, caplog):
+    docker = cgroup_v2.join('docker')
+    docker.write('#!/bin/sh\necho 42\n')
+    docker.chmod(0o755)
+    monkeypatch.setattr(measure.Sampler, 'PROC_ROOT', str(cgroup_v2.join('proc')))
+    monkeypatch.setattr(measure.Sampler, 'CGROUP_ROOT', str(cgroup_v2.join('cgroup')))
+    configuration = {
+        'workspace': str(cgroup_v2),
+        'docker': str(docker),
+        'dry-run': False,
+        'run': {'measure': {'enabled': True, 'interval': 0.01}},
+    }
+    plugin = measure.MeasurePlugin()
+    plugin.apply(configuration, None, argparse.Namespace(measure=None))
+    assert configuration['run']['name'].startswith('di-')
+    deadline = time.time() + 10
+    while len(plugin.sampler.samples) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    # The sampler stops once the cgroup has been removed
+    cgroup_v2.join('cgroup').remove()
+    plugin.sampler.join()
+    with caplog.at_level(logging.INFO):
+        plugin.cleanup()
+    series, = cgroup_v2.join('.di', 'measurements').listdir()[0].listdir()
+    assert len(measure.read_series(str(series))) >= 3
+    assert 'recommended settings based on 1 measured run(s)' in caplog.text
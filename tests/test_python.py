@@ -0,0 +1,140 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pytest
+from docker_interface import Session
+from docker_interface.plugins import python
+
+
+@pytest.fixture
+def project(tmpdir):
+    tmpdir.join('requirements.txt').write('-r requirements/base.txt\ncython\n')
+    tmpdir.ensure_dir('requirements').join('base.txt').write('-c constraints.txt\nnumpy\n')
+    tmpdir.join('requirements', 'constraints.txt').write('numpy<2\n')
+    tmpdir.join('setup.py').write('from setuptools import setup\n')
+    tmpdir.ensure_dir('pkg').join('__init__.py').write('')
+    tmpdir.join('pkg', 'fast.pyx').write('')
+    tmpdir.join('pkg', 'fast.pxd').write('')
+    tmpdir.ensure_dir('scratch').join('old.pyx').write('')
+    tmpdir.join('.dockerignore').write('scratch\n')
+    docker = tmpdir.join('docker')
+    docker.write('#!/bin/sh\necho "$@" >> %s\n' % tmpdir.join('docker.log'))
+    docker.chmod(0o755)
+    return tmpdir
+
+
+def test_find_requirements(project):
+    assert python.find_requirements(str(project), ['requirements.txt']) == [
+        'requirements.txt', 'requirements/base.txt', 'requirements/constraints.txt']
+
+
+@pytest.mark.parametrize('cache_mount', [False, True])
+def test_build_python(project, cache_mount):
+    configuration = {
+        'workspace': str(project),
+        'docker': str(project.join('docker')),
+        'plugins': ['buildconfiguration', 'pythonbuild', 'build', 'substitution', 'validation'],
+        'build': {'python': {'cache-mount': cache_mount}},
+    }
+    Session().apply('build', configuration)
+    dockerfile = project.join('Dockerfile.di').read()
+    assert '--file=%s' % project.join('Dockerfile.di') in project.join('docker.log').read()
+
+    lines = dockerfile.splitlines()
+    # Dependencies come before extensions which come before the source
+    assert lines.index('COPY requirements.txt ./') < lines.index('COPY setup.py ./') < \
+        lines.index('COPY . .')
+    assert 'COPY requirements/base.txt requirements/constraints.txt requirements/' in lines
+    assert 'COPY pkg/fast.pxd pkg/fast.pyx pkg/' in lines
+    assert 'scratch' not in dockerfile
+    assert ('--mount=type=cache,target=/root/.cache/pip' in dockerfile) == cache_mount
+    assert lines[-1] == 'COPY --from=extensions /tmp/extensions/ ./'
+
+    # The Dockerfile is not rewritten if it has not changed
+    mtime = os.stat(str(project.join('Dockerfile.di'))).st_mtime_ns
+    Session().apply('build', configuration)
+    assert os.stat(str(project.join('Dockerfile.di'))).st_mtime_ns == mtime
+
+
+def test_build_python_in_subdirectory(tmpdir, project, monkeypatch):
+    context = project.ensure_dir('service')
+    for filename in ['requirements.txt', 'setup.py']:
+        project.join(filename).move(context.join(filename))
+    project.join('requirements').move(context.join('requirements'))
+    project.join('pkg').move(context.join('pkg'))
+    monkeypatch.chdir(tmpdir.ensure_dir('elsewhere'))
+    configuration = {
+        'workspace': str(project),
+        'docker': str(project.join('docker')),
+        'plugins': ['buildconfiguration', 'pythonbuild', 'build', 'substitution', 'validation'],
+        'build': {'path': 'service', 'python': {'cache-mount': False}},
+    }
+    Session().apply('build', configuration)
+    dockerfile = context.join('Dockerfile.di').read()
+    assert '--file=%s' % context.join('Dockerfile.di') in project.join('docker.log').read()
+    assert 'COPY requirements/base.txt requirements/constraints.txt requirements/' in dockerfile
+    assert 'COPY pkg/fast.pxd pkg/fast.pyx pkg/' in dockerfile
+    assert not tmpdir.join('elsewhere', 'Dockerfile.di').check()
+
+
+def test_build_python_without_extensions(project):
+    project.join('setup.py').remove()
+    options = {'base-image': 'python:3', 'workdir': '/app', 'requirements': []}
+    dockerfile = python.generate_dockerfile(options, [], [], False)
+    assert dockerfile.splitlines()[-2:] == ['FROM dependencies', 'COPY . .']
+    assert 'extensions' not in dockerfile and 'pip' not in dockerfile.replace('PIP_', '')
+
+
+@pytest.mark.parametrize('builder, env, version, expected', [
+    ('classic', None, '24.0.0', False),
+    ('buildx', None, '20.10.0', True),
+    ('default', '0', '24.0.0', False),
+    ('default', '1', '20.10.0', True),
+    ('default', None, '24.0.0', True),
+    ('default', None, '20.10.0', False),
+])
+def test_supports_buildkit(tmpdir, monkeypatch, builder, env, version, expected):
+    docker = tmpdir.join('docker')
+    docker.write('#!/bin/sh\necho %s\n' % version)
+    docker.chmod(0o755)
+    if env is None:
+        monkeypatch.delenv('DOCKER_BUILDKIT', raising=False)
+    else:
+        monkeypatch.setenv('DOCKER_BUILDKIT', env)
+    configuration = {'docker': str(docker), 'build': {'builder': builder}}
+    assert python.supports_buildkit(configuration) == expected
+
+
+def test_supports_buildkit_dry_run(monkeypatch):
+    # The docker daemon is not queried in a dry run
+    monkeypatch.delenv('DOCKER_BUILDKIT', raising=False)
+    configuration = {'docker': 'false', 'dry-run': True, 'build': {}}
+    assert python.supports_buildkit(configuration)
+    configuration['build']['builder'] = 'classic'
+    assert not python.supports_buildkit(configuration)
+
+
+def test_build_copy_instructions_quoted():
+    instructions = python.build_copy_instructions(['setup.py', 'my reqs/base.txt', 'it\'s.txt'])
+    assert instructions == [
+        'COPY ["setup.py", "it\'s.txt", "./"]',
+        'COPY ["my reqs/base.txt", "my reqs/"]',
+    ]
+
+
+def test_build_python_without_options(project):
+    configuration = {'workspace': str(project), 'build': {'path': '.'}}
+    assert python.PythonBuildPlugin().apply(configuration, {}, None) is configuration
+    assert not project.join('Dockerfile.di').check()
@@ -0,0 +1,265 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import copy
+import os
+import re
+import subprocess
+import sys
+import time
+import pytest
+from docker_interface import Session, history
+from docker_interface.aio import AsyncRun
+from docker_interface.session import get_parser_spec
+
+
+@pytest.fixture(scope='module')
+def session():
+    return Session()
+
+
+@pytest.fixture
+def fake_docker(tmpdir):
+    # Report a container id if docker is asked to write one and record all commands
+    path = tmpdir.join('docker')
+    path.write('#!/bin/sh\n'
+               'echo "$@" >> %s\n'
+               'for arg; do case $arg in --cidfile=*) echo c0ffee > ${arg#*=};; esac; done\n'
+               'case "$1 $2" in "image inspect") echo sha256:feed;; esac\n'
+               'case "$*" in *fail*) exit 7;; esac\n' % tmpdir.join('docker.log'))
+    path.chmod(0o755)
+    return str(path)
+
+
+@pytest.fixture
+def configuration(tmpdir, fake_docker):
+    return {
+        'workspace': str(tmpdir),
+        'docker': fake_docker,
+        'plugins': ['runconfiguration', 'run', 'substitution', 'validation'],
+        'run': {'image': 'ubuntu', 'tty': False, 'interactive': False},
+    }
+
+
+def test_prepare(session, configuration):
+    expected = copy.deepcopy(configuration)
+    with session.prepare(configuration, {'/run/cmd': ['echo', 'hello']}) as preparation:
+        assert preparation.argv[-3:] == ['ubuntu', 'echo', 'hello']
+        assert preparation.configuration['run']['cmd'] == ['echo', 'hello']
+        assert set(preparation.timings) == {'RunConfigurationPlugin', 'RunPlugin',
+                                            'SubstitutionPlugin', 'ValidationPlugin'}
+    assert configuration == expected
+
+
+def test_prepare_args(session, configuration):
+    with session.prepare(configuration, args=['bash', '-c', 'ls']) as preparation:
+        assert preparation.argv[-3:] == ['bash', '-c', 'ls']
+
+
+@pytest.mark.parametrize('cmd, status, container_id', [
+    (['true'], 0, 'c0ffee'),
+    (['fail'], 7, 'c0ffee'),
+])
+def test_run(session, configuration, tmpdir, cmd, status, container_id):
+    result = session.run(configuration, {'/run/cmd': cmd})
+    assert result.status == status
+    assert result.container_id == container_id
+    assert result.timings['container'] is not None and result.timings['setup'] >= 0
+    assert '--cidfile=' not in ' '.join(result.argv)
+    assert '--cidfile=' in tmpdir.join('docker.log').read()
+
+
+def test_apply(session, configuration):
+    result = session.apply('run', configuration, ['echo', 'hello'])
+    assert result.status == 0
+    assert result.argv[-3:] == ['ubuntu', 'echo', 'hello']
+
+
+@pytest.mark.parametrize('method', ['run', 'apply'])
+def test_record_image_id(session, configuration, tmpdir, method):
+    if method == 'run':
+        session.run(configuration)
+    else:
+        session.apply('run', configuration)
+    # The image is inspected before the container starts
+    commands = [line.split()[0] for line in tmpdir.join('docker.log').readlines()]
+    assert commands == ['image', 'run']
+    row, = history.query(configuration['workspace'])
+    assert row['image'] == 'ubuntu' and row['image_id'] == 'sha256:feed'
+
+
+def test_run_dry_run(session, configuration, tmpdir):
+    configuration['dry-run'] = True
+    result = session.run(configuration)
+    assert result.status == 0 and result.container_id is None
+    assert not tmpdir.join('docker.log').check()
+
+
+@pytest.mark.parametrize('plugins', [['unknown'], {'enable': ['unknown']}, 'user'])
+def test_invalid_plugins(session, configuration, plugins):
+    configuration['plugins'] = plugins
+    with pytest.raises(ValueError):
+        session.prepare(configuration)
+
+
+def run_until_complete(coroutine):
+    # Equivalent to `asyncio.run` which requires python 3.7
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+@pytest.fixture
+def async_docker(tmpdir):
+    # Emulate containers by processes that can be killed using the reported container id
+    path = tmpdir.join('docker')
+    path.write('#!/bin/sh\n'
+               'if [ "$1" = kill ]; then kill $(cat {0}/$2.pid); exit 0; fi\n'
+               'cid=c$$\n'
+               'for arg; do case $arg in --cidfile=*) echo $cid > ${{arg#*=}};; esac; done\n'
+               'echo $$ > {0}/$cid.pid\n'
+               'for last; do :; done\n'
+               'case "$*" in *sleep*) exec sleep $last;; esac\n'
+               'echo out; echo err >&2\n'.format(tmpdir))
+    path.chmod(0o755)
+    return str(path)
+
+
+@pytest.mark.parametrize('max_queued_lines', [1, 1000])
+def test_run_async_stream(session, configuration, async_docker, monkeypatch, max_queued_lines):
+    # Captured output is passed on while the container runs even if the buffer is small
+    monkeypatch.setattr(AsyncRun, 'MAX_QUEUED_LINES', max_queued_lines)
+    configuration['docker'] = async_docker
+
+    async def _run():
+        execution = await session.start_async(configuration, capture=True)
+        lines = [item async for item in execution]
+        return lines, await execution.wait()
+
+    lines, result = run_until_complete(_run())
+    assert sorted(lines) == [('stderr', 'err\n'), ('stdout', 'out\n')]
+    assert result.status == 0 and result.container_id.startswith('c')
+
+
+def test_run_async_concurrency(configuration, async_docker):
+    configuration['docker'] = async_docker
+    session = Session(max_concurrency=2)
+
+    async def _run():
+        overrides = {'/run/cmd': ['sleep', '0.3']}
+        return await asyncio.gather(*[session.run_async(configuration, overrides)
+                                      for _ in range(4)])
+
+    tic = time.time()
+    results = run_until_complete(_run())
+    assert time.time() - tic > 0.6
+    assert [result.status for result in results] == [0] * 4
+    assert len({result.container_id for result in results}) == 4
+
+
+def test_run_async_cancel(session, configuration, async_docker):
+    configuration['docker'] = async_docker
+
+    async def _run():
+        overrides = {'/run/cmd': ['sleep', '30']}
+        task = asyncio.ensure_future(session.run_async(configuration, overrides))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    tic = time.time()
+    run_until_complete(_run())
+    assert time.time() - tic < 10
+
+
+def test_run_async_loops(configuration, async_docker):
+    # The concurrency limit applies to each event loop separately
+    session = Session(max_concurrency=1)
+    configuration['docker'] = async_docker
+
+    async def _run():
+        return await asyncio.gather(*[session.run_async(configuration) for _ in range(2)])
+
+    for _ in range(2):
+        assert [result.status for result in run_until_complete(_run())] == [0, 0]
+    # Semaphores of closed loops are discarded (the last loop may already have been collected)
+    run_until_complete(_run())
+    assert len(session._semaphores) <= 1
+
+
+def test_parser_spec_cache(session, monkeypatch, tmpdir):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir))
+    plugins = session.get_plugins('history', {})
+    spec = get_parser_spec('history', plugins)
+    filename, = tmpdir.join('docker-interface', 'parsers').listdir()
+    assert filename.ext == '.json'
+    cached = get_parser_spec('history', plugins)
+    calls = [(list(positional), kwargs) for calls, _ in cached for positional, kwargs in calls]
+    assert calls == [(list(positional), kwargs) for calls, _ in spec
+                     for positional, kwargs in calls]
+    assert ('--limit',) in [tuple(positional) for positional, _ in calls]
+    assert any(kwargs.get('type') is int for _, kwargs in calls)
+
+
+def test_handoff(tmpdir):
+    # Log the process id of each docker invocation and emulate copying files from a container
+    log = tmpdir.join('docker.log')
+    docker = tmpdir.join('docker')
+    docker.write('#!/bin/sh\n'
+                 'echo "$$ $@" >> %s\n'
+                 'case "$1" in create) echo c0ffee;; cp) echo "root:x:0:0" > "$3";; esac\n' % log)
+    docker.chmod(0o755)
+    tmpdir.join('di.yml').write('run:\n  image: ubuntu\nplugins: [user, runconfiguration, run, '
+                                'substitution, validation]\n')
+    env = dict(os.environ, PATH='%s:%s' % (tmpdir, os.environ['PATH']))
+    process = subprocess.Popen([
+        sys.executable, '-c', 'from docker_interface.cli import entry_point; entry_point()',
+        '-f', str(tmpdir.join('di.yml')), 'run', '--exec', 'true',
+    ], env=env, stdin=subprocess.DEVNULL)
+    assert process.wait() == 0
+
+    # The main command replaced the docker interface process
+    pid, run = log.read().splitlines()[-1].split(' ', 1)
+    assert int(pid) == process.pid and run.startswith('run ')
+    # The supervisor removes the temporary passwd file once the container has exited
+    passwd = re.search(r'source=(\S+)/passwd', run).group(1)
+    deadline = time.time() + 10
+    while os.path.exists(passwd) and time.time() < deadline:
+        time.sleep(0.1)
+    assert not os.path.exists(passwd)
+
+
+def test_run_spills_arguments(session, configuration, tmpdir):
+    # Record the contents of env files because the files are removed after the run
+    docker = tmpdir.join('docker')
+    docker.write('#!/bin/sh\n'
+                 'for arg; do case $arg in --env-file=*) echo ${arg#*=} >> {0}/files; '
+                 'cat ${arg#*=} >> {0}/env;; esac; done\n'.replace('{0}', str(tmpdir)))
+    docker.chmod(0o755)
+    configuration['docker'] = str(docker)
+    # Exceed `ARG_MAX` in total and `MAX_ARG_STRLEN` for a single variable
+    env = {'VAR%d' % i: '%d' % i * 2000 for i in range(1000)}
+    env['LARGE'] = 'x' * 2 ** 18
+    configuration['run']['env'] = env
+    result = session.run(configuration)
+    assert result.status == 0
+    lines = tmpdir.join('env').read().splitlines()
+    assert dict(line.split('=', 1) for line in lines) == dict(env, DOCKER_INTERFACE='true')
+    assert not os.path.exists(tmpdir.join('files').read().strip())
@@ -0,0 +1,65 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import logging
+import pytest
+from docker_interface import util
+from docker_interface.plugins import SharedMemoryPlugin
+
+
+@pytest.fixture(autouse=True)
+def host_memory(monkeypatch):
+    monkeypatch.setattr(util, 'get_host_memory', lambda: 8 * 2 ** 30)
+
+
+def apply(run):
+    plugin = SharedMemoryPlugin()
+    args = argparse.Namespace(shm_fraction=None)
+    return plugin.apply({'run': dict(run)}, None, args)['run']
+
+
+@pytest.mark.parametrize('run, expected', [
+    ({'shm-fraction': 0.5}, '4g'),
+    ({'shm-fraction': 0.25, 'memory': '2g'}, '512m'),
+    ({'shm-fraction': 0.5, 'shm-size': '1g'}, '1g'),
+    ({'shm-fraction': 0.0001}, '64m'),
+    ({'shm-fraction': 0}, None),
+    ({}, None),
+    ({'shm-fraction': 0.5, 'ipc': 'host'}, None),
+])
+def test_shm_size(run, expected):
+    assert apply(run).get('shm-size') == expected
+
+
+def test_workload_warning(caplog):
+    with caplog.at_level(logging.WARNING):
+        apply({'shm-fraction': 0.5, 'memory': '1g', 'cmd': ['torchrun', 'train.py']})
+    assert 'torchrun' in caplog.text
+    caplog.clear()
+    with caplog.at_level(logging.WARNING):
+        apply({'shm-fraction': 0.5, 'cmd': ['torchrun', 'train.py']})
+    assert not caplog.text
+
+
+def test_invalid_shm_size(caplog):
+    with caplog.at_level(logging.WARNING):
+        run = apply({'shm-size': 'lots', 'cmd': ['torchrun', 'train.py']})
+    assert run['shm-size'] == 'lots'
+    assert 'could not parse shared memory size' in caplog.text
+
+
+def test_default_fraction():
+    properties = SharedMemoryPlugin.SCHEMA['properties']['run']['properties']
+    assert apply({'shm-fraction': properties['shm-fraction']['default']})['shm-size'] == '4g'
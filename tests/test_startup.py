@@ -0,0 +1,69 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+import time
+import pytest
+
+
+HEAVY_MODULES = ['jsonschema', 'yaml', 'pkg_resources', 'sqlite3', 'pwd', 'grp']
+SCRIPT = """
+import json, sys
+from docker_interface.cli import entry_point
+try:
+    entry_point()
+finally:
+    print(json.dumps(sorted(name for name in %r if name in sys.modules)))
+""" % HEAVY_MODULES
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_cli(tmpdir, *args):
+    # Import the package from the repository even if it is not installed
+    path = os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')]))
+    env = dict(os.environ, XDG_CACHE_HOME=str(tmpdir.join('cache')), PYTHONPATH=path)
+    tic = time.time()
+    process = subprocess.run([sys.executable, '-c', SCRIPT] + list(args), env=env,
+                             cwd=str(tmpdir), stdout=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.time() - tic
+    assert process.returncode == 0
+    return json.loads(process.stdout.strip().splitlines()[-1]), elapsed
+
+
+@pytest.fixture
+def workspace(tmpdir):
+    tmpdir.join('di.yml').write('run:\n  image: ubuntu\nbuild:\n  tag: ubuntu\n')
+    return tmpdir
+
+
+@pytest.mark.parametrize('args, budget, forbidden', [
+    (['--help'], 1, HEAVY_MODULES),
+    (['--dry-run', 'true', 'run'], 2, ['pkg_resources', 'sqlite3', 'yaml']),
+])
+def test_startup_budget(workspace, args, budget, forbidden):
+    # Run twice so the second invocation uses the cached parser specification and configuration
+    run_cli(workspace, *args)
+    modules, elapsed = run_cli(workspace, *args)
+    assert not set(modules) & set(forbidden)
+    assert elapsed < budget, "`di %s` took %.3fs; budget is %ds" % (" ".join(args), elapsed, budget)
+
+
+def test_parser_spec_cache(workspace):
+    run_cli(workspace, '--dry-run', 'true', 'run')
+    assert workspace.join('cache', 'docker-interface', 'parsers').listdir()
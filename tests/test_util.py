@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import pytest
 from docker_interface import util
 
@@ -91,3 +92,69 @@ def test_get_free_port_random():
 
 def test_get_free_port_bounded():
     assert 8888 <= util.get_free_port((8888, 9999)) <= 9999
+
+
+@pytest.mark.parametrize('value, base, expected', [
+    ('512m', 1024, 512 * 2 ** 20),
+    ('2G', 1024, 2 * 2 ** 30),
+    ('1.5GB', 1000, 1500000000),
+    ('16314480 kB', 1024, 16314480 * 1024),
+    ('100', 1024, 100),
+    (100, 1024, 100),
+])
+def test_parse_size(value, base, expected):
+    assert util.parse_size(value, base) == expected
+
+
+def test_parse_size_invalid():
+    with pytest.raises(ValueError):
+        util.parse_size('lots')
+
+
+@pytest.mark.parametrize('size, expected', [
+    (2 ** 31, '2g'),
+    (1536 * 2 ** 20, '1536m'),
+    (1000, '1000'),
+    (0, '0'),
+])
+def test_format_size(size, expected):
+    assert util.format_size(size) == expected
+
+
+def test_locked_json(tmpdir):
+    path = tmpdir.join('state', 'state.json')
+    with util.locked_json(str(path), {'count': 0}) as value:
+        value['count'] += 1
+    with util.locked_json(str(path), {'count': 0}) as value:
+        value['count'] += 1
+    assert value == {'count': 2}
+    assert path.stat().mode & 0o777 == 0o600
+
+    # Symbolic links are not followed
+    link = tmpdir.join('link.json')
+    link.mksymlinkto(path)
+    with pytest.raises(OSError):
+        with util.locked_json(str(link), {}):
+            pass  # pragma: no cover
+
+
+def test_get_shared_dir(shared_dir, tmpdir, monkeypatch):
+    assert util.get_shared_dir() == shared_dir
+    assert os.stat(shared_dir).st_mode & 0o7777 == 0o1777
+    # Symbolic links are refused
+    link = tmpdir.join('link')
+    link.mksymlinkto(shared_dir)
+    monkeypatch.setattr(util, 'SHARED_DIR', str(link))
+    with pytest.raises(OSError):
+        util.get_shared_dir()
+
+
+def test_is_ignored(tmpdir):
+    tmpdir.join('.dockerignore').write('# comment\n/build\n*.pyc\n!keep.pyc\n')
+    patterns = util.read_dockerignore(str(tmpdir))
+    assert patterns == ['build', '*.pyc', '!keep.pyc']
+    assert util.is_ignored('build/lib/module.py', patterns)
+    assert util.is_ignored('module.pyc', patterns)
+    assert not util.is_ignored('keep.pyc', patterns)
+    assert not util.is_ignored('module.py', patterns)
+    assert util.read_dockerignore(str(tmpdir.join('missing'))) == []
@@ -0,0 +1,122 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+import pytest
+from docker_interface import watch
+
+
+@pytest.fixture
+def workspace(tmpdir):
+    tmpdir.join('.dockerignore').write('data\n*.log\n')
+    tmpdir.join('main.py').write('')
+    tmpdir.ensure('data', 'big.bin')
+    tmpdir.ensure('.di', 'history.sqlite')
+    return tmpdir
+
+
+def test_path_filter(workspace):
+    path_filter = watch.PathFilter(str(workspace), exclude=['*.tmp'])
+    assert path_filter('main.py') and path_filter('pkg/module.py')
+    assert not any(map(path_filter, ['data/big.bin', 'run.log', '.di/history.sqlite', 'x.tmp']))
+    assert path_filter.is_pruned('data') and path_filter.is_pruned('.git')
+    assert not watch.PathFilter(str(workspace), include=['*.py'])('README.md')
+
+
+@pytest.fixture(params=['inotify', 'polling'])
+def watcher(workspace, request):
+    path_filter = watch.PathFilter(str(workspace))
+    if request.param == 'inotify':
+        try:
+            watcher = watch.InotifyWatcher(str(workspace), path_filter)
+        except (OSError, AttributeError):  # pragma: no cover
+            pytest.skip('inotify is not available')
+    else:
+        watcher = watch.PollingWatcher(str(workspace), path_filter, interval=0.05)
+    yield watcher
+    watcher.close()
+
+
+def test_watcher(workspace, watcher):
+    assert watcher.poll(0.1) == set()
+    workspace.join('data', 'other.bin').write('ignored')
+    workspace.join('run.log').write('ignored')
+    assert watcher.poll(0.2) == set()
+    workspace.join('main.py').write('print("hello")')
+    assert watcher.poll(1) == {'main.py'}
+    workspace.ensure('pkg', 'module.py')
+    assert watcher.poll(1) >= {'pkg/module.py'}
+
+
+def test_wait_for_changes_debounce(workspace, watcher):
+    def _edit():
+        for i in range(3):
+            workspace.join('file%d.py' % i).write('')
+            time.sleep(0.05)
+
+    thread = threading.Thread(target=_edit)
+    thread.start()
+    changes, detected = watch.wait_for_changes(watcher, 0.3, 2)
+    thread.join()
+    assert changes == {'file0.py', 'file1.py', 'file2.py'} and detected is not None
+    assert watch.wait_for_changes(watcher, 0.1, 0.1) == (set(), None)
+
+
+def test_watch(workspace, monkeypatch):
+    log = workspace.join('docker.log')
+    docker = workspace.join('docker')
+    docker.write('#!/bin/sh\necho "$@" >> %s\ncase "$1" in create) echo c$$;; esac\n' % log)
+    docker.chmod(0o755)
+    workspace.join('Dockerfile').write('FROM ubuntu\n')
+    configuration = {
+        'workspace': str(workspace),
+        'build': {'path': '.', 'file': 'Dockerfile'},
+        'run': {'rm': True, 'interactive': True,
+                'watch': {'enabled': True, 'debounce': 0.1, 'poll-interval': 0.05}},
+    }
+    builds = []
+    monkeypatch.setattr(watch, 'build_image', lambda configuration: builds.append(1) or 0)
+    argv = [str(docker), 'run', '--rm', '--interactive', '--tty=False', 'ubuntu', 'true']
+    stop = threading.Event()
+    thread = threading.Thread(target=watch.watch, args=(configuration, argv, stop))
+    thread.start()
+
+    def _wait_for(command, count):
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            if log.check() and sum(line.startswith(command) for line in
+                                   log.read().splitlines()) >= count:
+                return
+            time.sleep(0.05)
+        raise AssertionError("docker %s was not called %d times" % (command, count))
+
+    try:
+        _wait_for('start', 1)
+        workspace.join('main.py').write('changed')
+        _wait_for('start', 2)
+        assert not builds
+        workspace.join('Dockerfile').write('FROM python\n')
+        _wait_for('start', 3)
+        assert builds == [1]
+    finally:
+        stop.set()
+        thread.join()
+
+    lines = log.read().splitlines()
+    assert [line.split()[0] for line in lines] == [
+        'create', 'start', 'start', 'rm', 'create', 'start', 'rm']
+    assert lines[0] == 'create --interactive --tty=False ubuntu true'
+    assert lines[1].startswith('start --attach --interactive ')
+    assert lines[-1].endswith(lines[-2].split()[-1])
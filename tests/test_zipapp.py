@@ -0,0 +1,59 @@
+# Copyright 2018 Spotify AB
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+import sys
+import zipfile
+import pytest
+from docker_interface import zipapp
+from docker_interface.plugins.base import iter_entry_points
+
+
+@pytest.fixture(scope='module')
+def archive(tmpdir_factory):
+    path = str(tmpdir_factory.mktemp('zipapp').join('di.pyz'))
+    zipapp.build_archive(path)
+    return path
+
+
+def test_get_builtin_plugins():
+    plugins = zipapp.get_builtin_plugins()
+    assert plugins['run'] == 'docker_interface.plugins:RunPlugin'
+    assert set(plugins) == {entry_point.name for entry_point in
+                            iter_entry_points('docker_interface.plugins')}
+
+
+def test_archive_contents(archive):
+    with zipfile.ZipFile(archive) as fp:
+        names = set(fp.namelist())
+    assert {'__main__.py', 'docker_interface/_frozen.pyc', 'docker_interface/cli.pyc',
+            'docker_interface/cli.py'} <= names
+
+
+def test_archive_frozen(archive):
+    script = "import sys; sys.path.insert(0, %r); from docker_interface.plugins.base import " \
+        "Plugin, load_frozen; frozen = load_frozen(); print(frozen.__file__); " \
+        "print(sorted(Plugin.load_plugins()) == sorted(frozen.PLUGINS))" % archive
+    output = subprocess.check_output([sys.executable, '-c', script], universal_newlines=True)
+    assert output.split() == [os.path.join(archive, 'docker_interface', '_frozen.pyc'), 'True']
+
+
+def test_archive_dry_run(archive, tmpdir):
+    tmpdir.join('di.yml').write('run:\n  image: ubuntu\n')
+    env = dict(os.environ, XDG_CACHE_HOME=str(tmpdir.join('cache')))
+    output = subprocess.check_output(
+        [sys.executable, archive, '--dry-run', 'true', 'run', 'bash'], cwd=str(tmpdir), env=env,
+        stderr=subprocess.STDOUT, universal_newlines=True)
+    assert "dry-run command 'docker run" in output and "ubuntu bash'" in output